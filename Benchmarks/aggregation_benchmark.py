@@ -0,0 +1,122 @@
+"""
+Scaling benchmark of the parallel aggregations (MovieAggregation.ParallelAggregator).
+
+The corpus is enlarged by copying every movie --scale times under new IDs, then the single-threaded methods
+(actor_count, ages, releases and a height histogram per gender) are timed against one parallel pass with an
+increasing number of worker processes. The results of both are checked to be identical.
+
+Run it from the root of the repository (the dataset is read from Downloads/MovieSummaries):
+
+    python Benchmarks/aggregation_benchmark.py --scale 10 --workers 1 2 4 8
+"""
+import argparse
+import os
+import shutil
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))  # Adds the repository to the path
+
+from MovieAggregation import ParallelAggregator
+from MovieAnalysis import MovieAnalysis
+
+HEIGHT_EDGES = np.linspace(1.0, 2.2, 31)
+
+
+def enlarge_corpus(source, target, scale):
+    """Write the corpus of source into target with every movie copied scale times under new IDs."""
+    os.makedirs(target, exist_ok=True)
+    with open(os.path.join(source, 'movie.metadata.tsv'), encoding='utf-8') as file:
+        id_offset = max(int(line.split('\t', 1)[0]) for line in file) + 1
+
+    # The Wikipedia movie ID is the first column of every file, the Freebase movie ID the second one of the
+    # metadata files. The cluster files do not reference movies and are copied as they are.
+    for file_name, freebase_column in [('movie.metadata.tsv', True), ('character.metadata.tsv', True),
+                                       ('plot_summaries.txt', False)]:
+        with open(os.path.join(source, file_name), encoding='utf-8') as file:
+            lines = [line.rstrip('\n').split('\t') for line in file]
+        with open(os.path.join(target, file_name), 'w', encoding='utf-8') as file:
+            for copy in range(scale):
+                for fields in lines:
+                    fields = list(fields)
+                    fields[0] = str(int(fields[0]) + copy * id_offset)
+                    if freebase_column and copy:
+                        fields[1] = f'{fields[1]}_{copy}'
+                    file.write('\t'.join(fields) + '\n')
+    for file_name in ['tvtropes.clusters.txt', 'name.clusters.txt']:
+        shutil.copy(os.path.join(source, file_name), os.path.join(target, file_name))
+
+    # Written last, MovieAnalysis only uses a corpus directory with this marker
+    with open(os.path.join(target, '.complete'), 'w') as file:
+        file.write(f'enlarged x{scale}\n')
+
+
+def run_serial(analysis):
+    """Compute the aggregations with the single-threaded methods."""
+    histograms = {}
+    for gender in analysis.actor_genders + ['All']:
+        heights = analysis.actor_distributions(gender, max_height=HEIGHT_EDGES[-1], min_height=HEIGHT_EDGES[0])
+        histograms[gender] = np.histogram(heights['Actor height'].to_numpy(dtype=float), HEIGHT_EDGES)[0]
+    return {
+        'actor_count': analysis.actor_count(),
+        'height_histograms': histograms,
+        'births_per_year': analysis.ages('Y'),
+        'births_per_month': analysis.ages('M'),
+        'releases': analysis.releases(),
+    }
+
+
+def check_results(serial, parallel):
+    """Raise an AssertionError if the parallel results differ from the single-threaded ones."""
+    for key in ['actor_count', 'births_per_year', 'births_per_month', 'releases']:
+        pd.testing.assert_frame_equal(serial[key], parallel[key])
+    for gender, histogram in serial['height_histograms'].items():
+        np.testing.assert_array_equal(histogram, parallel['height_histograms'].loc[gender].to_numpy())
+
+
+def best_time(function, repeat):
+    """Return the best wall time of repeat calls, and the result of the last one."""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        times.append(time.perf_counter() - start)
+    return min(times), result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--scale', type=int, default=10, help='Number of copies of every movie.')
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4, 8], help='Worker counts to time.')
+    parser.add_argument('--repeat', type=int, default=3, help='Timed runs per configuration (the best is kept).')
+    parser.add_argument('--dir', default='Downloads/benchmark', help='Directory of the enlarged corpus.')
+    args = parser.parse_args()
+
+    # MovieAnalysis reads Downloads/MovieSummaries relative to the working directory
+    source = os.path.abspath('Downloads/MovieSummaries')
+    root = os.path.abspath(os.path.join(args.dir, f'aggregation-x{args.scale}'))
+    if not os.path.exists(os.path.join(root, 'Downloads', 'MovieSummaries', '.complete')):
+        print(f'Writing the corpus x{args.scale} to {root}')
+        enlarge_corpus(source, os.path.join(root, 'Downloads', 'MovieSummaries'), args.scale)
+    os.chdir(root)
+
+    analysis = MovieAnalysis(result_cache_bytes=None)
+    rows = len(analysis.character_data) + len(analysis.movie_data)
+    print(f'{rows} rows, {os.cpu_count()} CPUs')
+
+    serial_s, serial = best_time(lambda: run_serial(analysis), args.repeat)
+    print(f'{"workers":>8} {"time (s)":>10} {"speedup":>8} {"rows/s":>12}')
+    print(f'{"serial":>8} {serial_s:>10.3f} {1:>8.2f} {rows / serial_s:>12.0f}')
+    for workers in args.workers:
+        with ParallelAggregator(analysis, workers=workers) as aggregator:
+            aggregator.run(HEIGHT_EDGES)  # writes the partitions and starts the processes
+            parallel_s, parallel = best_time(lambda: aggregator.run(HEIGHT_EDGES), args.repeat)
+        check_results(serial, parallel)
+        print(f'{workers:>8} {parallel_s:>10.3f} {serial_s / parallel_s:>8.2f} {rows / parallel_s:>12.0f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,73 @@
+"""
+Memory benchmark for the MovieAnalysis query methods.
+
+Every method is called once to warm up and then again under tracemalloc, without the result cache (a cached
+result would be returned without running the query). The peak allocation of each call
+must stay below a fixed fraction of the in-memory size of the dataset, otherwise the script exits with an error.
+
+Run it from the root of the repository (the dataset is read from Downloads/MovieSummaries):
+
+    python Benchmarks/memory_benchmark.py --max-fraction 0.25
+"""
+import argparse
+import os
+import sys
+import tracemalloc
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))  # Adds the repository to the path
+from MovieAnalysis import MovieAnalysis
+
+
+# The calls made by the Streamlit app, with the arguments it uses by default
+CALLS = {
+    'movie_type': lambda analysis: analysis.movie_type(10),
+    'actor_count': lambda analysis: analysis.actor_count(),
+    'actor_distributions': lambda analysis: analysis.actor_distributions('All', max_height=2.2, min_height=1.0),
+    'releases': lambda analysis: analysis.releases(),
+    'releases (Drama)': lambda analysis: analysis.releases('Drama'),
+    'ages (Y)': lambda analysis: analysis.ages('Y'),
+    'ages (M)': lambda analysis: analysis.ages('M'),
+}
+
+
+def dataset_size(analysis):
+    """Return the in-memory size in bytes of the tables the query methods read."""
+    return sum(int(table.memory_usage(deep=True).sum()) for table in [analysis.movie_data, analysis.character_data])
+
+
+def peak_allocation(call, analysis):
+    """Return the peak number of bytes allocated while running the call."""
+    call(analysis)  # warm up, so lazily built indexes are not counted
+    tracemalloc.start()
+    try:
+        call(analysis)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--max-fraction', type=float, default=0.25,
+                        help='Largest allowed peak allocation per call, as a fraction of the dataset size.')
+    args = parser.parse_args()
+
+    analysis = MovieAnalysis(result_cache_bytes=None)
+    size = dataset_size(analysis)
+    print(f'Dataset size: {size / 2 ** 20:.1f} MiB')
+
+    failures = []
+    for name, call in CALLS.items():
+        peak = peak_allocation(call, analysis)
+        fraction = peak / size
+        status = 'OK' if fraction <= args.max_fraction else 'FAIL'
+        print(f'{name:<22} peak {peak / 2 ** 20:8.2f} MiB  ({fraction:6.1%} of the dataset)  {status}')
+        if status == 'FAIL':
+            failures.append(name)
+
+    if failures:
+        sys.exit(f'Peak allocation above {args.max_fraction:.0%} of the dataset for: {", ".join(failures)}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,169 @@
+"""
+Scaling benchmark of the MovieAnalysis query methods on synthetic corpora.
+
+For every scale, a synthetic corpus of that many times the real one is generated once (Testing/synthetic_corpus.py)
+and every method runs in a fresh Python process, which measures:
+- load_s: the time to construct MovieAnalysis and load the tables the method reads
+- first_call_s: the first call, which builds the lazy indexes
+- wall_s: the best of --repeat later calls (with the result cache disabled)
+- rows_per_s: the rows of the tables the method reads, divided by wall_s
+- peak_rss_mib: the peak RSS of the process
+
+The results are saved as JSON. Given a previous results file with --baseline, the script exits with an error if
+a method got slower than --max-slowdown times its baseline time:
+
+    python Benchmarks/scaling_benchmark.py --scales 1 10 --save Downloads/benchmark/scaling.json
+    python Benchmarks/scaling_benchmark.py --scales 1 10 --baseline Downloads/benchmark/scaling.json
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))  # Adds the repository to the path
+
+# The benchmarked calls, with the tables they read
+METHODS = {
+    'movie_type': (lambda analysis: analysis.movie_type(10), ['movie_data']),
+    'actor_count': (lambda analysis: analysis.actor_count(), ['character_data']),
+    'actor_distributions': (lambda analysis: analysis.actor_distributions('All', max_height=2.2, min_height=1.0),
+                            ['character_data']),
+    'releases': (lambda analysis: analysis.releases(), ['movie_data']),
+    'releases (Drama)': (lambda analysis: analysis.releases('Drama'), ['movie_data']),
+    'ages (Y)': (lambda analysis: analysis.ages('Y'), ['character_data']),
+    'ages (M)': (lambda analysis: analysis.ages('M'), ['character_data']),
+    'get_random_movie': (lambda analysis: analysis.get_random_movie(seed=0), ['movie_data', 'movie_summaries']),
+}
+
+
+def corpus_root(directory, scale):
+    """Return the directory to run MovieAnalysis from for a scale, generating the corpus if needed."""
+    from Testing.synthetic_corpus import generate_corpus
+
+    root = os.path.abspath(os.path.join(directory, f'synthetic-x{scale:g}'))
+    corpus = os.path.join(root, 'Downloads', 'MovieSummaries')
+    if not os.path.exists(os.path.join(corpus, '.complete')):
+        print(f'Generating the corpus x{scale:g} in {corpus}')
+        generate_corpus(corpus, scale)
+    return root
+
+
+def run_method(method, repeat):
+    """Run one method in the current process (from the root of a corpus) and return its measurements."""
+    from MovieAnalysis import MovieAnalysis
+    from MovieProfiler import peak_rss
+
+    call, tables = METHODS[method]
+    start = time.perf_counter()
+    analysis = MovieAnalysis(result_cache_bytes=None)
+    rows = sum(len(getattr(analysis, table)) for table in tables)
+    loaded = time.perf_counter()
+    call(analysis)
+    first_call = time.perf_counter() - loaded
+
+    times = []
+    for _ in range(repeat):
+        call_start = time.perf_counter()
+        call(analysis)
+        times.append(time.perf_counter() - call_start)
+
+    return {
+        'rows': rows,
+        'load_s': loaded - start,
+        'first_call_s': first_call,
+        'wall_s': min(times),
+        'rows_per_s': rows / min(times) if min(times) else None,
+        'peak_rss_mib': (peak_rss() or float('nan')) / 2 ** 20,  # NaN where it cannot be measured (Windows)
+    }
+
+
+def compare(results, baseline, max_slowdown, min_time):
+    """
+    Print the time of every method against the baseline and return the regressions, i.e. the methods more than
+    max_slowdown times slower than in the baseline (and slower by at least min_time seconds, to ignore noise).
+    """
+    previous = {(result['scale'], result['method']): result for result in baseline['results']}
+    regressions = []
+    print(f'\n{"scale":>6} {"method":<22} {"baseline (s)":>13} {"now (s)":>10} {"ratio":>7}')
+    for result in results:
+        before = previous.get((result['scale'], result['method']))
+        if before is None:
+            continue
+        ratio = result['wall_s'] / before['wall_s'] if before['wall_s'] else float('inf')
+        regressed = ratio > max_slowdown and result['wall_s'] - before['wall_s'] > min_time
+        print(f'{result["scale"]:>6g} {result["method"]:<22} {before["wall_s"]:>13.4f} {result["wall_s"]:>10.4f} '
+              f'{ratio:>7.2f}{"  SLOWER" if regressed else ""}')
+        if regressed:
+            regressions.append(result)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--scales', type=float, nargs='+', default=[1, 10], help='Sizes relative to the real corpus.')
+    parser.add_argument('--methods', nargs='+', choices=list(METHODS), default=list(METHODS))
+    parser.add_argument('--repeat', type=int, default=5, help='Timed calls per method (the best is kept).')
+    parser.add_argument('--dir', default='Downloads/benchmark', help='Directory of the synthetic corpora.')
+    parser.add_argument('--save', help='Write the results to this JSON file.')
+    parser.add_argument('--baseline', help='JSON results of a previous run to compare with.')
+    parser.add_argument('--max-slowdown', type=float, default=1.5,
+                        help='Fail if a method takes more than this many times its baseline time.')
+    parser.add_argument('--min-time', type=float, default=0.005,
+                        help='Slowdowns of less than this many seconds are never reported as regressions.')
+    parser.add_argument('--child', nargs=2, metavar=('ROOT', 'METHOD'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        root, method = args.child
+        os.chdir(root)
+        print(json.dumps(run_method(method, args.repeat)))
+        return
+
+    repository = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    results = []
+    print(f'{"scale":>6} {"method":<22} {"rows":>11} {"load (s)":>9} {"first (s)":>10} {"wall (s)":>9} '
+          f'{"rows/s":>13} {"RSS (MiB)":>10}')
+    for scale in args.scales:
+        root = corpus_root(args.dir, scale)
+
+        # Build the columnar cache first, so that no method pays for parsing the TSVs
+        subprocess.run([sys.executable, os.path.abspath(__file__), '--child', root, 'get_random_movie'],
+                       check=True, capture_output=True, cwd=repository)
+        subprocess.run([sys.executable, os.path.abspath(__file__), '--child', root, 'actor_count'],
+                       check=True, capture_output=True, cwd=repository)
+
+        for method in args.methods:
+            output = subprocess.run([sys.executable, os.path.abspath(__file__), '--child', root, method,
+                                     '--repeat', str(args.repeat)],
+                                    check=True, capture_output=True, text=True, cwd=repository).stdout
+            result = {'scale': scale, 'method': method, **json.loads(output.strip().splitlines()[-1])}
+            results.append(result)
+            print(f'{scale:>6g} {method:<22} {result["rows"]:>11} {result["load_s"]:>9.3f} '
+                  f'{result["first_call_s"]:>10.4f} {result["wall_s"]:>9.4f} {result["rows_per_s"] or 0:>13.0f} '
+                  f'{result["peak_rss_mib"]:>10.1f}')
+
+    if args.save:
+        os.makedirs(os.path.dirname(os.path.abspath(args.save)), exist_ok=True)
+        with open(args.save, 'w') as file:
+            json.dump({
+                'created': datetime.datetime.now().isoformat(timespec='seconds'),
+                'python': platform.python_version(),
+                'machine': platform.machine(),
+                'cpus': os.cpu_count(),
+                'results': results,
+            }, file, indent=2)
+        print(f'\nResults saved to {args.save}')
+
+    if args.baseline:
+        with open(args.baseline, 'r') as file:
+            regressions = compare(results, json.load(file), args.max_slowdown, args.min_time)
+        if regressions:
+            sys.exit(f'{len(regressions)} method(s) got more than {args.max_slowdown}x slower than the baseline')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,150 @@
+"""
+Startup benchmark for MovieAnalysis: eager versus lazy table loading, and the warm analysis service.
+
+Every scenario runs in a fresh Python process, which measures the time to import the analysis, the time to
+construct it, the time until the queries of the "Main Analysis" page have answered (from the start of the
+process, imports included) and the peak RSS of the process.
+- eager: every table is loaded before the first query, as the constructor used to do
+- lazy: only the tables the queries touch are loaded
+- prefetch: the tables are loaded by the background thread while the queries run
+- service: the queries are sent to a MovieService.py started (and warmed up) once by the benchmark
+- app, app-service: the time to the first render of the "Main Analysis" page of MovieApp.py (with streamlit's
+  AppTest), with a local analysis or with the service. The import time is the one of the modules MovieApp.py
+  imports at the top.
+
+Run it from the root of the repository (the dataset is read from Downloads/MovieSummaries):
+
+    python Benchmarks/startup_benchmark.py --repeat 3
+"""
+import argparse
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+
+REPOSITORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(REPOSITORY)  # Adds the repository to the path
+
+SCENARIOS = ['eager', 'lazy', 'prefetch', 'service', 'app', 'app-service']
+
+
+def run_scenario(scenario, url=None):
+    """Run one scenario in the current process and return its measurements."""
+    if scenario.startswith('app'):
+        return run_app(scenario, url)
+
+    start = time.perf_counter()
+    if scenario == 'service':
+        from MovieService import AnalysisClient
+        imported = time.perf_counter()
+        analysis = AnalysisClient(url)
+    else:
+        from MovieAnalysis import MovieAnalysis
+        imported = time.perf_counter()
+        analysis = MovieAnalysis(prefetch=scenario == 'prefetch')
+        if scenario == 'eager':
+            for name in MovieAnalysis.TABLES:
+                getattr(analysis, name)
+    constructed = time.perf_counter()
+
+    # The queries of the "Main Analysis" page
+    analysis.movie_type(10)
+    analysis.actor_count()
+    analysis.actor_genders
+    analysis.height_histogram('All', max_height=2.2, min_height=1.0)
+    rendered = time.perf_counter()
+
+    from MovieProfiler import peak_rss
+    return {'import_s': imported - start, 'construct_s': constructed - imported, 'first_page_s': rendered - start,
+            'peak_rss_mib': (peak_rss() or float('nan')) / 2 ** 20}  # NaN where it cannot be measured (Windows)
+
+
+def run_app(scenario, url=None):
+    """Render the first page of the app in the current process and return the measurements."""
+    from streamlit.testing.v1 import AppTest
+    if scenario == 'app-service':
+        os.environ['MOVIE_SERVICE_URL'] = url
+
+    # The modules MovieApp.py imports first (streamlit is already imported by AppTest)
+    start = time.perf_counter()
+    import MovieProfiler  # noqa: F401
+    imported = time.perf_counter()
+
+    app = AppTest.from_file(os.path.join(REPOSITORY, 'MovieApp.py'), default_timeout=600)
+    app.run()
+    rendered = time.perf_counter()
+    if app.exception:
+        raise RuntimeError(f'MovieApp.py failed: {app.exception[0].value}')
+
+    from MovieProfiler import peak_rss
+    return {'import_s': imported - start, 'construct_s': float('nan'), 'first_page_s': rendered - start,
+            'peak_rss_mib': (peak_rss() or float('nan')) / 2 ** 20}
+
+
+def start_service():
+    """Start MovieService.py on a free port, wait until it answers and return (process, url)."""
+    from MovieService import AnalysisClient
+    with socket.socket() as probe:
+        probe.bind(('127.0.0.1', 0))
+        port = probe.getsockname()[1]
+    service = subprocess.Popen([sys.executable, os.path.join(REPOSITORY, 'MovieService.py'), '--port', str(port),
+                                '--config', os.path.join(REPOSITORY, 'config.json')],
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    url = f'http://127.0.0.1:{port}'
+    for _ in range(300):
+        if service.poll() is not None:
+            raise RuntimeError(f'MovieService.py exited with code {service.returncode}.')
+        try:
+            AnalysisClient(url).health()
+            return service, url
+        except ConnectionError:
+            time.sleep(0.1)
+    service.kill()
+    raise RuntimeError('MovieService.py did not start.')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=3, help='Number of fresh processes per scenario.')
+    parser.add_argument('--scenarios', nargs='+', choices=SCENARIOS, default=SCENARIOS)
+    parser.add_argument('--child', choices=SCENARIOS, help=argparse.SUPPRESS)
+    parser.add_argument('--url', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(run_scenario(args.child, args.url)))
+        return
+
+    # Build the columnar cache first, so that no scenario pays for parsing the TSVs
+    subprocess.run([sys.executable, __file__, '--child', 'eager'], check=True, capture_output=True)
+
+    # The service is started once and warmed up by a first client, like a service shared by every client
+    service, url = None, None
+    if any(scenario.endswith('service') for scenario in args.scenarios):
+        service, url = start_service()
+        subprocess.run([sys.executable, __file__, '--child', 'service', '--url', url], check=True,
+                       capture_output=True)
+
+    try:
+        print(f'{"scenario":<12} {"import (s)":>11} {"construct (s)":>14} {"first page (s)":>15} '
+              f'{"peak RSS (MiB)":>15}')
+        for scenario in args.scenarios:
+            runs = []
+            command = [sys.executable, __file__, '--child', scenario] + (['--url', url] if url else [])
+            for _ in range(args.repeat):
+                output = subprocess.run(command, check=True, capture_output=True, text=True).stdout
+                runs.append(json.loads(output.strip().splitlines()[-1]))
+            best = {key: min(run[key] for run in runs) for key in runs[0]}
+            construct = '-' if best['construct_s'] != best['construct_s'] else f'{best["construct_s"]:.3f}'
+            print(f'{scenario:<12} {best["import_s"]:>11.3f} {construct:>14} {best["first_page_s"]:>15.3f} '
+                  f'{best["peak_rss_mib"]:>15.1f}')
+    finally:
+        if service is not None:
+            service.terminate()
+            service.wait()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,57 @@
+"""
+Perceived latency of the LLM answers, blocking vs streamed, against the fake Ollama server.
+
+Both ways go through LLMGenreClassifier (without the response cache). A blocking chat shows nothing until the
+whole answer is there, a streamed answer shows its first token after the time to first token (TTFT). The
+server waits --delay seconds before answering (the prompt processing) and --token-delay seconds per word:
+
+    python Benchmarks/streaming_benchmark.py --requests 20 --delay 0.3 --token-delay 0.05
+"""
+import argparse
+import os
+import sys
+
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))  # Adds the repository to the path
+
+from MovieClassifier import LLMGenreClassifier
+from Testing.fake_ollama import start_fake_ollama
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--requests', type=int, default=20, help='Requests per mode.')
+    parser.add_argument('--delay', type=float, default=0.3, help='Seconds before the server answers.')
+    parser.add_argument('--token-delay', type=float, default=0.05, help='Seconds per word of the answer.')
+    parser.add_argument('--host', help='Ollama server to measure instead of the fake one.')
+    parser.add_argument('--model', default='mistral')
+    args = parser.parse_args()
+
+    host = args.host
+    if host is None:
+        server, host = start_fake_ollama(delay=args.delay, token_delay=args.token_delay)
+    classifier = LLMGenreClassifier(args.model, host=host, cache_dir=None)
+    prompts = [[{"role": "user", "content": f"Request {number}: which genres?"}] for number in range(args.requests)]
+
+    blocking = []
+    for messages in prompts:
+        blocking.append(classifier.chat(messages)['latency_s'])
+
+    first_tokens, totals = [], []
+    for messages in prompts:
+        stream = classifier.stream(messages)
+        for _ in stream:
+            pass
+        first_tokens.append(stream.ttft_s)
+        totals.append(stream.latency_s)
+
+    print(f'{args.requests} requests to {host}')
+    print(f'{"mode":<10} {"first output p50 (s)":>21} {"p95 (s)":>8} {"complete p50 (s)":>17} {"p95 (s)":>8}')
+    for mode, first, complete in [('blocking', blocking, blocking), ('streamed', first_tokens, totals)]:
+        print(f'{mode:<10} {np.percentile(first, 50):>21.3f} {np.percentile(first, 95):>8.3f} '
+              f'{np.percentile(complete, 50):>17.3f} {np.percentile(complete, 95):>8.3f}')
+
+
+if __name__ == '__main__':
+    main()
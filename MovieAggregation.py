@@ -0,0 +1,209 @@
+import os
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.feather as feather
+
+
+# Function to read the columns of an Arrow IPC (Feather) file as NumPy arrays, memory-mapped (no unpickling)
+def read_partition(file_path):
+    table = feather.read_table(file_path, memory_map=True)
+    return {name: column.to_numpy() for name, column in zip(table.column_names, table.columns)}
+
+
+# Function to count the distinct values of an array
+# Returns a Series of counts indexed by the (sorted) values
+def value_counts(values):
+    unique, counts = np.unique(values, return_counts=True)
+    return pd.Series(counts, index=unique)
+
+
+# Function to run every aggregation on one partition, in a worker process
+# Only the file paths go to the worker and only small count arrays come back.
+def aggregate_partition(character_file, movie_file, height_edges, gender_count):
+    characters = read_partition(character_file)
+    movies = read_partition(movie_file)
+    results = {}
+
+    # Actor count of every movie of the partition (rows without a movie ID are not counted, like in groupby),
+    # then the number of movies per actor count. A movie is never split across partitions.
+    keyed = characters['movie'] >= 0
+    _, movie_rows = np.unique(characters['movie'][keyed], return_inverse=True)
+    actors_per_movie = np.bincount(movie_rows, weights=characters['has_actor'][keyed]).astype(np.int64)
+    results['actor_count'] = value_counts(actors_per_movie)
+
+    # Height histograms, one row per gender code and a last row for 'All'
+    # Bins are closed on the left, the last one is also closed on the right (like np.histogram)
+    heights = characters['height']
+    known = ~np.isnan(heights)
+    bins = np.searchsorted(height_edges, heights[known], side='right') - 1
+    bins[heights[known] == height_edges[-1]] = len(height_edges) - 2
+    in_range = (bins >= 0) & (bins < len(height_edges) - 1)
+    genders = np.where(characters['gender'][known] >= 0, characters['gender'][known], gender_count)
+    histograms = np.zeros((gender_count + 2, len(height_edges) - 1), dtype=np.int64)
+    np.add.at(histograms, (genders[in_range], bins[in_range]), 1)
+    histograms[gender_count + 1] = histograms[:gender_count + 1].sum(axis=0)
+    results['heights'] = np.delete(histograms, gender_count, axis=0)  # rows of unknown gender only count in 'All'
+
+    # Births with both a year and a month, and releases with a year
+    born = (characters['birth_year'] >= 0) & (characters['birth_month'] >= 0)
+    results['births_per_year'] = value_counts(characters['birth_year'][born])
+    results['births_per_month'] = value_counts(characters['birth_month'][born])
+    results['releases'] = value_counts(movies['release_year'][movies['release_year'] >= 0])
+    return results
+
+
+class ParallelAggregator:
+    """
+    Runs the aggregations of the analysis methods in a single pass over the corpus, split across processes.
+
+    The character and movie tables are partitioned by movie (hash of the Freebase movie ID for the characters,
+    the key actor_count groups on, and of the Wikipedia movie ID for the movies) into Arrow IPC files. The
+    worker processes memory-map their partition, so no DataFrame is pickled, and every worker computes all
+    the aggregations at once. Partial counts are then summed, which gives exactly the results of the
+    single-threaded methods. The partitions are written once per version of the tables and reused.
+
+    Parameters:
+    -----------
+    analysis : MovieAnalysis
+        The analysis whose tables are aggregated.
+    workers : int, optional
+        Number of worker processes. Defaults to the number of CPUs.
+    partitions : int, optional
+        Number of partitions. Defaults to the number of workers.
+    path : str, optional
+        Directory of the partition files. Defaults to a 'partitions' directory in the cache of the analysis,
+        or in the temporary directory if the analysis has no cache.
+    """
+
+    def __init__(self, analysis, workers: int = None, partitions: int = None, path: str = None):
+        self.analysis = analysis
+        self.workers = workers or os.cpu_count() or 1
+        self.partitions = partitions or self.workers
+        self.path = path or os.path.join(analysis.cache_path or tempfile.gettempdir(), 'partitions')
+        self._pool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        """Stop the worker processes."""
+        if self._pool is not None:
+            self._pool.shutdown()
+            self._pool = None
+
+    def _write_partitions(self, name, build):
+        """
+        Write the columns of a table as one Arrow IPC file per partition and return the file paths.
+        build() returns the columns and the key that assigns every row to a partition; it is only called when
+        the files of this table version and partition count do not exist yet.
+        """
+        version = '-'.join(str(part) for part in self.analysis.table_versions[name])
+        directory = os.path.join(self.path, f'{name}-{version}-{self.partitions}')
+        files = [os.path.join(directory, f'part-{part:04d}.arrow') for part in range(self.partitions)]
+        if os.path.isdir(directory):
+            return files
+
+        # Rows grouped by partition, in table order within a partition
+        columns, keys = build()
+        assignment = np.where(keys >= 0, keys, 0) % self.partitions
+        order = np.argsort(assignment, kind='stable')
+        bounds = np.searchsorted(assignment[order], np.arange(self.partitions + 1))
+
+        # Written to a temporary directory first, so that a crash never leaves half the partitions
+        staging = directory + '.partial'
+        shutil.rmtree(staging, ignore_errors=True)
+        os.makedirs(staging)
+        for part in range(self.partitions):
+            rows = order[bounds[part]:bounds[part + 1]]
+            table = pa.table({column: values[rows] for column, values in columns.items()})
+            feather.write_feather(table, os.path.join(staging, os.path.basename(files[part])),
+                                  compression='uncompressed')
+        os.replace(staging, directory)
+
+        # The partitions of earlier table versions (or partition counts) are never read again
+        for entry in os.listdir(self.path):
+            path = os.path.join(self.path, entry)
+            if entry.startswith(f'{name}-') and path not in (directory, staging) and os.path.isdir(path):
+                shutil.rmtree(path, ignore_errors=True)
+        return files
+
+    def _character_columns(self):
+        """Return the character columns the workers need, and the movie of every row as partition key."""
+        characters = self.analysis.character_data
+        movie_codes = pd.factorize(characters['Freebase movie ID'])[0].astype(np.int64)
+        gender_codes = pd.Categorical(characters['Actor gender'], categories=self.analysis.actor_genders).codes
+        return {
+            'movie': movie_codes,
+            'has_actor': characters['Freebase actor ID'].notna().to_numpy(),
+            'gender': gender_codes.astype(np.int8),
+            'height': characters['Actor height'].to_numpy(dtype=float),
+            'birth_year': characters['Actor birth year'].fillna(-1).to_numpy(dtype=np.int32),
+            'birth_month': characters['Actor birth month'].fillna(-1).to_numpy(dtype=np.int32),
+        }, movie_codes
+
+    def _movie_columns(self):
+        """Return the movie columns the workers need, and the movie ID of every row as partition key."""
+        movies = self.analysis.movie_data
+        return {
+            'release_year': movies['Movie release year'].fillna(-1).to_numpy(dtype=np.int32),
+        }, movies['Wikipedia movie ID'].to_numpy(dtype=np.int64)
+
+    def run(self, height_edges=None):
+        """
+        Compute, in parallel, the aggregations of the analysis methods.
+
+        Parameters:
+        -----------
+        height_edges : array-like, optional
+            Edges of the height histogram bins, in meters. Defaults to 30 bins between 1.0 and 2.2 m.
+
+        Returns:
+        --------
+        dict
+            - 'actor_count': the DataFrame of actor_count()
+            - 'height_histograms': a DataFrame of actor counts, one row per gender ('All' last) and one column
+              per bin (named by its left edge), equal to height_index.histogram(gender, height_edges)
+            - 'births_per_year', 'births_per_month': the DataFrames of ages('Y') and ages('M')
+            - 'releases': the DataFrame of releases()
+        """
+        height_edges = np.asarray(np.linspace(1.0, 2.2, 31) if height_edges is None else height_edges, dtype=float)
+        character_files = self._write_partitions('character_data', self._character_columns)
+        movie_files = self._write_partitions('movie_data', self._movie_columns)
+        genders = self.analysis.actor_genders
+
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=self.workers)
+        futures = [self._pool.submit(aggregate_partition, character_file, movie_file, height_edges, len(genders))
+                   for character_file, movie_file in zip(character_files, movie_files)]
+        partials = [future.result() for future in futures]
+
+        # Sum the partial counts of every partition
+        def merged(key):
+            return pd.concat([partial[key] for partial in partials]).groupby(level=0).sum().astype(np.int64)
+
+        actor_count = merged('actor_count')
+        births_per_year = merged('births_per_year')
+        births_per_month = merged('births_per_month')
+        releases = merged('releases')
+        birth_dtype = self.analysis.character_data['Actor birth year'].dtype
+        return {
+            'actor_count': pd.DataFrame({'actor_count': actor_count.index.to_numpy(dtype=np.int64),
+                                         'movie_count': actor_count.to_numpy()}),
+            'height_histograms': pd.DataFrame(sum(partial['heights'] for partial in partials),
+                                              index=pd.Index(genders + ['All'], name='Gender'),
+                                              columns=height_edges[:-1]),
+            'births_per_year': pd.DataFrame({'Year': pd.array(births_per_year.index, dtype=birth_dtype),
+                                             'Birth Count': births_per_year.to_numpy()}),
+            'births_per_month': pd.DataFrame({'Month': pd.array(births_per_month.index, dtype=birth_dtype),
+                                              'Birth Count': births_per_month.to_numpy()}),
+            'releases': pd.DataFrame({'Year': releases.index.to_numpy(dtype=np.int64),
+                                      'Movie Count': releases.to_numpy()}),
+        }
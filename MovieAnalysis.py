@@ -1,83 +1,1119 @@
+import io
 import os
+import sys
+import json
+import inspect
+import shutil
+import hashlib
+import pathlib
 import tarfile
+import time
+import uuid
+import threading
+import functools
+from collections import OrderedDict
+import urllib.error
 import urllib.request
+import numpy as np
 import pandas as pd
+import pyarrow as pa
+import pyarrow.feather as feather
+from MovieSearch import SearchIndex
+from MovieGraph import ActorGraph
+from MovieAggregation import ParallelAggregator
+from MovieProfiler import PROFILER, profiled
 
-import matplotlib.pyplot as plt
 import ast
 import random
 
-import re
 
+# Function to parse a whole date column at once
+# The dates come in three granularities: 2024-03-15, 2024-03 and 2024. Instead of detecting the format
+# row by row, every format is matched in bulk and parsed with one to_datetime call. Returns a DataFrame with
+# nullable integer 'year' and 'month' columns, 'month' is missing for dates that only have a year.
+def parse_dates(column: pd.Series):
+    if pd.api.types.is_numeric_dtype(column):
+        column = column.astype('Int64')  # columns that only hold years are read as numbers
+    text = column.astype('string')
+
+    year = pd.Series(pd.NA, index=column.index, dtype='Int32')
+    month = pd.Series(pd.NA, index=column.index, dtype='Int32')
+    for pattern, fmt in [(r'\d{4}-\d{2}-\d{2}', '%Y-%m-%d'), (r'\d{4}-\d{2}', '%Y-%m')]:
+        mask = text.str.fullmatch(pattern).fillna(False).to_numpy(dtype=bool)
+        dates = pd.to_datetime(text[mask], format=fmt, errors='coerce')  # invalid dates become NaT
+        year[mask] = dates.dt.year.astype('Int32')
+        month[mask] = dates.dt.month.astype('Int32')
+
+    mask = text.str.fullmatch(r'\d{4}').fillna(False).to_numpy(dtype=bool)
+    year[mask] = text[mask].astype('Int32')
+
+    return pd.DataFrame({'year': year, 'month': month})
+
+
+# Function to describe a source file for the columnar cache
+# The cache is only valid while the TSV has the same size and modification time it had when the cache was built.
+def file_stamp(file_path, column_names):
+    stat = os.stat(file_path)
+    return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'columns': list(column_names)}
+
+
+# Function to describe the delta segments of a table (see MovieAnalysis.ingest) for its version stamp
+# The names, sizes and modification times of the segments are hashed, so adding, replacing or removing one changes it.
+def delta_stamp(delta_files):
+    digest = hashlib.sha256()
+    for delta_file in delta_files:
+        stat = os.stat(delta_file)
+        digest.update(f'{os.path.basename(delta_file)}:{stat.st_size}:{stat.st_mtime_ns}\n'.encode('utf-8'))
+    return digest.hexdigest()[:16]
+
+
+# Function to decode one of the Freebase dictionary strings ('{"/m/07s9rl0": "Drama"}') into its list of labels
+# The columns are JSON, ast is only used as a fallback for the odd value that is not.
+def decode_freebase_dict(value):
+    try:
+        return list(json.loads(value).values())
+    except (TypeError, ValueError, AttributeError):
+        pass
+    try:
+        return list(ast.literal_eval(value).values())
+    except (TypeError, ValueError, SyntaxError, AttributeError):
+        return []
+
+
+class DownloadStream:
+    """
+    Read-only file-like object over the dataset download, fed straight into tarfile's streaming mode.
+
+    The bytes of an interrupted download (the '.part' file) are replayed first, then the rest is read from the
+    response and appended to the '.part' file. Everything that goes through is hashed (SHA-256) and the
+    progress is printed every 10%.
+    """
+
+    def __init__(self, response, part_file=None, resumed_file=None, total_size=None):
+        self.response = response
+        self.part_file = part_file
+        self.resumed_file = resumed_file
+        self.total_size = total_size
+        self.bytes_read = 0
+        self._sha256 = hashlib.sha256()
+        self._next_report = 10
+
+    def read(self, size=-1):
+        data = b''
+        if self.resumed_file is not None:
+            data = self.resumed_file.read(size)
+            if not data:
+                self.resumed_file.close()
+                self.resumed_file = None
+        if not data:
+            data = self.response.read(size)
+            if self.part_file is not None:
+                self.part_file.write(data)
+
+        self._sha256.update(data)
+        self.bytes_read += len(data)
+        self._report_progress()
+        return data
+
+    def drain(self):
+        """Read whatever tarfile left unread (end-of-archive padding), so the checksum covers the whole file."""
+        while self.read(2 ** 20):
+            pass
+
+    def hexdigest(self):
+        return self._sha256.hexdigest()
+
+    def _report_progress(self):
+        if not self.total_size:
+            return
+        percent = 100 * self.bytes_read // self.total_size
+        if percent >= self._next_report:
+            print(f'Downloaded {percent}% ({self.bytes_read / 2 ** 20:.1f} of {self.total_size / 2 ** 20:.1f} MiB)')
+            self._next_report = percent - percent % 10 + 10
+
+
+class LabelIndex:
+    """
+    Decoded form of one of the Freebase dictionary columns ('Movie genres', 'Movie languages', 'Movie countries').
+
+    The column is decoded once into an exploded movie -> label table, kept in the original row and label order:
+    'rows' holds the position of the movie in the source table and 'codes' the categorical code of the label.
+    On top of it the index keeps the label counts, the rows of every label and a lazily built membership matrix.
+    """
+
+    def __init__(self, column: pd.Series):
+        self.name = column.name
+        lengths, labels = self._decode(column)
+        self.offsets = np.concatenate([[0], np.cumsum(lengths)]).astype(np.int64)
+        self.rows = np.repeat(np.arange(len(column), dtype=np.int64), lengths)
+
+        codes, categories = pd.factorize(labels)
+        self.codes = codes.astype(np.int32)
+        self.categories = pd.Index(categories, name=self.name)
+
+        # Number of movies per label, the most frequent first (labels with equal counts in order of first appearance)
+        self.counts = self._sorted_counts(np.bincount(self.codes, minlength=len(categories)), self.categories)
+
+        # Rows of every label, grouped by code so that a label lookup is a slice
+        order = np.argsort(self.codes, kind='stable')
+        self._rows_by_code = self.rows[order]
+        self._code_offsets = np.concatenate([[0], np.cumsum(np.bincount(self.codes, minlength=len(categories)))])
+        self._membership = None
+        self._freeze()
+
+    @staticmethod
+    def _decode(column):
+        """Return the number of labels of every row and all the labels, in row order."""
+        # Every distinct string is only decoded once, most movies share their genre/language/country dictionaries
+        value_codes, uniques = pd.factorize(column, use_na_sentinel=False)
+        decoded = [decode_freebase_dict(value) for value in uniques]
+        unique_lengths = np.array([len(labels) for labels in decoded], dtype=np.int64)
+        unique_starts = np.concatenate([[0], np.cumsum(unique_lengths)[:-1]]).astype(np.int64)
+        flat_labels = np.array([label for labels in decoded for label in labels], dtype=object)
+
+        # Gather the decoded labels of every row, in order, without a Python loop over the rows
+        lengths = unique_lengths[value_codes]
+        starts = np.concatenate([[0], np.cumsum(lengths)[:-1]]).astype(np.int64)
+        gather = np.repeat(unique_starts[value_codes] - starts, lengths) + np.arange(lengths.sum())
+        labels = flat_labels[gather] if len(gather) else np.array([], dtype=object)
+        return lengths, labels
+
+    @staticmethod
+    def _sorted_counts(counts, categories):
+        """
+        Return the counts of the labels (in category order) as a Series sorted by decreasing count. The sort is
+        stable and the categories are in order of first appearance, so an index extended with new rows orders
+        its ties exactly like an index built from all the rows at once.
+        """
+        return pd.Series(counts, index=categories, name='count').sort_values(ascending=False, kind='stable')
+
+    def _freeze(self):
+        # The index is shared by every call, nothing is allowed to modify it in place
+        for array in (self.offsets, self.rows, self.codes, self._rows_by_code, self._code_offsets):
+            array.setflags(write=False)
+
+    def extend(self, column: pd.Series):
+        """
+        Return a new index covering the rows of this one followed by the rows of column (new rows of the same
+        table). Only the new rows are decoded; labels never seen before get the next codes and the counts are
+        updated by the counts of the new rows (sorted like in a new index, see _sorted_counts).
+        """
+        lengths, labels = self._decode(column)
+        index = LabelIndex.__new__(LabelIndex)
+        index.name = self.name
+        index.offsets = np.concatenate([self.offsets, self.offsets[-1] + np.cumsum(lengths)]).astype(np.int64)
+        new_rows = np.repeat(np.arange(len(self), len(self) + len(column), dtype=np.int64), lengths)
+        index.rows = np.concatenate([self.rows, new_rows])
+
+        # Labels never seen before are appended to the categories, in order of first appearance
+        unseen = pd.unique(labels[self.categories.get_indexer(labels) < 0]) if len(labels) else []
+        index.categories = self.categories.append(pd.Index(unseen, dtype=object)).rename(self.name)
+        new_codes = index.categories.get_indexer(labels).astype(np.int32)
+        index.codes = np.concatenate([self.codes, new_codes])
+
+        counts = np.concatenate([self.counts.reindex(self.categories).to_numpy(), np.zeros(len(unseen), np.int64)])
+        index.counts = self._sorted_counts(counts + np.bincount(new_codes, minlength=len(index.categories)),
+                                           index.categories)
+
+        # New rows are inserted at the end of the block of their label, which keeps every block sorted
+        old_offsets = np.concatenate([self._code_offsets, np.full(len(unseen), self._code_offsets[-1])])
+        order = np.argsort(new_codes, kind='stable')
+        index._rows_by_code = np.insert(self._rows_by_code, old_offsets[new_codes[order] + 1], new_rows[order])
+        added = np.bincount(new_codes, minlength=len(index.categories))
+        index._code_offsets = old_offsets + np.concatenate([[0], np.cumsum(added)])
+        index._membership = None
+        index._freeze()
+        return index
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def rows_with(self, label):
+        """Return the (sorted) positions of the rows that have the given label."""
+        code = self.categories.get_indexer([label])[0]
+        if code < 0:
+            return np.array([], dtype=np.int64)
+        return self._rows_by_code[self._code_offsets[code]:self._code_offsets[code + 1]]
+
+    def labels_of(self, row):
+        """Return the decoded labels of the row at the given position, in their original order."""
+        codes = self.codes[self.offsets[row]:self.offsets[row + 1]]
+        return self.categories[codes].tolist()
+
+    @property
+    def membership(self):
+        """Boolean (rows x labels) matrix, True where the row has the label."""
+        if self._membership is None:
+            membership = np.zeros((len(self), len(self.categories)), dtype=bool)
+            membership[self.rows, self.codes] = True
+            membership.setflags(write=False)
+            self._membership = membership
+        return self._membership
+
+
+class HeightIndex:
+    """
+    Sorted actor heights, one array per gender plus one for 'All', built once at load time.
+
+    Range queries are two binary searches (O(log n)) and histogram counts come from the cumulative
+    counts at the bin edges, so neither has to scan the character table.
+    """
+
+    def __init__(self, heights: pd.Series, genders: pd.Series):
+        heights = heights.to_numpy(dtype=float)
+        genders = genders.to_numpy(dtype=object)
+        known = np.flatnonzero(~np.isnan(heights))
+
+        self._heights = {}
+        self._positions = {}
+        self._add('All', heights, known)
+        for gender in pd.unique(genders[known]):
+            if not pd.isna(gender):
+                self._add(gender, heights, known[genders[known] == gender])
+
+    def _add(self, gender, heights, positions):
+        """Store the heights of the rows at the given positions, sorted, along with the positions themselves."""
+        order = np.argsort(heights[positions], kind='stable')
+        self._heights[gender] = heights[positions][order]
+        self._positions[gender] = positions[order]
+        self._heights[gender].setflags(write=False)
+        self._positions[gender].setflags(write=False)
+
+    def extend(self, heights: pd.Series, genders: pd.Series, first_row: int):
+        """
+        Return a new index with the heights of new rows of the table (the first one at position first_row)
+        merged into the sorted arrays, without sorting the existing heights again.
+        """
+        heights = heights.to_numpy(dtype=float)
+        genders = genders.to_numpy(dtype=object)
+        known = np.flatnonzero(~np.isnan(heights))
+
+        index = HeightIndex.__new__(HeightIndex)
+        index._heights = dict(self._heights)
+        index._positions = dict(self._positions)
+        groups = [('All', known)] + [(gender, known[genders[known] == gender])
+                                     for gender in pd.unique(genders[known]) if not pd.isna(gender)]
+        for gender, rows in groups:
+            order = np.argsort(heights[rows], kind='stable')
+            new_heights = heights[rows][order]
+            old_heights = self._heights.get(gender, np.array([]))
+            # side='right' puts new rows after the existing rows of equal height, like a stable sort of the table
+            at = np.searchsorted(old_heights, new_heights, side='right')
+            index._heights[gender] = np.insert(old_heights, at, new_heights)
+            index._positions[gender] = np.insert(self._positions.get(gender, np.array([], dtype=np.int64)), at,
+                                                 rows[order] + first_row)
+            index._heights[gender].setflags(write=False)
+            index._positions[gender].setflags(write=False)
+        return index
+
+    def _bounds(self, gender, min_height, max_height):
+        """Return the slice of the sorted arrays holding the heights in [min_height, max_height]."""
+        heights = self._heights.get(gender, np.array([]))
+        return np.searchsorted(heights, min_height, side='left'), np.searchsorted(heights, max_height, side='right')
+
+    def positions(self, gender, min_height, max_height):
+        """Return the row positions (in table order) of the actors of a gender in a height range."""
+        start, stop = self._bounds(gender, min_height, max_height)
+        if gender not in self._positions or start >= stop:
+            return np.array([], dtype=np.int64)
+        return np.sort(self._positions[gender][start:stop])
+
+    def count(self, gender, min_height, max_height):
+        """Return the number of actors of a gender in a height range."""
+        start, stop = self._bounds(gender, min_height, max_height)
+        return int(max(stop - start, 0))
+
+    @staticmethod
+    def _quantile(heights, start, stop, q):
+        """Return the q-th quantile of the sorted heights[start:stop], interpolated linearly like np.quantile."""
+        position = start + q * (stop - start - 1)
+        below = int(position)
+        above = min(below + 1, stop - 1)
+        return heights[below] + (heights[above] - heights[below]) * (position - below)
+
+    def bin_edges(self, gender, min_height, max_height, bins=30):
+        """
+        Return the edges of the bins of a histogram of the heights of a gender in a height range, equal to
+        np.histogram_bin_edges of these heights. bins is a number of bins, a sequence of edges or one of the
+        adaptive rules 'fd' (Freedman-Diaconis), 'sturges' and 'auto' (the narrower of the two). The range and
+        quartiles are read from the sorted heights, so the heights are never copied.
+        """
+        if isinstance(bins, str) and bins not in ('fd', 'sturges', 'auto'):
+            raise ValueError("'bins' must be a number of bins, a sequence of edges, 'fd', 'sturges' or 'auto'.")
+        if not isinstance(bins, (int, str)):
+            return np.asarray(bins, dtype=float)
+
+        heights = self._heights.get(gender, np.array([]))
+        start, stop = self._bounds(gender, min_height, max_height)
+        count = max(stop - start, 0)
+        if count == 0:
+            return np.array([])
+        low, high = heights[start], heights[stop - 1]
+        spread = high - low
+
+        if isinstance(bins, str):
+            iqr = self._quantile(heights, start, stop, 0.75) - self._quantile(heights, start, stop, 0.25)
+            fd_width = 2.0 * iqr * count ** (-1 / 3)
+            sturges_width = spread / (np.log2(count) + 1.0)
+            if bins == 'fd':
+                width = fd_width
+            elif bins == 'sturges':
+                width = sturges_width
+            else:
+                width = min(fd_width, sturges_width) if fd_width > 0 else sturges_width
+            bins = int(np.ceil(spread / width)) if width > 0 else 1
+
+        # A single distinct height gets a range of 1 around it, like in NumPy
+        if spread == 0:
+            low, high = low - 0.5, high + 0.5
+        return np.linspace(low, high, bins + 1)
+
+    def histogram(self, gender, edges, min_height=-np.inf, max_height=np.inf):
+        """
+        Return the number of actors of a gender in every bin delimited by the edges, counting only the heights
+        in [min_height, max_height]. Bins are closed on the left, the last one is also closed on the right
+        (like np.histogram).
+        """
+        start, stop = self._bounds(gender, min_height, max_height)
+        heights = self._heights.get(gender, np.array([]))[start:stop]
+        cumulative = np.searchsorted(heights, edges, side='left')
+        cumulative[-1] = np.searchsorted(heights, edges[-1], side='right')
+        return np.diff(cumulative)
 
-# Function to detect the date format
-# This function will take a date string as input and return the format of the date string.
-def detect_date_format(date_str):
-    patterns = [
-        (r'\d{4}-\d{2}-\d{2}', '%Y-%m-%d'),  # 2024-03-15
-        (r'^\d{4}-\d{2}$', '%Y-%m'),  # 2024-03
-        (r'^\d{4}$', '%Y'),  # 2024
-    ] # these are the only patterns present in the data, jupyter notebook was used to find these patterns
-    
-    for pattern, fmt in patterns:
-        if re.match(pattern, date_str):
-            return fmt
-    return 'Unknown Format'
+
+class IdIndex:
+    """
+    Hash index from the 'Wikipedia movie ID' of a table to the position of its row, for O(1) lookups.
+    If an ID appears more than once, its first row is used.
+    """
+
+    def __init__(self, ids: pd.Series):
+        first = ~ids.duplicated().to_numpy()
+        self.ids = pd.Index(ids.to_numpy()[first])
+        self._positions = np.flatnonzero(first)
+        self._positions.setflags(write=False)
+
+    def extend(self, ids: pd.Series, first_row: int):
+        """Return a new index that also covers new rows of the table, the first one at position first_row."""
+        ids = ids.to_numpy()
+        new = (self.ids.get_indexer(ids) < 0) & ~pd.Series(ids).duplicated().to_numpy()
+        index = IdIndex.__new__(IdIndex)
+        index.ids = self.ids.append(pd.Index(ids[new]))
+        index._positions = np.concatenate([self._positions, np.flatnonzero(new) + first_row])
+        index._positions.setflags(write=False)
+        return index
+
+    def positions(self, ids):
+        """Return the row positions of the given IDs, -1 for the ones that are not in the table."""
+        found = self.ids.get_indexer(ids)
+        return np.where(found >= 0, self._positions[found], -1)
+
+    def position(self, movie_id):
+        """Return the row position of one ID, -1 if it is not in the table."""
+        return int(self.positions([movie_id])[0])
+
+
+class ReleaseCube:
+    """
+    Number of movies, box office revenue and runtime of movie_data per release year and per genre, country and
+    language, aggregated once from the label indexes.
+
+    Every movie is reduced to the code of its release year. For every dimension, dense (labels x years) arrays
+    hold the movie count and the revenue and runtime sums, so the releases of one label are a row of an array and
+    the totals per decade are sums of columns. Queries combining several labels select the movies from the sorted
+    row lists of the label indexes (any of the labels of a dimension, and every dimension) and count their years
+    with np.bincount. Movies without a release year are left out, as in releases.
+
+    A single (genres x years x countries x languages) array would have more than a billion cells on the CMU
+    corpus, which is why the dimensions are only crossed with the years.
+    """
+
+    MEASURES = {'Movie Count': None, 'Box Office Revenue': 'revenue', 'Total Runtime': 'runtime'}
+
+    def __init__(self, years: pd.Series, revenue: pd.Series, runtime: pd.Series, indexes: dict):
+        years = years.to_numpy(dtype=float, na_value=np.nan)
+        self.indexes = dict(indexes)
+        self.years = np.unique(years[~np.isnan(years)]).astype(np.int64)
+        self.year_codes = self._year_codes(years)
+        self.revenue = np.nan_to_num(revenue.to_numpy(dtype=float, na_value=np.nan))
+        self.runtime = np.nan_to_num(runtime.to_numpy(dtype=float, na_value=np.nan))
+        self.totals, self.cells = self._aggregate(0)
+
+    def _year_codes(self, years):
+        """Return the position of every release year in self.years, -1 for the movies without one."""
+        known = ~np.isnan(years)
+        codes = np.full(len(years), -1, dtype=np.int32)
+        codes[known] = np.searchsorted(self.years, years[known].astype(np.int64))
+        return codes
+
+    def _weights(self, measure, rows):
+        """Return the values of a measure for some rows (None for the movie count)."""
+        attribute = self.MEASURES[measure]
+        return None if attribute is None else getattr(self, attribute)[rows]
+
+    def _aggregate(self, first_row):
+        """Return the totals per year and the (labels x years) arrays of every dimension, of the rows from first_row."""
+        year_count = len(self.years)
+        rows = np.arange(first_row, len(self.year_codes))[self.year_codes[first_row:] >= 0]
+        totals = {measure: np.bincount(self.year_codes[rows], weights=self._weights(measure, rows),
+                                       minlength=year_count) for measure in self.MEASURES}
+
+        cells = {}
+        for dimension, index in self.indexes.items():
+            start = index.offsets[first_row]
+            rows, codes = index.rows[start:], index.codes[start:].astype(np.int64)
+            dated = self.year_codes[rows] >= 0
+            rows, cell = rows[dated], codes[dated] * year_count + self.year_codes[rows[dated]]
+            shape = (len(index.categories), year_count)
+            cells[dimension] = {measure: np.bincount(cell, weights=self._weights(measure, rows),
+                                                     minlength=shape[0] * shape[1]).reshape(shape)
+                                for measure in self.MEASURES}
+        return totals, cells
+
+    def extend(self, years: pd.Series, revenue: pd.Series, runtime: pd.Series, indexes: dict):
+        """
+        Return a new cube that also covers new rows of movie_data, given their columns and the label indexes
+        extended with them. Only the new rows are aggregated; new years and labels get new columns and rows.
+        """
+        years = years.to_numpy(dtype=float, na_value=np.nan)
+        cube = ReleaseCube.__new__(ReleaseCube)
+        cube.indexes = dict(indexes)
+        cube.years = np.union1d(self.years, years[~np.isnan(years)].astype(np.int64))
+        old_columns = np.searchsorted(cube.years, self.years)
+        cube.year_codes = np.concatenate([np.where(self.year_codes >= 0, old_columns[self.year_codes], -1),
+                                          cube._year_codes(years)]).astype(np.int32)
+        cube.revenue = np.concatenate([self.revenue, np.nan_to_num(revenue.to_numpy(dtype=float, na_value=np.nan))])
+        cube.runtime = np.concatenate([self.runtime, np.nan_to_num(runtime.to_numpy(dtype=float, na_value=np.nan))])
+
+        # Old sums are moved to the columns of their years, the sums of the new rows are added to them
+        cube.totals, cube.cells = cube._aggregate(len(self.year_codes))
+        for measure in self.MEASURES:
+            cube.totals[measure][old_columns] += self.totals[measure]
+            for dimension, cells in self.cells.items():
+                cube.cells[dimension][measure][:len(cells[measure]), old_columns] += cells[measure]
+        return cube
+
+    def labels(self, dimension):
+        """Return the labels of a dimension ('genre', 'country' or 'language'), in order of first appearance."""
+        return self.indexes[dimension].categories.tolist()
+
+    def rows(self, selection):
+        """
+        Return the sorted positions of the movies that have at least one of the labels of every dimension of the
+        selection (a dict dimension -> list of labels).
+        """
+        rows = None
+        for dimension, labels in selection.items():
+            index = self.indexes[dimension]
+            matching = np.unique(np.concatenate([index.rows_with(label) for label in labels]))
+            rows = matching if rows is None else np.intersect1d(rows, matching, assume_unique=True)
+        return rows
+
+    def per_year(self, selection):
+        """
+        Return the value of every measure per year (one value per year of self.years) for the movies of a
+        selection (a dict dimension -> list of labels, an empty selection is all the movies).
+        """
+        selection = {dimension: list(labels) for dimension, labels in selection.items() if len(labels)}
+        if not selection:
+            return dict(self.totals)
+
+        # One label: a row of the precomputed array
+        if len(selection) == 1 and len(next(iter(selection.values()))) == 1:
+            dimension, [label] = next(iter(selection.items()))
+            code = self.indexes[dimension].categories.get_indexer([label])[0]
+            if code < 0:
+                return {measure: np.zeros(len(self.years), dtype=self.totals[measure].dtype)
+                        for measure in self.MEASURES}
+            return {measure: self.cells[dimension][measure][code] for measure in self.MEASURES}
+
+        # Several labels: a movie with two of them must only be counted once
+        rows = self.rows(selection)
+        rows = rows[self.year_codes[rows] >= 0]
+        return {measure: np.bincount(self.year_codes[rows], weights=self._weights(measure, rows),
+                                     minlength=len(self.years)) for measure in self.MEASURES}
+
+    def by_decade(self, dimension, measure='Movie Count'):
+        """Return the decades and a (labels x decades) array of the values of a measure for every label."""
+        decades = self.years // 10 * 10
+        starts = np.flatnonzero(np.r_[True, decades[1:] != decades[:-1]])  # years are sorted
+        if len(starts) == 0:
+            return decades, np.zeros((len(self.indexes[dimension].categories), 0))
+        return decades[starts], np.add.reduceat(self.cells[dimension][measure], starts, axis=1)
+
+
+class ResultCache:
+    """
+    Thread-safe LRU cache for the results of the MovieAnalysis queries, bounded by the memory the results use.
+
+    Parameters:
+    -----------
+    max_bytes : int
+        Memory cap in bytes. The least recently used results are evicted once the cached results use more.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.current_bytes = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def result_size(value):
+        """Estimate the memory used by a result in bytes."""
+        if isinstance(value, (pd.DataFrame, pd.Series)):
+            return int(np.sum(value.memory_usage(deep=True)))
+        return sys.getsizeof(value)
+
+    def get(self, key):
+        """Return (True, result) for a cached key and (False, None) otherwise."""
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return True, self._entries[key][0]
+            self.misses += 1
+            return False, None
+
+    def put(self, key, value):
+        """Store a result, evicting the least recently used ones to stay under the memory cap."""
+        size = self.result_size(value)
+        if size > self.max_bytes:
+            return  # a single result bigger than the whole cache is never worth keeping
+        with self._lock:
+            if key in self._entries:
+                self.current_bytes -= self._entries.pop(key)[1]
+            self._entries[key] = (value, size)
+            self.current_bytes += size
+            while self.current_bytes > self.max_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self.current_bytes -= evicted_size
+                self.evictions += 1
+
+    def clear(self):
+        """Drop every cached result (the statistics are kept)."""
+        with self._lock:
+            self._entries.clear()
+            self.current_bytes = 0
+
+    def info(self):
+        """Return the hit/miss statistics and the memory used by the cache."""
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions,
+                    'entries': len(self._entries), 'bytes': self.current_bytes, 'max_bytes': self.max_bytes}
+
+
+# Function to turn an argument of a cached query into a hashable part of its key
+# Lists, tuples and arrays become tuples and sets become frozensets, so that e.g. the lists of countries the app
+# passes to release_stats are cached like any other argument.
+def freeze_argument(value):
+    if isinstance(value, (list, tuple, np.ndarray)):
+        return tuple(freeze_argument(item) for item in value)
+    if isinstance(value, (set, frozenset)):
+        return frozenset(freeze_argument(item) for item in value)
+    return value
+
+
+# Decorator that caches the result of a MovieAnalysis query in the instance's ResultCache
+# The key is made of the method name, its arguments (with the defaults filled in) and the version of the tables
+# the query reads, so a result is never served for data that changed. Callers get a copy of cached DataFrames,
+# so modifying a result cannot corrupt the cache.
+def cached_query(*tables):
+    def decorator(func):
+        signature = inspect.signature(func)
+
+        @functools.wraps(func)
+        def wrapper(self, *args, **kwargs):
+            if self.result_cache is None:
+                return func(self, *args, **kwargs)
+
+            bound = signature.bind(self, *args, **kwargs)
+            bound.apply_defaults()
+            arguments = tuple((name, freeze_argument(value)) for name, value in bound.arguments.items())[1:]
+            key = (func.__name__, arguments, tuple(self.table_versions[t] for t in tables))
+            try:
+                found, result = self.result_cache.get(key)
+            except TypeError:  # other unhashable arguments (e.g. dicts) are simply not cached
+                return func(self, *args, **kwargs)
+
+            if not found:
+                result = func(self, *args, **kwargs)
+                self.result_cache.put(key, result)
+            return result.copy() if isinstance(result, (pd.DataFrame, pd.Series)) else result
+
+        return wrapper
+
+    return decorator
+
+
+class LazyTable:
+    """
+    Attribute holding one of the tables of the corpus, loaded (from the cache or the TSV) on first access.
+    Assigning to it replaces the loaded table.
+    """
+
+    def __set_name__(self, owner, name):
+        self.name = name
+
+    def __get__(self, instance, owner):
+        if instance is None:
+            return self
+        return instance._get_table(self.name)
+
+    def __set__(self, instance, value):
+        instance._tables[self.name] = value
 
 
 class MovieAnalysis:
     """
     This class is used to analyze the movie data. It will be used to analyze the data and provide the results to the user.
+
+    Parameters:
+    -----------
+    cache_path : str or None, optional (default='Downloads/cache')
+        Directory where the parsed tables are stored as uncompressed Arrow (Feather) files.
+        The first construction parses the TSVs and writes the cache, later ones memory-map it.
+        Pass None to always parse the TSVs.
+    result_cache_bytes : int or None, optional (default=64 MiB)
+        Memory cap of the cache that keeps the results of the query methods. Pass None to disable it.
+    source : str or None, optional
+        Where to get the dataset from if it is not extracted yet: an http(s) or file:// URL, or the path of a local
+        copy of MovieSummaries.tar.gz (e.g. a shared mirror for offline machines). Defaults to the CMU website.
+    sha256 : str or None, optional
+        Expected SHA-256 of the tar.gz file. When given, a download that does not match it is rejected.
+    prefetch : bool, optional (default=False)
+        The tables are loaded on first access. If True, a background thread loads them all right away,
+        starting with the ones the analysis methods need.
+    search_path : str, optional (default='Downloads/search_index')
+        Directory of the full-text index of the plot summaries used by search. It is built on the first search
+        and rebuilt when plot_summaries.txt changes.
     """
 
-    def __init__(self):
-        download_link = 'http://www.cs.cmu.edu/~ark/personas/data/MovieSummaries.tar.gz'
-        download_path = 'MovieSummaries.tar.gz'
-        extract_path = 'Downloads/MovieSummaries'
-
-        # Check if the directory is empty or doesn't exist
-        if not os.path.exists(extract_path) or not os.listdir(extract_path):
-            self._download_and_extract(download_link, download_path, extract_path)
-
-        # Data and MetaData
-        self.movie_summaries = self._load_data('Downloads/MovieSummaries/plot_summaries.txt',
-                                               ['Wikipedia movie ID', 'Plot summary'])
-        self.character_data = self._load_data('Downloads/MovieSummaries/character.metadata.tsv',
-                                              ['Wikipedia movie ID', 'Freebase movie ID', 'Movie release date',
-                                               'Character name', 'Actor date of birth', 'Actor gender', 'Actor height',
-                                               'Actor ethnicity', 'Actor name', 'Actor age at movie release',
-                                               'Freebase character/actor map ID', 'Freebase character ID',
-                                               'Freebase actor ID'])
-        self.movie_data = self._load_data('Downloads/MovieSummaries/movie.metadata.tsv',
-                                          ['Wikipedia movie ID', 'Freebase movie ID', 'Movie name',
-                                           'Movie release date', 'Movie box office revenue', 'Movie runtime',
-                                           'Movie languages', 'Movie countries', 'Movie genres'])
-        # Test Data
-        self.tvtropes_clusters = self._load_data('Downloads/MovieSummaries/tvtropes.clusters.txt',
-                                                 ['Character type', 'Freebase character/actor map ID'])
-        self.name_clusters = self._load_data('Downloads/MovieSummaries/name.clusters.txt',
-                                             ['Character name', 'Freebase character/actor map ID'])
-
-    def _download_and_extract(self, download_link, download_path, extract_path):
-        """Download and extract the tar.gz file."""
-        print('Downloading the file')
-        urllib.request.urlretrieve(download_link, download_path)
-        print('Downloaded the file')
+    # Data and MetaData, plus the Test Data (tvtropes and name clusters), loaded on first access
+    movie_data = LazyTable()
+    character_data = LazyTable()
+    movie_summaries = LazyTable()
+    tvtropes_clusters = LazyTable()
+    name_clusters = LazyTable()
+
+    # Tables of the corpus, in prefetch order: attribute name -> (file in Downloads/MovieSummaries, column names)
+    TABLES = {
+        'movie_data': ('movie.metadata.tsv',
+                       ['Wikipedia movie ID', 'Freebase movie ID', 'Movie name',
+                        'Movie release date', 'Movie box office revenue', 'Movie runtime',
+                        'Movie languages', 'Movie countries', 'Movie genres']),
+        'character_data': ('character.metadata.tsv',
+                           ['Wikipedia movie ID', 'Freebase movie ID', 'Movie release date',
+                            'Character name', 'Actor date of birth', 'Actor gender', 'Actor height',
+                            'Actor ethnicity', 'Actor name', 'Actor age at movie release',
+                            'Freebase character/actor map ID', 'Freebase character ID',
+                            'Freebase actor ID']),
+        'movie_summaries': ('plot_summaries.txt', ['Wikipedia movie ID', 'Plot summary']),
+        'tvtropes_clusters': ('tvtropes.clusters.txt', ['Character type', 'Freebase character/actor map ID']),
+        'name_clusters': ('name.clusters.txt', ['Character name', 'Freebase character/actor map ID']),
+    }
+
+    # Attributes built when a table is loaded: attribute name -> table
+    DERIVED = {
+        'genre_index': 'movie_data',
+        'language_index': 'movie_data',
+        'country_index': 'movie_data',
+        'actor_genders': 'character_data',
+        'height_index': 'character_data',
+        'movie_id_index': 'movie_data',
+        'summary_id_index': 'movie_summaries',
+        'release_cube': 'movie_data',
+        'birth_counts': 'character_data',
+    }
+
+    # Text columns read only a few rows at a time. They are kept as Arrow strings on the pages of the memory-mapped
+    # cache instead of being copied into Python strings, so they cost no memory until read and the processes that
+    # map the same cache share them
+    MAPPED_COLUMNS = ('Plot summary',)
+
+    # Tables the actor graph is built from
+    GRAPH_TABLES = ('character_data', 'tvtropes_clusters', 'name_clusters')
+
+    def __init__(self, cache_path: str = 'Downloads/cache', result_cache_bytes: int = 64 * 2 ** 20,
+                 source: str = None, sha256: str = None, prefetch: bool = False,
+                 search_path: str = 'Downloads/search_index'):
+        self.cache_path = cache_path
+        self.search_path = search_path
+        self._search_index = None
+        self._search_lock = threading.Lock()
+        self._actor_graph = None
+        self._graph_lock = threading.Lock()
+        self.result_cache = ResultCache(result_cache_bytes) if result_cache_bytes else None
+
+        # Version stamp of every table, part of the key of the cached results
+        self.table_versions = {}
+
+        download_link = source or 'http://www.cs.cmu.edu/~ark/personas/data/MovieSummaries.tar.gz'
+        download_path = 'Downloads/MovieSummaries.tar.gz'
+        extract_path = self.extract_path = 'Downloads/MovieSummaries'
+
+        # Check if the dataset was completely extracted
+        if not self._is_extracted(extract_path):
+            self._download_and_extract(download_link, download_path, extract_path, sha256)
+
+        # Tables are only stamped here (stat calls), they are loaded on first access, with the delta segments that
+        # are stamped in their version
+        self._tables = {}
+        self._table_locks = {name: threading.Lock() for name in self.TABLES}
+        self._deltas = {}
+        for name, (file_name, column_names) in self.TABLES.items():
+            stamp = file_stamp(os.path.join(extract_path, file_name), column_names)
+            self._deltas[name] = self._delta_files(name)
+            self.table_versions[name] = (stamp['size'], stamp['mtime_ns'], delta_stamp(self._deltas[name]))
+
+        if prefetch:
+            threading.Thread(target=self._prefetch, name='MovieAnalysis-prefetch', daemon=True).start()
+
+    def __getattr__(self, name):
+        # Only called for missing attributes: the derived indexes exist once their table is loaded
+        table = MovieAnalysis.DERIVED.get(name)
+        if table is None:
+            raise AttributeError(f"'{type(self).__name__}' object has no attribute '{name}'")
+        self._get_table(table)
+        return self.__dict__[name]
+
+    def _get_table(self, name):
+        """Return a table of the corpus, loading and preparing it on first access."""
+        table = self._tables.get(name)
+        if table is not None:
+            return table
+
+        with self._table_locks[name]:
+            # Another thread may have loaded it while we were waiting for the lock
+            if name not in self._tables:
+                file_name, column_names = self.TABLES[name]
+                with PROFILER.span(f'MovieAnalysis.load({name})', kind='load') as record:
+                    table = self._load_data(os.path.join(self.extract_path, file_name), column_names)
+                    deltas = [feather.read_table(delta_file, memory_map=True).to_pandas()
+                              for delta_file in self._deltas[name]]
+                    if deltas:
+                        # Rows added with ingest, after the rows of the corpus
+                        table = pd.concat([table] + [self._align_types(delta, table) for delta in deltas],
+                                          ignore_index=True)
+                    prepare = getattr(self, f'_prepare_{name}', None)
+                    if prepare is not None:
+                        prepare(table)
+                    record['rows_out'] = len(table)
+                self._tables[name] = table  # published only once it is fully prepared
+        return self._tables[name]
+
+    def _prefetch(self):
+        """Load every table, in the order of TABLES, so that first accesses do not have to wait."""
+        for name in self.TABLES:
+            self._get_table(name)
+
+    def _prepare_movie_data(self, movie_data):
+        """
+        Build the derived columns and indexes of movie_data once, so that the analysis methods
+        only read the columns they need and never have to copy or re-clean the table.
+        """
+        self._derive_movie_columns(movie_data)
+
+        # Decoded Freebase dictionaries, built once instead of running ast.literal_eval on every call
+        self.genre_index = LabelIndex(movie_data['Movie genres'])
+        self.language_index = LabelIndex(movie_data['Movie languages'])
+        self.country_index = LabelIndex(movie_data['Movie countries'])
+
+        # Movie ID -> row, for by-ID lookups
+        self.movie_id_index = IdIndex(movie_data['Wikipedia movie ID'])
+
+        # Number of movies, revenue and runtime per year and genre, country and language
+        self.release_cube = ReleaseCube(movie_data['Movie release year'], movie_data['Movie box office revenue'],
+                                        movie_data['Movie runtime'], self._cube_indexes())
+
+    def _derive_movie_columns(self, movie_data):
+        """Add the columns computed from the raw columns of movie_data."""
+        # Dates parsed once into an integer year column
+        movie_data['Movie release year'] = parse_dates(movie_data['Movie release date'])['year']
+
+    def _cube_indexes(self):
+        """Return the label indexes that are the dimensions of the release cube."""
+        return {'genre': self.genre_index, 'country': self.country_index, 'language': self.language_index}
+
+    def _prepare_movie_summaries(self, movie_summaries):
+        """Index movie_summaries by movie ID, for by-ID lookups."""
+        self.summary_id_index = IdIndex(movie_summaries['Wikipedia movie ID'])
+
+    def _prepare_character_data(self, character_data):
+        """
+        Clean character_data and build its derived columns and indexes once, so that the analysis methods
+        only read the columns they need and never have to copy or re-clean the table.
+        """
+        self._derive_character_columns(character_data)
+
+        # Gender values accepted by actor_distributions (besides 'All') and the sorted heights of each gender
+        self.actor_genders = character_data['Actor gender'].dropna().unique().tolist()
+        self.height_index = HeightIndex(character_data['Actor height'], character_data['Actor gender'])
 
-        if not os.path.exists(extract_path):
-            os.makedirs(extract_path)
+        # Number of actors born per year and per month
+        self.birth_counts = self._birth_counts(character_data)
 
-        with tarfile.open(download_path, 'r:gz') as tar:
-            print('Extracting the file')
-            tar.extractall(path=extract_path)
-            print('Extracted the file')
+    def _derive_character_columns(self, character_data):
+        """Add the columns computed from the raw columns of character_data and clean the heights."""
+        # Dates parsed once into integer year/month columns
+        birth_dates = parse_dates(character_data['Actor date of birth'])
+        character_data['Actor birth year'] = birth_dates['year']
+        character_data['Actor birth month'] = birth_dates['month']
 
-        os.remove(download_path)
+        # Convert height to numeric (to handle missing or incorrect values)
+        # and convert 180 and 510 to 1.8 and 1.78, these are the only two values that are not in meters
+        heights = pd.to_numeric(character_data['Actor height'], errors='coerce')
+        character_data['Actor height'] = heights.replace({180: 1.8, 510: 1.78})
+
+    def _birth_counts(self, character_data):
+        """
+        Return the number of actors born per year and per month ({'Y': ..., 'M': ...}) of some rows of
+        character_data. Dates that only have a year are left out, as they do not match the granularity of the others.
+        """
+        births = character_data[['Actor birth year', 'Actor birth month']].dropna()
+        return {'Y': births.groupby('Actor birth year').size(), 'M': births.groupby('Actor birth month').size()}
+
+    def _is_extracted(self, extract_path):
+        """
+        Check whether the dataset is completely extracted, i.e. has the '.complete' marker written once the whole
+        archive went through. A directory without it may hold truncated files (an extraction that was cut off, or
+        one made before the marker existed), so it is downloaded again.
+        """
+        return os.path.exists(os.path.join(extract_path, '.complete'))
+
+    def _download_and_extract(self, download_link, download_path, extract_path, sha256=None):
+        """
+        Download the tar.gz file and extract it while it downloads.
+
+        The download is saved to '<download_path>.part' so that an interrupted download is resumed with an HTTP
+        range request. Files are extracted into a staging directory that only replaces 'extract_path' once the
+        whole archive went through (and matched 'sha256', if given), so a broken corpus is never left behind.
+        A '.part' file that already holds the whole archive (the server answers the range request with 416) is
+        extracted as it is, or downloaded again if it turns out to be broken.
+        """
+        # Local copies (paths or file:// URLs) are read in place, there is nothing to resume
+        if os.path.exists(download_link):
+            download_link = pathlib.Path(download_link).resolve().as_uri()
+        is_remote = not download_link.startswith('file:')
+
+        part_path = download_path + '.part'
+        staging_path = extract_path + '.partial'
+        os.makedirs(os.path.dirname(download_path) or '.', exist_ok=True)
+        shutil.rmtree(staging_path, ignore_errors=True)
+        os.makedirs(staging_path)
+
+        # Ask only for the missing bytes if a previous download was interrupted
+        resume_from = os.path.getsize(part_path) if is_remote and os.path.exists(part_path) else 0
+        request = urllib.request.Request(download_link)
+        if resume_from:
+            request.add_header('Range', f'bytes={resume_from}-')
+
+        print('Downloading the file')
+        complete = False
+        try:
+            response = urllib.request.urlopen(request, timeout=60)
+        except urllib.error.HTTPError as error:
+            # The range starts past the end of the file: the previous run stopped after the last byte arrived
+            if not (resume_from and error.code == 416):
+                raise
+            # Unless the '.part' file does not have the size of the file on the server ('Content-Range: */size')
+            size = (error.headers.get('Content-Range') or '').rpartition('/')[2]
+            if size.isdigit() and int(size) != resume_from:
+                print('The partial download does not match the file on the server, downloading it again')
+                os.remove(part_path)
+                return self._download_and_extract(download_link, download_path, extract_path, sha256)
+            print('The download is already complete')
+            response, complete = io.BytesIO(), True
+
+        with response:
+            # A server that ignores the range request sends the whole file again
+            resumed = complete or (resume_from > 0 and response.getcode() == 206)
+            if resumed and not complete:
+                print(f'Resuming the download after {resume_from / 2 ** 20:.1f} MiB')
+            length = resume_from if complete else response.headers.get('Content-Length')
+            total_size = int(length) + (resume_from if resumed and not complete else 0) if length else None
+
+            part_file = open(part_path, 'ab' if resumed else 'wb') if is_remote else None
+            resumed_file = open(part_path, 'rb') if resumed else None
+            try:
+                stream = DownloadStream(response, part_file, resumed_file, total_size)
+                with tarfile.open(fileobj=stream, mode='r|gz') as tar:
+                    print('Extracting the file')
+                    for member in tar:
+                        # The corpus is a flat list of files, anything else (directories, links) is skipped
+                        if member.isfile():
+                            self._extract_member(tar, member, staging_path)
+                stream.drain()
+            except (tarfile.TarError, EOFError):
+                if not complete:
+                    raise
+                broken = True
+            else:
+                broken = False
+            finally:
+                if part_file is not None:
+                    part_file.close()
+                if stream.resumed_file is not None:
+                    stream.resumed_file.close()
+
+        checksum = stream.hexdigest()
+        if complete and (broken or sha256 and checksum != sha256.lower()):
+            # Not the archive after all (e.g. a truncated or corrupted file), start the download over
+            print('The downloaded file is broken, downloading it again')
+            os.remove(part_path)
+            return self._download_and_extract(download_link, download_path, extract_path, sha256)
+        if sha256 and checksum != sha256.lower():
+            shutil.rmtree(staging_path, ignore_errors=True)
+            if is_remote:
+                os.remove(part_path)
+            raise ValueError(f'Checksum mismatch for {download_link}: expected {sha256}, got {checksum}')
+
+        with open(os.path.join(staging_path, '.complete'), 'w') as file:
+            file.write(checksum + '\n')
+
+        # Swap the complete extraction in, replacing an empty or broken directory
+        shutil.rmtree(extract_path, ignore_errors=True)
+        os.replace(staging_path, extract_path)
+        if is_remote:
+            os.remove(part_path)
+        print('Extracted the file')
+
+    def _extract_member(self, tar, member, staging_path):
+        """Write one file of the archive into the staging directory, atomically."""
+        target = os.path.join(staging_path, os.path.basename(member.name))  # never outside the staging directory
+        with tar.extractfile(member) as source, open(target + '.tmp', 'wb') as file:
+            shutil.copyfileobj(source, file)
+        os.replace(target + '.tmp', target)
 
     def _load_data(self, file_path, column_names):
-        """Load data from a file into a pandas DataFrame."""
+        """Load data from a file into a pandas DataFrame, using the columnar cache when it is up to date."""
+        if self.cache_path is None:
+            return self._read_tsv(file_path, column_names)
+
+        cache_file = os.path.join(self.cache_path, os.path.basename(file_path) + '.arrow')
+        manifest_file = cache_file + '.json'
+        stamp = file_stamp(file_path, column_names)
+
+        # Memory-map the cached table if it was built from this exact version of the source file
+        if os.path.exists(cache_file) and self._read_manifest(manifest_file) == stamp:
+            return self._read_cache(cache_file)
+
+        data = self._read_tsv(file_path, column_names)
+        try:
+            self._write_cache(data, cache_file, manifest_file, stamp)
+            return self._read_cache(cache_file)  # the same columns as on the later starts
+        except (OSError, ValueError, pa.ArrowException) as e:
+            # The cache is an optimisation only, a read-only checkout (or a column Arrow cannot store, e.g. with
+            # mixed types) must still work
+            print(f'Could not write the cache for {file_path}: {e}')
+            if os.path.exists(cache_file + '.tmp'):
+                os.remove(cache_file + '.tmp')
+        return data
+
+    def _read_cache(self, cache_file):
+        """Memory-map a cached table, converting its columns to pandas except the MAPPED_COLUMNS."""
+        table = feather.read_table(cache_file, memory_map=True)
+        mapped = [name for name in table.column_names if name in self.MAPPED_COLUMNS]
+        data = table.drop_columns(mapped).to_pandas()
+        for name in mapped:
+            # Wraps the Arrow buffers without copying them
+            strings = pd.arrays.ArrowStringArray(table[name].cast(pa.string()))
+            data.insert(table.column_names.index(name), name, pd.Series(strings, index=data.index))
+        return data
+
+    def _delta_files(self, name):
+        """Return the files of the rows added to a table with ingest, in the order they were added."""
+        if self.cache_path is None:
+            return []
+        delta_path = os.path.join(self.cache_path, self.TABLES[name][0] + '.deltas')
+        if not os.path.isdir(delta_path):
+            return []
+        return [os.path.join(delta_path, file_name) for file_name in sorted(os.listdir(delta_path))
+                if file_name.endswith('.arrow')]
+
+    def _write_delta(self, name, rows):
+        """
+        Store rows added to a table as a new delta segment of the cache, atomically, and return its path.
+        Segments are named after the time they are written plus a random suffix, and their files are created
+        exclusively, so two processes ingesting at the same time never overwrite each other's segment.
+        """
+        delta_path = os.path.join(self.cache_path, self.TABLES[name][0] + '.deltas')
+        os.makedirs(delta_path, exist_ok=True)
+        delta_file = os.path.join(delta_path, f'{time.time_ns():020d}-{uuid.uuid4().hex[:12]}.arrow')
+        with open(delta_file + '.tmp', 'xb') as file:
+            feather.write_feather(rows, file, compression='uncompressed')
+        os.replace(delta_file + '.tmp', delta_file)
+        return delta_file
+
+    def _align_types(self, rows, table):
+        """Cast the columns of new rows to the types of the same columns of the table, where possible."""
+        for column in rows.columns.intersection(table.columns):
+            if rows[column].dtype != table[column].dtype:
+                try:
+                    rows[column] = rows[column].astype(table[column].dtype)
+                except (TypeError, ValueError):
+                    pass  # e.g. text in a numeric column: concatenation falls back to a common type
+        return rows
+
+    def _parse_rows(self, name, rows):
+        """
+        Turn new rows of a table into a DataFrame parsed exactly like the files of the corpus.
+        rows is the path of a TSV file, a DataFrame with the columns of the table or a list of rows.
+        """
+        column_names = self.TABLES[name][1]
+        if isinstance(rows, (str, pathlib.Path)):
+            return self._read_tsv(rows, column_names)
+
+        if isinstance(rows, pd.DataFrame):
+            missing = [column for column in column_names if column not in rows.columns]
+            if missing:
+                raise ValueError(f"The new rows of {name} are missing the columns {missing}.")
+            rows = rows[column_names]
+        else:
+            rows = pd.DataFrame(list(rows), columns=column_names)
+
+        if rows.empty:
+            return rows
+
+        # Written and read back as TSV, so that the values get the same types as when the corpus is parsed
+        buffer = io.StringIO()
+        rows.to_csv(buffer, sep='\t', header=False, index=False)
+        buffer.seek(0)
+        parsed = self._read_tsv(buffer, column_names)
+        if not pd.api.types.is_integer_dtype(parsed['Wikipedia movie ID']):
+            raise ValueError(f"The new rows of {name} must all have an integer 'Wikipedia movie ID'.")
+        return parsed
+
+    def _read_tsv(self, file_path, column_names):
+        """Parse a TSV file into a pandas DataFrame."""
         return pd.read_csv(file_path, sep='\t', header=None, names=column_names)
 
+    def _read_manifest(self, manifest_file):
+        """Return the stamp stored next to a cached table, or None if there is none."""
+        try:
+            with open(manifest_file, 'r') as file:
+                return json.load(file)
+        except (OSError, ValueError):
+            return None
+
+    def _write_cache(self, data, cache_file, manifest_file, stamp):
+        """Write a table and its manifest to the cache, atomically so readers never see half a file."""
+        os.makedirs(self.cache_path, exist_ok=True)
+
+        # Uncompressed so that later reads can memory-map the file instead of decoding it
+        feather.write_feather(data, cache_file + '.tmp', compression='uncompressed')
+        os.replace(cache_file + '.tmp', cache_file)
+
+        # The manifest is written last, so a crash in between leaves a cache that is simply rebuilt
+        with open(manifest_file + '.tmp', 'w') as file:
+            json.dump(stamp, file)
+        os.replace(manifest_file + '.tmp', manifest_file)
+
+    @profiled('movie_data')
+    @cached_query('movie_data')
     def movie_type(self, N: int = 10):
         """
         This function is used to find the top 'N' most common movie types.
@@ -86,25 +1122,18 @@ class MovieAnalysis:
         if not isinstance(N, int):
             raise ValueError("N must be an integer")
 
-        movies = self.movie_data.copy()
-
-        # Uses ast to convert the string to a dictionary then converts the dictionary to a list wth lambda func
-        movies['Movie genres'] = movies['Movie genres'].apply(lambda x: list(ast.literal_eval(x).values()))
-
-        # explodes splits the list into separate rows and then value counts the number of each genre
-        genre_counts = movies.explode('Movie genres')['Movie genres'].value_counts()
-
-        return genre_counts.head(N)
+        # The genre counts are computed once when the genre index is built
+        return self.genre_index.counts.head(N)
 
+    @profiled('character_data')
+    @cached_query('character_data')
     def actor_count(self):
         """
         This function returns a pandas dataframe with a histogram of "number of actors" vs "movie counts".
         """
 
-        character_data = self.character_data.copy()
-
         # group by movies ID to get actor count
-        actors_per_movie = character_data.groupby('Freebase movie ID').agg(
+        actors_per_movie = self.character_data.groupby('Freebase movie ID').agg(
             actor_count=('Freebase actor ID', 'count')).reset_index()
 
         # group by actor count to get movie count and sort by actor count
@@ -113,6 +1142,7 @@ class MovieAnalysis:
 
         return movie_count
 
+    @profiled('character_data')
     def actor_distributions(self, gender: str, max_height: float, min_height: float, plot: bool = False):
         """
         Analyzes the height distribution of actors based on gender and height range.
@@ -142,17 +1172,29 @@ class MovieAnalysis:
             If min_height is greater than max_height.
         """
 
-        # Copy the data
-        character_data = self.character_data.copy()
+        self._check_height_arguments(gender, max_height, min_height)
+        if not isinstance(plot, bool):
+            raise TypeError("'plot' must be a boolean (True/False).")
 
-        # Convert height to numeric (to handle missing or incorrect values)
-        character_data['Actor height'] = pd.to_numeric(character_data['Actor height'], errors='coerce')
+        filtered_data = self._height_range(gender, min_height, max_height)
 
-        # convert 180 and 510 to 1.8 and 1.78 these are the only two values that are not in meters
-        character_data['Actor height'] = character_data['Actor height'].replace({180: 1.8, 510: 1.78})
+        # Plot the histogram from the pre-binned counts, not from the rows
+        if plot:
+            import matplotlib.pyplot as plt  # imported here, headless use of the analysis never pays for it
+            histogram = self.height_histogram(gender, max_height, min_height)
+            edges = np.append(histogram['Height from'].to_numpy(), histogram['Height to'].to_numpy()[-1:])
+            plt.hist(edges[:-1], bins=edges, weights=histogram['Actor count'], edgecolor='black')
+            plt.xlabel('Height (m)')
+            plt.ylabel('Frequency')
+            plt.title(f'Actor Height Distribution ({gender})')
+            plt.show()
 
-        # Get unique gender values
-        unique_genders = character_data['Actor gender'].dropna().unique().tolist()
+        return filtered_data
+
+    def _check_height_arguments(self, gender, max_height, min_height):
+        """Raise a TypeError or ValueError if the gender or height range of a height query is invalid."""
+        # Gender values are collected once at load time
+        unique_genders = self.actor_genders
 
         # Check argument types
         if not isinstance(gender, str):
@@ -161,8 +1203,6 @@ class MovieAnalysis:
             raise TypeError("'max_height' must be a numerical value.")
         if not isinstance(min_height, (int, float)):
             raise TypeError("'min_height' must be a numerical value.")
-        if not isinstance(plot, bool):
-            raise TypeError("'plot' must be a boolean (True/False).")
 
         # Check argument values
         if min_height > max_height:
@@ -170,29 +1210,68 @@ class MovieAnalysis:
         if gender not in unique_genders and gender != 'All':
             raise ValueError(f"'gender' must be either one of {unique_genders} or 'All'.")
 
-        # Apply height range filter
-        filtered_data = character_data[
-            (character_data['Actor height'] >= min_height) & (character_data['Actor height'] <= max_height)
-            ]
+    @profiled('character_data')
+    @cached_query('character_data')
+    def height_histogram(self, gender: str, max_height: float, min_height: float, bins=30):
+        """
+        Returns the histogram of the heights of the actors of a gender in a height range, as bins and counts.
+        The counts come from the sorted heights of the height index, so the size of the result and the time to
+        compute it do not depend on the number of matching actors.
+
+        Parameters:
+        -----------
+        gender : str
+            "All" or any distinct non-missing value of 'Actor gender'.
+        max_height : float
+            The upper limit for actor height, in meters.
+        min_height : float
+            The lower limit for actor height, in meters.
+        bins : int, str or sequence, optional (default=30)
+            Number of equal-width bins between the smallest and largest matching heights, an adaptive rule
+            ('fd' for Freedman-Diaconis, 'sturges' or 'auto') or the bin edges, like in np.histogram.
+
+        Returns:
+        --------
+        pd.DataFrame
+            One row per bin with its edges ('Height from', 'Height to') and its 'Actor count', the same counts as
+            np.histogram of the heights of actor_distributions. Empty if no actor matches.
+
+        Raises:
+        -------
+        TypeError
+            If gender is not a string or if max_height/min_height are not numerical values.
+        ValueError
+            If min_height is greater than max_height or bins is not valid.
+        """
+        self._check_height_arguments(gender, max_height, min_height)
+        if isinstance(bins, bool) or (isinstance(bins, int) and bins < 1):
+            raise ValueError("'bins' must be a positive number of bins.")
+
+        edges = self.height_index.bin_edges(gender, min_height, max_height, bins)
+        if len(edges) < 2:
+            return pd.DataFrame({'Height from': pd.Series(dtype=float), 'Height to': pd.Series(dtype=float),
+                                 'Actor count': pd.Series(dtype=np.int64)})
+
+        counts = self.height_index.histogram(gender, edges, min_height, max_height)
+        return pd.DataFrame({'Height from': edges[:-1], 'Height to': edges[1:], 'Actor count': counts})
 
-        # Apply gender filter
-        if gender != 'All':
-            filtered_data = filtered_data[filtered_data['Actor gender'] == gender]
+    def _height_range(self, gender, min_height, max_height):
+        """Return the gender and height of the actors of a gender ('All' for every one) in a height range."""
+        # Binary search in the height index instead of masking the whole table
+        positions = self.height_index.positions(gender, min_height, max_height)
+
+        # Only the matching rows of the two columns are materialised
+        columns = self.character_data.columns.get_indexer(['Actor gender', 'Actor height'])
+        filtered_data = self.character_data.iloc[positions, columns]
 
         # If no data remains after filtering, return an empty DataFrame
         if filtered_data.empty:
             return pd.DataFrame(columns=['Actor gender', 'Actor height'])
 
-        # Plot the histogram
-        if plot:
-            plt.hist(filtered_data['Actor height'], bins=30, edgecolor='black')
-            plt.xlabel('Height (m)')
-            plt.ylabel('Frequency')
-            plt.title(f'Actor Height Distribution ({gender})')
-            plt.show()
-
-        return filtered_data[['Actor gender', 'Actor height']]
+        return filtered_data
 
+    @profiled('movie_data')
+    @cached_query('movie_data')
     def releases(self, genre: str = None):
         """
         Returns a DataFrame with the number of movie releases per year.
@@ -208,34 +1287,114 @@ class MovieAnalysis:
         pd.DataFrame
             A DataFrame with columns ['Year', 'Movie Count'] showing the number of movies released per year.
         """
-        # Copy the data
-        movies = self.movie_data.copy()
+        # Release years are counted per genre once at load time in the release cube, kept up to date by ingest
+        releases_per_year = self.release_stats(genres=genre or None)[['Year', 'Movie Count']]
 
-        # Convert release date to numeric (some might be missing or invalid)
-        movies['Movie release date'] = pd.to_numeric(movies['Movie release date'], errors='coerce')
+        return releases_per_year
 
-        # Drop rows where the year is NaN
-        movies = movies.dropna(subset=['Movie release date'])
+    @profiled('movie_data')
+    @cached_query('movie_data')
+    def release_stats(self, genres=None, countries=None, languages=None):
+        """
+        Returns the number of movies released per year, with their total box office revenue and runtime, for any
+        combination of genres, countries and languages.
 
-        # Convert year to integer
-        movies['Year'] = movies['Movie release date'].astype(int)
+        Parameters:
+        -----------
+        genres : str or list of str, optional
+            Only the movies of at least one of these genres are included. If None, all genres are included.
+        countries : str or list of str, optional
+            Only the movies of at least one of these countries are included.
+        languages : str or list of str, optional
+            Only the movies in at least one of these languages are included.
 
-        # Filter by genre if provided
-        if genre:
-            try:
-                # Convert genre column from string dictionary to list of genres
-                movies['Movie genres'] = movies['Movie genres'].apply(lambda x: list(ast.literal_eval(x).values()))
+        Returns:
+        --------
+        pd.DataFrame
+            A DataFrame with columns ['Year', 'Movie Count', 'Box Office Revenue', 'Total Runtime'], one row per
+            year with at least one movie. Missing revenues and runtimes count as 0.
 
-                # Keep only movies that contain the selected genre
-                movies = movies[movies['Movie genres'].apply(lambda x: genre in x)]
-            except Exception as e:
-                raise ValueError(f"Error processing genre filtering: {e}")
+        Raises:
+        -------
+        TypeError
+            If a filter is not a string or a list of strings.
+        """
+        selection = {}
+        for dimension, labels in [('genre', genres), ('country', countries), ('language', languages)]:
+            if labels is None:
+                continue
+            labels = [labels] if isinstance(labels, str) else labels
+            if not isinstance(labels, (list, tuple)) or not all(isinstance(label, str) for label in labels):
+                raise TypeError(f"'{dimension}' filters must be a string or a list of strings.")
+            selection[dimension] = labels
+
+        # Array lookups in the release cube instead of a scan of movie_data
+        cube = self.release_cube
+        values = cube.per_year(selection)
+        released = values['Movie Count'] > 0
+        return pd.DataFrame({'Year': cube.years[released],
+                             **{measure: values[measure][released] for measure in cube.MEASURES}})
+
+    @profiled('movie_data')
+    @cached_query('movie_data')
+    def top_genres_by_decade(self, N: int = 5, measure: str = 'Movie Count'):
+        """
+        Returns the top 'N' genres of every decade of release.
 
-        # Count movies per year
-        releases_per_year = movies.groupby('Year').size().reset_index(name='Movie Count')
+        Parameters:
+        -----------
+        N : int, optional (default=5)
+            Number of genres per decade.
+        measure : str, optional (default='Movie Count')
+            What the genres are ranked by: 'Movie Count', 'Box Office Revenue' or 'Total Runtime'.
 
-        return releases_per_year
+        Returns:
+        --------
+        pd.DataFrame
+            A DataFrame with columns ['Decade', 'Genre', measure], the decades in order and the genres of a decade
+            from the highest value down. Genres without any movie in a decade are left out.
 
+        Raises:
+        -------
+        ValueError
+            If N is not a positive integer or measure is not one of the measures above.
+        """
+        if not isinstance(N, int) or N < 1:
+            raise ValueError("N must be a positive integer")
+        if measure not in ReleaseCube.MEASURES:
+            raise ValueError(f"'measure' must be one of {list(ReleaseCube.MEASURES)}.")
+
+        # Column sums of the (genres x years) arrays, then the top N rows of every decade column
+        cube = self.release_cube
+        decades, values = cube.by_decade('genre', measure)
+        counts = cube.by_decade('genre', 'Movie Count')[1]
+        genres = cube.indexes['genre'].categories
+        tops = []
+        for column, decade in enumerate(decades):
+            top = np.argsort(-values[:, column], kind='stable')[:N]
+            top = top[counts[top, column] > 0]
+            tops.append(pd.DataFrame({'Decade': decade, 'Genre': genres[top], measure: values[top, column]}))
+        return pd.concat(tops, ignore_index=True) if tops else pd.DataFrame(columns=['Decade', 'Genre', measure])
+
+    @profiled('movie_data')
+    def filter_options(self):
+        """
+        Returns the values the pages of the app offer to filter the movies by, in one call.
+
+        Returns:
+        --------
+        dict: {'genres': list, 'countries': list, 'languages': list, 'release_years': (int, int)}
+            The genres from the most common, the countries and languages in alphabetical order,
+            and the first and last known release years.
+        """
+        release_years = self.movie_data['Movie release year'].dropna()
+        return {'genres': self.genre_index.counts.index.tolist(),
+                'countries': sorted(self.release_cube.labels('country')),
+                'languages': sorted(self.release_cube.labels('language')),
+                'release_years': (int(release_years.min()), int(release_years.max()))}
+
+    @profiled('character_data')
+    @cached_query('character_data')
     def ages(self, mode: str = 'Y'):
         """
         Returns a DataFrame with the number of actor births per year or month.
@@ -253,76 +1412,504 @@ class MovieAnalysis:
             - ['Year', 'Birth Count'] (if mode='Y')
             - ['Month', 'Birth Count'] (if mode='M')
         """
-        # Copy the data
-        actors = self.character_data.copy()
-
-        # Conversion to datetime
-        actors = actors.dropna(subset=['Actor date of birth'])
-
-        # detect the date format (datetime directives) using detect_date_format function
-        actors['date_format'] = actors['Actor date of birth'].astype('str').apply(detect_date_format)
-        
-        # filter out the '%Y' format as it does not match the granularity 
-        actors = actors[actors['date_format'] != '%Y']
-        
-        # convert the date of birth to datetime
-        actors['Actor date of birth'] = actors.apply(
-            lambda row: pd.to_datetime(row['Actor date of birth'], format=row['date_format'], errors='coerce'),
-            axis=1
-        )
-        
-        # Extract year and month
-        actors['Year'] = actors['Actor date of birth'].dt.year
-        actors['Month'] = actors['Actor date of birth'].dt.month
-
         # Handle incorrect input
         if mode not in ['Y', 'M']:
             mode = 'Y'  # Default to Year if invalid input
 
-        # Group by Year or Month
+        # Births are counted per year and month once at load time (dates that only have a year are left out,
+        # as they do not match the granularity of the others) and kept up to date by ingest
         if mode == 'Y':
-            result = actors.groupby('Year').size().reset_index(name='Birth Count')
+            result = self.birth_counts['Y'].rename_axis('Year').reset_index(name='Birth Count')
         else:
-            result = actors.groupby('Month').size().reset_index(name='Birth Count')
+            result = self.birth_counts['M'].rename_axis('Month').reset_index(name='Birth Count')
 
         return result
 
-    def get_random_movie(self):
+    @profiled('movie_data', 'character_data')
+    def aggregates(self, workers: int = None, height_edges=None):
+        """
+        Computes the results of actor_count, ages('Y'), ages('M'), releases and the height histograms of every
+        gender in a single pass, split across worker processes (see MovieAggregation.ParallelAggregator).
+
+        Parameters:
+        -----------
+        workers : int, optional
+            Number of worker processes. Defaults to the number of CPUs.
+        height_edges : array-like, optional
+            Edges of the height histogram bins, in meters. Defaults to 30 bins between 1.0 and 2.2 m.
+
+        Returns:
+        --------
+        dict: {'actor_count', 'height_histograms', 'births_per_year', 'births_per_month', 'releases'}
+        """
+        with ParallelAggregator(self, workers=workers) as aggregator:
+            return aggregator.run(height_edges)
+
+    def ingest(self, new_movie_rows=None, new_character_rows=None, new_summaries=None):
+        """
+        Appends new rows to the corpus, e.g. movies that are not in the CMU dataset.
+
+        The rows are stored as delta segments of the columnar cache (Downloads/cache/<file>.deltas), which are
+        added to the corpus every time it is loaded, and the files of the corpus are left untouched. The indexes
+        and counts (genre, language and country indexes, releases per year, births per year and month, height
+        index, ID indexes and the search index) are updated with the new rows only, and the version of every
+        changed table is bumped, so that only the cached results that depend on it are computed again.
+
+        Parameters:
+        -----------
+        new_movie_rows, new_character_rows, new_summaries : optional
+            New rows of movie_data, character_data and movie_summaries, in the format of movie.metadata.tsv,
+            character.metadata.tsv and plot_summaries.txt: the path of such a TSV file, a DataFrame with the
+            column names of the table (see TABLES) or a list of rows with the values in the order of the columns.
+
+        Returns:
+        --------
+        dict: the number of rows added to every table.
+
+        Raises:
+        -------
+        ValueError
+            If a DataFrame lacks columns of the table or a row has no integer Wikipedia movie ID.
+        """
+        added = {}
+        for name, rows in [('movie_data', new_movie_rows), ('character_data', new_character_rows),
+                           ('movie_summaries', new_summaries)]:
+            if rows is None:
+                continue
+            rows = self._parse_rows(name, rows)
+            added[name] = len(rows)
+            if rows.empty:
+                continue
+
+            self._get_table(name)
+            with self._table_locks[name]:
+                # Persisted as parsed, the derived columns are computed again on every load
+                if self.cache_path is not None:
+                    self._deltas[name] = self._deltas[name] + [self._write_delta(name, rows)]
+                getattr(self, f'_ingest_{name}')(self._tables[name], rows.copy())
+
+                # Bumped once the new rows are in, so no result of the old rows is cached under the new version.
+                # Without a cache the new rows are only in memory, a random stamp tells the versions apart.
+                old_version = self.table_versions[name]
+                deltas = delta_stamp(self._deltas[name]) if self.cache_path is not None else uuid.uuid4().hex[:16]
+                self.table_versions[name] = (*old_version[:2], deltas)
+
+            if name == 'movie_summaries':
+                self._extend_search_index(rows, old_version)
+        return added
+
+    def _ingest_movie_data(self, movie_data, rows):
+        """Append rows to movie_data, updating its indexes and counts with the new rows only."""
+        self._derive_movie_columns(rows)
+        first_row = len(movie_data)
+        genre_index = self.genre_index.extend(rows['Movie genres'])
+        language_index = self.language_index.extend(rows['Movie languages'])
+        country_index = self.country_index.extend(rows['Movie countries'])
+        movie_id_index = self.movie_id_index.extend(rows['Wikipedia movie ID'], first_row)
+        release_cube = self.release_cube.extend(
+            rows['Movie release year'], rows['Movie box office revenue'], rows['Movie runtime'],
+            {'genre': genre_index, 'country': country_index, 'language': language_index})
+
+        self._tables['movie_data'] = pd.concat([movie_data, self._align_types(rows, movie_data)], ignore_index=True)
+        self.genre_index, self.language_index, self.country_index = genre_index, language_index, country_index
+        self.movie_id_index, self.release_cube = movie_id_index, release_cube
+
+    def _ingest_character_data(self, character_data, rows):
+        """Append rows to character_data, updating its indexes and counts with the new rows only."""
+        self._derive_character_columns(rows)
+        actor_genders = self.actor_genders + [gender for gender in rows['Actor gender'].dropna().unique()
+                                              if gender not in self.actor_genders]
+        height_index = self.height_index.extend(rows['Actor height'], rows['Actor gender'], len(character_data))
+        new_births = self._birth_counts(rows)
+        birth_counts = {mode: self.birth_counts[mode].add(new_births[mode], fill_value=0).sort_index().astype(np.int64)
+                        for mode in ['Y', 'M']}
+
+        self._tables['character_data'] = pd.concat([character_data, self._align_types(rows, character_data)],
+                                                   ignore_index=True)
+        self.actor_genders, self.height_index, self.birth_counts = actor_genders, height_index, birth_counts
+
+    def _ingest_movie_summaries(self, movie_summaries, rows):
+        """Append rows to movie_summaries, updating its ID index with the new rows only."""
+        summary_id_index = self.summary_id_index.extend(rows['Wikipedia movie ID'], len(movie_summaries))
+        self._tables['movie_summaries'] = pd.concat([movie_summaries, self._align_types(rows, movie_summaries)],
+                                                    ignore_index=True)
+        self.summary_id_index = summary_id_index
+
+    def _extend_search_index(self, rows, old_version):
+        """Add new summaries to the search index as a new segment, if the index was up to date before them."""
+        with self._search_lock:
+            index = self._search_index or SearchIndex(self.search_path)
+            if index.manifest['version'] == list(old_version):
+                index.add(rows['Wikipedia movie ID'].to_numpy(), rows['Plot summary'].to_numpy())
+                index.set_version(list(self.table_versions['movie_summaries']))
+                self._search_index = index
+
+    def cache_info(self):
+        """
+        Returns the statistics of the result cache.
+
+        Returns:
+        --------
+        dict: {'hits', 'misses', 'evictions', 'entries', 'bytes', 'max_bytes'}, or None if the cache is disabled.
+        """
+        return self.result_cache.info() if self.result_cache is not None else None
+
+    def get_movie(self, movie_id):
+        """
+        Returns the title, summary and genres of a movie.
+
+        Parameters:
+        -----------
+        movie_id : int
+            The Wikipedia movie ID of the movie.
+
+        Returns:
+        --------
+        dict: {'id': int, 'title': str, 'summary': str, 'genres': list}
+            The title is "Unknown" (and the genres ["Unknown"]) if the movie has no metadata,
+            the summary is None if it has no plot summary.
+
+        Raises:
+        -------
+        KeyError
+            If the movie is neither in the metadata nor in the plot summaries.
+        """
+        movie = self.get_movies([movie_id])[0]
+        if movie is None:
+            raise KeyError(f"Unknown movie ID: {movie_id}")
+        return movie
+
+    @profiled('movie_data', 'movie_summaries')
+    def get_movies(self, movie_ids):
+        """
+        Returns the title, summary and genres of several movies at once.
+
+        Parameters:
+        -----------
+        movie_ids : list
+            The Wikipedia movie IDs of the movies.
+
+        Returns:
+        --------
+        list
+            One dict per ID, in order, as returned by get_movie, or None for IDs that are not in the dataset.
+        """
+        # One hash lookup per ID and table instead of scanning the tables
+        movie_rows = self.movie_id_index.positions(movie_ids)
+        summary_rows = self.summary_id_index.positions(movie_ids)
+        titles = self.movie_data['Movie name'].to_numpy()
+
+        # Only the summaries of the movies are read (the column can be memory-mapped, see MAPPED_COLUMNS)
+        summaries = np.full(len(summary_rows), None, dtype=object)
+        found = summary_rows >= 0
+        rows = summary_rows[found]
+        summaries[found] = self.movie_summaries['Plot summary'].take(rows).to_numpy(dtype=object, na_value=None)
+
+        movies = []
+        for position, (movie_id, movie_row, summary_row) in enumerate(zip(movie_ids, movie_rows, summary_rows)):
+            if movie_row < 0 and summary_row < 0:
+                movies.append(None)
+                continue
+            movies.append({
+                "id": movie_id,
+                "title": titles[movie_row] if movie_row >= 0 else "Unknown",
+                "summary": summaries[position],
+                "genres": self.genre_index.labels_of(movie_row) if movie_row >= 0 else ["Unknown"]
+            })
+        return movies
+
+    @cached_query('movie_data', 'movie_summaries')
+    def _described_movies(self, genre):
+        """Return the IDs of the movies that have both metadata and a plot summary (and the genre, if given)."""
+        movie_ids = self.summary_id_index.ids.to_numpy()
+        movie_ids = movie_ids[self.movie_id_index.positions(movie_ids) >= 0]
+        if genre:
+            genre_ids = self.movie_data['Wikipedia movie ID'].to_numpy()[self.genre_index.rows_with(genre)]
+            movie_ids = movie_ids[np.isin(movie_ids, genre_ids)]
+        return movie_ids
+
+    def _get_search_index(self):
+        """Return the full-text index of the plot summaries, opening it or (re)building it if it is out of date."""
+        with self._search_lock:
+            version = list(self.table_versions['movie_summaries'])
+            if self._search_index is None or self._search_index.manifest['version'] != version:
+                index = SearchIndex(self.search_path)
+                if index.manifest['version'] != version:
+                    print("Building the search index of the plot summaries...")
+                    summaries = self.movie_summaries
+                    index = SearchIndex.build(self.search_path, summaries['Wikipedia movie ID'].to_numpy(),
+                                              summaries['Plot summary'].to_numpy(), version)
+                self._search_index = index
+            return self._search_index
+
+    @profiled('movie_data')
+    def search(self, query: str, genre: str = None, years=None, k: int = 10):
+        """
+        Full-text search of the plot summaries, ranked with BM25.
+
+        Parameters:
+        -----------
+        query : str
+            The words to look for.
+        genre : str, optional
+            Only return movies of this genre.
+        years : int or tuple, optional
+            Only return movies released this year, or between (first year, last year) included.
+        k : int, optional (default=10)
+            Maximum number of results.
+
+        Returns:
+        --------
+        pd.DataFrame
+            A DataFrame with columns ['Wikipedia movie ID', 'Movie name', 'Movie release year', 'Score'],
+            best match first.
+
+        Raises:
+        -------
+        ValueError
+            If k is not a positive integer or years is not a year or a pair of years.
+        """
+        if not isinstance(k, int) or k <= 0:
+            raise ValueError("k must be a positive integer.")
+
+        # Filters are applied to the metadata, the index only stores the postings of the summaries
+        allowed_ids = None
+        if genre or years is not None:
+            rows = np.arange(len(self.movie_data))
+            if genre:
+                rows = self.genre_index.rows_with(genre)
+            if years is not None:
+                if isinstance(years, int):
+                    years = (years, years)
+                if not isinstance(years, (tuple, list)) or len(years) != 2:
+                    raise ValueError("years must be a year or a (first year, last year) pair.")
+                release_years = self.movie_data['Movie release year'].to_numpy(dtype=float, na_value=np.nan)[rows]
+                rows = rows[(release_years >= years[0]) & (release_years <= years[1])]
+            allowed_ids = self.movie_data['Wikipedia movie ID'].to_numpy()[rows]
+
+        hits = self._get_search_index().search(query, k=k, allowed_ids=allowed_ids)
+        movie_ids = [movie_id for movie_id, _ in hits]
+        movie_rows = self.movie_id_index.positions(movie_ids)
+        titles = self.movie_data['Movie name'].to_numpy()
+        release_years = self.movie_data['Movie release year'].to_numpy()
+
+        return pd.DataFrame({
+            'Wikipedia movie ID': movie_ids,
+            'Movie name': [titles[row] if row >= 0 else "Unknown" for row in movie_rows],
+            'Movie release year': pd.array([release_years[row] if row >= 0 else pd.NA for row in movie_rows],
+                                           dtype='Int32'),
+            'Score': [score for _, score in hits],
+        })
+
+    @profiled('movie_data', 'movie_summaries')
+    def get_random_movie(self, seed: int = None, genre: str = None):
         """
         Selects a random movie from the dataset and returns its title, summary, and genres.
+        Only movies that have both metadata and a plot summary are picked.
+
+        Parameters:
+        -----------
+        seed : int, optional
+            Seed for the random choice, to get reproducible picks. If None, the global random state is used.
+        genre : str, optional
+            Only pick movies of this genre.
 
         Returns:
         --------
-        dict: {'title': str, 'summary': str, 'genres': list}
+        dict: {'id': int, 'title': str, 'summary': str, 'genres': list}
+
+        Raises:
+        -------
+        ValueError
+            If no movie matches the genre.
         """
-        # Pick a random index
-        movie_idx = random.randint(0, len(self.movie_summaries) - 1)
+        movie_ids = self._described_movies(genre)
+        if len(movie_ids) == 0:
+            raise ValueError(f"No movie with a plot summary matches the genre {genre!r}.")
 
-        # Extract movie details
-        movie_id = self.movie_summaries.iloc[movie_idx]['Wikipedia movie ID']
-        movie_summary = self.movie_summaries.iloc[movie_idx]['Plot summary']
-        movie_title = self.movie_data.loc[self.movie_data['Wikipedia movie ID'] == movie_id, 'Movie name'].values
+        # Pick a random movie
+        rng = random.Random(seed) if seed is not None else random
+        movie_id = movie_ids[rng.randrange(len(movie_ids))].item()
 
-        # Get the movie genres (stored as a dictionary)
-        movie_genres = self.movie_data.loc[
-            self.movie_data['Wikipedia movie ID'] == movie_id, 'Movie genres'
-        ].values
+        return self.get_movie(movie_id)
 
-        # Extract the genre list
-        if len(movie_genres) > 0:
-            try:
-                movie_genres = list(ast.literal_eval(movie_genres[0]).values())  # Convert from dict to list
-            except (ValueError, SyntaxError):
-                movie_genres = ["Unknown"]
-        else:
-            movie_genres = ["Unknown"]
+    @profiled('movie_data', 'movie_summaries')
+    def sample_movies(self, n: int = None, seed: int = None, genre: str = None):
+        """
+        Selects several random movies at once, without repetition, among the movies that have both metadata
+        and a plot summary.
+
+        Parameters:
+        -----------
+        n : int, optional
+            Number of movies. If None or larger than the number of candidates, every candidate is returned.
+        seed : int, optional
+            Seed for the random choice, to get reproducible samples.
+        genre : str, optional
+            Only pick movies of this genre.
+
+        Returns:
+        --------
+        list
+            One dict per movie, as returned by get_movie.
+        """
+        movie_ids = self._described_movies(genre)
+        if n is not None and n < len(movie_ids):
+            movie_ids = np.random.default_rng(seed).choice(movie_ids, size=n, replace=False)
+        return self.get_movies(movie_ids.tolist())
+
+    def _get_actor_graph(self):
+        """Return the actor graph, building it on first use and again when one of its tables changed."""
+        with self._graph_lock:
+            version = tuple(self.table_versions[name] for name in self.GRAPH_TABLES)
+            if self._actor_graph is None or self._actor_graph.version != version:
+                graph = ActorGraph(self.character_data, self.tvtropes_clusters, self.name_clusters)
+                graph.version = version
+                self._actor_graph = graph
+            return self._actor_graph
+
+    def _movie_columns(self, movie_ids, columns):
+        """Return the given movie_data columns of some movies (by Wikipedia movie ID), missing for unknown movies."""
+        rows = self.movie_id_index.positions(movie_ids)
+        known = rows >= 0
+        return {column: self.movie_data[column].iloc[np.maximum(rows, 0)].reset_index(drop=True).where(known)
+                for column in columns}
+
+    @profiled('character_data')
+    @cached_query('character_data', 'tvtropes_clusters', 'name_clusters', 'movie_data')
+    def filmography(self, actor: str):
+        """
+        Returns the characters an actor played, with their movie, character types and name cluster.
+
+        Parameters:
+        -----------
+        actor : str
+            The Freebase actor ID (e.g. '/m/0f4vbz') or the name of the actor.
+
+        Returns:
+        --------
+        pd.DataFrame
+            A DataFrame with columns ['Wikipedia movie ID', 'Movie name', 'Movie release year', 'Character name',
+            'Character types', 'Name cluster'], sorted by release year. 'Character types' lists the tvtropes
+            types of the character.
+
+        Raises:
+        -------
+        ValueError
+            If there is no such actor.
+        """
+        graph = self._get_actor_graph()
+        rows = graph.rows_of_actor(graph.actor_code(actor))
+        movie_ids = self.character_data['Wikipedia movie ID'].to_numpy()[rows]
+        movies = self._movie_columns(movie_ids, ['Movie name', 'Movie release year'])
+
+        result = pd.DataFrame({
+            'Wikipedia movie ID': movie_ids,
+            'Movie name': movies['Movie name'],
+            'Movie release year': movies['Movie release year'],
+            'Character name': self.character_data['Character name'].to_numpy()[rows],
+            'Character types': graph.tropes_of_rows(rows),
+            'Name cluster': graph.name_clusters_of_rows(rows),
+        })
+        return result.sort_values('Movie release year', kind='stable').reset_index(drop=True)
+
+    @profiled('character_data')
+    @cached_query('character_data', 'tvtropes_clusters', 'name_clusters')
+    def top_co_stars(self, actor: str, N: int = 10):
+        """
+        Returns the 'N' actors who played in the most movies with an actor.
+
+        Parameters:
+        -----------
+        actor : str
+            The Freebase actor ID or the name of the actor.
+        N : int, optional (default=10)
+            Number of co-stars.
+
+        Returns:
+        --------
+        pd.DataFrame
+            A DataFrame with columns ['Freebase actor ID', 'Actor name', 'Shared movies'], most shared movies first.
+
+        Raises:
+        -------
+        ValueError
+            If there is no such actor or N is not a positive integer.
+        """
+        if not isinstance(N, int) or N < 1:
+            raise ValueError("N must be a positive integer")
+
+        graph = self._get_actor_graph()
+        co_stars, shared = graph.top_co_stars(graph.actor_code(actor), N)
+        return pd.DataFrame({'Freebase actor ID': graph.actor_ids[co_stars], 'Actor name': graph.actor_names[co_stars],
+                             'Shared movies': shared})
 
-        return {
-            "title": movie_title[0] if len(movie_title) > 0 else "Unknown",
-            "summary": movie_summary,
-            "genres": movie_genres
-        }
+    @profiled('character_data')
+    @cached_query('character_data', 'tvtropes_clusters', 'name_clusters')
+    def actor_neighborhood(self, actor: str, k: int = 2):
+        """
+        Returns the actors connected to an actor by at most 'k' co-star links (k=1: their co-stars, k=2: also
+        the co-stars of their co-stars, ...).
+
+        Parameters:
+        -----------
+        actor : str
+            The Freebase actor ID or the name of the actor.
+        k : int, optional (default=2)
+            Maximum number of links.
+
+        Returns:
+        --------
+        pd.DataFrame
+            A DataFrame with columns ['Freebase actor ID', 'Actor name', 'Distance'], the closest actors first.
+
+        Raises:
+        -------
+        ValueError
+            If there is no such actor or k is not a positive integer.
+        """
+        if not isinstance(k, int) or k < 1:
+            raise ValueError("k must be a positive integer")
+
+        graph = self._get_actor_graph()
+        actors, distances = graph.neighborhood(graph.actor_code(actor), k)
+        return pd.DataFrame({'Freebase actor ID': graph.actor_ids[actors], 'Actor name': graph.actor_names[actors],
+                             'Distance': distances})
+
+    @profiled('character_data')
+    @cached_query('character_data', 'tvtropes_clusters', 'name_clusters', 'movie_data')
+    def trope_distribution(self, actor: str = None, genre: str = None):
+        """
+        Returns the number of characters of every tvtropes character type, among all the characters of the
+        clusters, the characters of an actor or the characters of the movies of a genre.
+
+        Parameters:
+        -----------
+        actor : str, optional
+            The Freebase actor ID or the name of the actor.
+        genre : str, optional
+            The genre of the movies.
+
+        Returns:
+        --------
+        pd.DataFrame
+            A DataFrame with columns ['Character type', 'Character count'], the most common type first.
+
+        Raises:
+        -------
+        ValueError
+            If there is no such actor.
+        """
+        graph = self._get_actor_graph()
+        actor_code = graph.actor_code(actor) if actor is not None else None
+        movie_codes = None
+        if genre:
+            genre_movie_ids = self.movie_data['Wikipedia movie ID'].to_numpy()[self.genre_index.rows_with(genre)]
+            movie_codes = graph.movie_ids.get_indexer(genre_movie_ids)
+            movie_codes = movie_codes[movie_codes >= 0]
 
+        counts = graph.trope_counts(actor_code, movie_codes)
+        return pd.DataFrame({'Character type': counts.index.to_numpy(dtype=object), 'Character count': counts.to_numpy()})
 
 if __name__ == '__main__':
     test = MovieAnalysis()
@@ -1,11 +1,11 @@
+import os
 import sys
-from MovieAnalysis import MovieAnalysis
+from MovieProfiler import PROFILER
 import streamlit as st
-import matplotlib.pyplot as plt
-import ollama
 import json
 
-# Load configuration
+# Load configuration, read once per app process instead of on every rerun
+@st.cache_data
 def load_config():
     with open("config.json", "r") as file:
         return json.load(file)
@@ -13,20 +13,53 @@ def load_config():
 config = load_config()
 MODEL_NAME = config["ollama"]["model"]  # Get model name for Ollama to run the AI model
 
-def jaccard_similarity(set1, set2):
-    """Compute Jaccard similarity between two sets"""
-    intersection = set1.intersection(set2)
-    union = set1.union(set2)
-    return len(intersection) / len(union) if union else 0
+# Timings are off unless enabled in config.json (or with MOVIE_PROFILE=1)
+if config.get("profiling", {}).get("enabled"):
+    PROFILER.enable(config["profiling"].get("log_path"))
 
-# Initialize the MovieAnalysis instance
-analysis = MovieAnalysis()
+# Initialize the MovieAnalysis instance, shared by every session and rerun of the app
+# With a service URL (see "service" in config.json, or MOVIE_SERVICE_URL), the app queries the warm analysis of
+# MovieService.py instead, so it never loads the tables itself
+SERVICE_URL = os.environ.get("MOVIE_SERVICE_URL") or config.get("service", {}).get("url")
+
+@st.cache_resource
+def load_analysis():
+    if SERVICE_URL:
+        from MovieService import AnalysisClient
+        return AnalysisClient(SERVICE_URL)
+
+    # The dataset can be provisioned from a local mirror, see "dataset" in config.json
+    # Tables are loaded in the background so the first page renders before the plot summaries are read
+    from MovieAnalysis import MovieAnalysis
+    return MovieAnalysis(prefetch=True, **config.get("dataset", {}))
+
+analysis = load_analysis()
+
+# The classifiers (and the LLM response cache) are shared the same way
+@st.cache_resource
+def get_llm():
+    from MovieClassifier import LLMGenreClassifier
+    return LLMGenreClassifier.from_config(config)
+
+@st.cache_resource
+def get_classifier(engine):
+    # With the service, the TF-IDF model is trained (if it was never saved) by the service, which has the tables
+    from MovieClassifier import load_classifier
+    return load_classifier({**config, "classifier": {**config.get("classifier", {}), "engine": engine}}, analysis)
+
+ENGINES = {"tfidf": "TF-IDF (local, LLM as fallback)", "llm": "LLM (Ollama)"}
 
 st.title("Movie Data Analysis - Group_25")
-page = st.sidebar.selectbox("Choose a page", ["Main Analysis", "Chronological Info", "AI Classification"])
+page = st.sidebar.selectbox("Choose a page", ["Main Analysis", "Chronological Info", "Movie Search", "AI Classification"])
+
+# Performance panel, filled at the end of the script so that it includes the sections of this run
+# The profiler is shared by every session of the app process, like the analysis, so the panel only shows it: a switch
+# in one session would turn the recording on or off for all the others
+performance_panel = st.sidebar.expander("Performance")
 
 # Main Analysis Page
 if page == "Main Analysis":
+    import matplotlib.pyplot as plt  # only the pages with charts import matplotlib
     st.markdown(
         "## Main Analysis\n"
         "This app provides an analysis of the [CMU movie corpus](https://www.cmu.edu/) movie dataset. "
@@ -38,120 +71,181 @@ if page == "Main Analysis":
     )
 
     # 1. Histogram for movie types
-    st.subheader("Movie Types Histogram")
-    N = st.number_input("Select value of N", min_value=1, max_value=100, value=10, step=1)
-    movie_types = analysis.movie_type(N)
-
-    fig1, ax1 = plt.subplots()
-    movie_types.plot(kind="bar", ax=ax1)
-    ax1.set_xlabel("Movie Type")
-    ax1.set_ylabel("Count")
-    ax1.set_title(f"Top {N} Movie Types")
-    st.pyplot(fig1)
+    with PROFILER.span("Main Analysis / Movie Types"):
+        st.subheader("Movie Types Histogram")
+        N = st.number_input("Select value of N", min_value=1, max_value=100, value=10, step=1)
+        movie_types = analysis.movie_type(N)
+
+        fig1, ax1 = plt.subplots()
+        movie_types.plot(kind="bar", ax=ax1)
+        ax1.set_xlabel("Movie Type")
+        ax1.set_ylabel("Count")
+        ax1.set_title(f"Top {N} Movie Types")
+        st.pyplot(fig1)
 
     # 2. Histogram for actor count per movie
-    st.subheader("Actor Count Histogram")
-    actor_count_df = analysis.actor_count()
+    with PROFILER.span("Main Analysis / Actor Count"):
+        st.subheader("Actor Count Histogram")
+        actor_count_df = analysis.actor_count()
 
-    fig2, ax2 = plt.subplots()
-    ax2.bar(actor_count_df["actor_count"], actor_count_df["movie_count"])
-    ax2.set_xlabel("Number of Actors per Movie")
-    ax2.set_ylabel("Number of Movies")
-    ax2.set_title("Distribution of Actor Counts per Movie")
-    st.pyplot(fig2)
+        fig2, ax2 = plt.subplots()
+        ax2.bar(actor_count_df["actor_count"], actor_count_df["movie_count"])
+        ax2.set_xlabel("Number of Actors per Movie")
+        ax2.set_ylabel("Number of Movies")
+        ax2.set_title("Distribution of Actor Counts per Movie")
+        st.pyplot(fig2)
 
     # 3. Distribution of actor heights based on filters
-    st.subheader("Actor Height Distribution")
-    unique_genders = analysis.character_data['Actor gender'].dropna().unique().tolist()
-    gender_options = ["All"] + unique_genders
-    selected_gender = st.selectbox("Select Gender", options=gender_options)
-
-    min_height = st.number_input("Minimum Height (m)", value=1.0, step=0.1)
-    max_height = st.number_input("Maximum Height (m)", value=2.2, step=0.1)
+    with PROFILER.span("Main Analysis / Actor Heights"):
+        st.subheader("Actor Height Distribution")
+        gender_options = ["All"] + analysis.actor_genders
+        selected_gender = st.selectbox("Select Gender", options=gender_options)
 
-    if min_height > max_height:
-        st.error("Minimum height must be less than maximum height.")
-    else:
-        actor_heights = analysis.actor_distributions(gender=selected_gender, min_height=min_height, max_height=max_height, plot=False)
+        min_height = st.number_input("Minimum Height (m)", value=1.0, step=0.1)
+        max_height = st.number_input("Maximum Height (m)", value=2.2, step=0.1)
+        binning = st.radio("Bins", options=["30 bins", "Adaptive (Freedman-Diaconis)"], horizontal=True)
 
-        if actor_heights.empty:
-            st.write("No data available for the selected parameters.")
+        if min_height > max_height:
+            st.error("Minimum height must be less than maximum height.")
         else:
-            fig3, ax3 = plt.subplots()
-            ax3.hist(actor_heights['Actor height'], bins=30, edgecolor='black')
-            ax3.set_xlabel("Actor Height (m)")
-            ax3.set_ylabel("Frequency")
-            ax3.set_title(f"Height Distribution for {selected_gender} Actors")
-            st.pyplot(fig3)
+            # Only the bins and their counts are computed and drawn, however many actors match
+            height_bins = analysis.height_histogram(gender=selected_gender, min_height=min_height, max_height=max_height,
+                                                    bins=30 if binning == "30 bins" else 'fd')
+
+            if height_bins.empty or height_bins['Actor count'].sum() == 0:
+                st.write("No data available for the selected parameters.")
+            else:
+                edges = list(height_bins['Height from']) + [height_bins['Height to'].iloc[-1]]
+                fig3, ax3 = plt.subplots()
+                ax3.hist(edges[:-1], bins=edges, weights=height_bins['Actor count'], edgecolor='black')
+                ax3.set_xlabel("Actor Height (m)")
+                ax3.set_ylabel("Frequency")
+                ax3.set_title(f"Height Distribution for {selected_gender} Actors")
+                st.pyplot(fig3)
 
 # Chronological Info Page
 elif page == "Chronological Info":
+    import matplotlib.pyplot as plt
     st.header("Chronological Analysis of Movies")
 
     # 1. Movie Releases per Year
-    st.subheader("Movie Releases Over Time")
-
-    # Genre Selection
-    available_genres = ['Drama', 'Comedy', 'Romance Film', 'Black-and-white', 'Action', 'Thriller', 'Short Film', 'World cinema', 'Crime Fiction', 'Indie']
-    available_genres.sort()
-    selected_genre = st.selectbox("Select Genre", available_genres)
-
-    # Convert "All" to None for function call
-    genre_filter = None if selected_genre == "All" else selected_genre
-
-    # Get Data
-    releases_df = analysis.releases(genre=genre_filter)
-
-    # Plot the data
-    if releases_df.empty:
-        st.write("No data available for the selected genre.")
-    else:
-        fig4, ax4 = plt.subplots()
-        ax4.bar(releases_df["Year"], releases_df["Movie Count"], color="royalblue")
-        ax4.set_xlabel("Year")
-        ax4.set_ylabel("Number of Movies Released")
-        ax4.set_title(f"Movie Releases Over Time ({selected_genre})")
-        st.pyplot(fig4)
+    with PROFILER.span("Chronological Info / Releases"):
+        st.subheader("Movie Releases Over Time")
+
+        # Genre, country and language selection, from every label of the dataset
+        options = analysis.filter_options()
+        available_genres = ["All"] + sorted(options["genres"])
+        selected_genre = st.selectbox("Select Genre", available_genres)
+        selected_countries = st.multiselect("Countries", options["countries"])
+        selected_languages = st.multiselect("Languages", options["languages"])
+        selected_measure = st.radio("Show", ["Movie Count", "Box Office Revenue", "Total Runtime"], horizontal=True)
+
+        # Convert "All" to None for function call
+        genre_filter = None if selected_genre == "All" else selected_genre
+
+        # Get Data
+        releases_df = analysis.release_stats(genres=genre_filter, countries=selected_countries or None,
+                                             languages=selected_languages or None)
+
+        # Plot the data
+        if releases_df.empty:
+            st.write("No data available for the selected genre.")
+        else:
+            fig4, ax4 = plt.subplots()
+            ax4.bar(releases_df["Year"], releases_df[selected_measure], color="royalblue")
+            ax4.set_xlabel("Year")
+            ax4.set_ylabel("Number of Movies Released" if selected_measure == "Movie Count" else selected_measure)
+            ax4.set_title(f"Movie Releases Over Time ({selected_genre})")
+            st.pyplot(fig4)
+
+    # Top genres of every decade
+    with PROFILER.span("Chronological Info / Top Genres"):
+        st.subheader("Top Genres per Decade")
+        top_n = st.number_input("Genres per decade", min_value=1, max_value=20, value=3, step=1)
+        top_genres = analysis.top_genres_by_decade(int(top_n), measure=selected_measure)
+        st.dataframe(top_genres, hide_index=True)
 
     # 2. Actor Births Over Time
-    st.subheader("Actor Births Distribution")
+    with PROFILER.span("Chronological Info / Actor Births"):
+        st.subheader("Actor Births Distribution")
 
-    # Dropdown to select Year ('Y') or Month ('M')
-    selected_mode = st.selectbox("Choose Time Unit", ["Year", "Month"])
+        # Dropdown to select Year ('Y') or Month ('M')
+        selected_mode = st.selectbox("Choose Time Unit", ["Year", "Month"])
 
-    # Convert selection to expected parameter
-    mode_filter = 'Y' if selected_mode == "Year" else 'M'
+        # Convert selection to expected parameter
+        mode_filter = 'Y' if selected_mode == "Year" else 'M'
 
-    # Get Data
-    ages_df = analysis.ages(mode=mode_filter)
+        # Get Data
+        ages_df = analysis.ages(mode=mode_filter)
 
-    # Plot the data
-    if ages_df.empty:
-        st.write("No data available for the selected mode.")
-    else:
-        fig5, ax5 = plt.subplots()
-
-        if mode_filter == 'Y':
-            ax5.bar(ages_df["Year"], ages_df["Birth Count"], color="darkorange")
-            ax5.set_xlabel("Year")
-            ax5.set_ylabel("Number of Actor Births")
-            ax5.set_title("Actor Births Per Year")
+        # Plot the data
+        if ages_df.empty:
+            st.write("No data available for the selected mode.")
         else:
-            ax5.bar(ages_df["Month"], ages_df["Birth Count"], color="green")
-            ax5.set_xlabel("Month")
-            ax5.set_ylabel("Number of Actor Births")
-            ax5.set_title("Actor Births Per Month")
-            ax5.set_xticks(range(1, 13))  # Ensure we show 1-12 for months
+            fig5, ax5 = plt.subplots()
+
+            if mode_filter == 'Y':
+                ax5.bar(ages_df["Year"], ages_df["Birth Count"], color="darkorange")
+                ax5.set_xlabel("Year")
+                ax5.set_ylabel("Number of Actor Births")
+                ax5.set_title("Actor Births Per Year")
+            else:
+                ax5.bar(ages_df["Month"], ages_df["Birth Count"], color="green")
+                ax5.set_xlabel("Month")
+                ax5.set_ylabel("Number of Actor Births")
+                ax5.set_title("Actor Births Per Month")
+                ax5.set_xticks(range(1, 13))  # Ensure we show 1-12 for months
+
+            st.pyplot(fig5)
+
+# Movie Search Page
+elif page == "Movie Search":
+    st.header("Search the Plot Summaries")
+
+    query = st.text_input("Search", placeholder="e.g. heist bank robbery")
+
+    # Filters
+    options = analysis.filter_options()
+    genre_options = ["All"] + options["genres"]
+    selected_genre = st.selectbox("Genre", genre_options)
+    first_year, last_year = options["release_years"]
+    selected_years = st.slider("Release Years", first_year, last_year, (first_year, last_year))
+    k = st.number_input("Number of Results", min_value=1, max_value=100, value=10)
+
+    with PROFILER.span("Movie Search / Results"):
+        if query:
+            # Movies without a known release year are only kept when the full range is selected
+            years = None if selected_years == (first_year, last_year) else selected_years
+            results = analysis.search(query, genre=None if selected_genre == "All" else selected_genre,
+                                      years=years, k=int(k))
+
+            if results.empty:
+                st.write("No movie matches the search.")
+            else:
+                st.dataframe(results, hide_index=True)
 
-        st.pyplot(fig5)
+                # Summaries are only read for the movies shown
+                for movie in analysis.get_movies(results["Wikipedia movie ID"].tolist()):
+                    with st.expander(movie["title"]):
+                        st.write(movie["summary"])
+                        st.caption(", ".join(movie["genres"]))
 
 # AI Classification Page
 elif page == "AI Classification":
+    from MovieClassifier import parse_genres  # only this page imports the classifiers and the evaluation
+    from MovieEvaluation import best_similarities, explode_genres
     st.header("🤖 AI-Based Movie Genre Classification")
     st.sidebar.markdown(f"**LLM Model in Use:** `{MODEL_NAME}` (it can be configured in `config.json`)")
+    default_engine = config.get("classifier", {}).get("engine", "llm")
+    engine = st.sidebar.selectbox("Genre classifier", list(ENGINES), index=list(ENGINES).index(default_engine),
+                                  format_func=ENGINES.get)
 
     # Button to shuffle a movie
     if st.button("🔀 Shuffle Movie"):
+        # Answers still streaming for the previous movie are no longer needed
+        for stream in st.session_state.pop("llm_streams", []):
+            stream.cancel()
+
         movie = analysis.get_random_movie()
         
         #box1
@@ -164,81 +258,96 @@ elif page == "AI Classification":
             st.markdown("### 🎭 Actual Genres")
             st.write(", ".join(movie['genres']))
 
-        # Prepare the LLM prompt
-        prompt = f"""
-        You are a movie classification AI. Given a movie summary, return only the genres that match the movie.
-        Output only a comma-separated list of genres. Do not add extra words.
-
-        Movie Summary:
-        {movie['summary']}
-        """
-
-
         # box3
-        with st.container(border=True):
-            st.markdown("### 🤖 LLM-Predicted Genres")
+        with PROFILER.span("AI Classification / Predicted Genres"):
+            with st.container(border=True):
+                st.markdown(f"### 🤖 Predicted Genres ({ENGINES[engine]})")
             
-            # Call Ollama to classify the movie
-            with st.spinner("Analyzing movie..."):
+                # Call Ollama to classify the movie (identical summaries are answered from the response cache)
+                # The answer of the LLM is shown as it is generated, then replaced by the parsed genres
+                predicted_genres_area = st.empty()
                 try:
-                    response = ollama.chat(model=MODEL_NAME, messages=[{"role": "user", "content": prompt}])
-                    predicted_genres = response['message']['content']
+                    if engine == "llm":
+                        stream = get_llm().stream(get_llm().classification_messages(movie['summary']))
+                        st.session_state.setdefault("llm_streams", []).append(stream)
+                        predicted_genres_area.write_stream(stream)
+                        predicted_genres_list = parse_genres(stream.content)
+                    else:
+                        with st.spinner("Analyzing movie..."):
+                            predicted_genres_list = get_classifier(engine).classify(movie['summary'])
                 except Exception as e:
                     st.error(f"Error communicating with the LLM: {e}")
-                    predicted_genres = ""
+                    predicted_genres_list = []
 
-            # Clean and process the LLM output
-            predicted_genres_list = [genre.strip() for genre in predicted_genres.split(",") if genre.strip()]
-            actual_genres_set = [set(genre.lower().split()) for genre in movie['genres']]
-            llm_genres_set = [set(genre.lower().split()) for genre in predicted_genres_list]
-            st.write(", ".join(predicted_genres_list) if predicted_genres_list else "No genres identified.")
+                # Process the LLM output
+                actual_genres = explode_genres([movie['id']], [movie['genres']])
+                llm_genres = explode_genres([movie['id']], [predicted_genres_list])
+                predicted_genres_area.write(", ".join(predicted_genres_list) if predicted_genres_list else "No genres identified.")
 
         # box4 evalation
-        with st.container(border=True):
-            st.markdown("### Evaluation of genre prediction")
+        with PROFILER.span("AI Classification / Evaluation"):
+            with st.container(border=True):
+                st.markdown("### Evaluation of genre prediction")
             
-            if not actual_genres_set:
-                st.warning("⚠️ No actual genres available for comparison. Skipping evaluation. ☹️\nPlease shuffle another movie.")
-            else:
-                st.markdown("#### Jaccard Similarity based Evaluation")
-                
-                threshold = 0.5  # Define a similarity threshold
-                markdown_table = "| Predicted Genre | Match Found? | Highest Jaccard Similarity |\n"
-                markdown_table += "|----------------|-------------|----------------------------|\n"
-                matches_count = 0
-
-                # Evaluate each predicted genre
-                for pred in llm_genres_set:
-                    pred_str = " ".join(pred)
-                    max_similarity = max(jaccard_similarity(pred, act) for act in actual_genres_set)
-                    match_status = "✅ Yes" if max_similarity >= threshold else "❌ No"
-                    markdown_table += f"| {pred_str} | {match_status} | {max_similarity:.2f} |\n"
-                    matches_count += 1 if max_similarity >= threshold else 0
-
-                success_rate = matches_count / len(llm_genres_set)
-
-                # Evaluation results
-                if success_rate >= 0.5:
-                    st.success(f"✅ At least half of the model's predictions were correct ({matches_count} out of {len(llm_genres_set)})\n" + markdown_table)
+                if actual_genres.empty:
+                    st.warning("⚠️ No actual genres available for comparison. Skipping evaluation. ☹️\nPlease shuffle another movie.")
+                elif llm_genres.empty:
+                    st.warning("⚠️ The model did not predict any genre. Skipping evaluation. ☹️\nPlease shuffle another movie.")
                 else:
-                    st.error(f"❌ Less then half of the model's predictions were correct ({matches_count} out of {len(llm_genres_set)})\n" + markdown_table)
+                    # The commentary is requested first, so the model writes it while the table is rendered
+                    evaluation_messages=[
+                        {"role": "system", "content": "You are a movie expert. You are in charge to evaluate the perfomance of an AI model that predicts movie genres."},
+                        {"role": "user", "content": "Compare the model predictions with the actual genres and explain if they match well:\n\n"
+                                                    f"Model Prediction: [{', '.join(predicted_genres_list)}]\n"
+                                                    f"Actual Genres: [{', '.join(movie['genres'])}]\n"
+                                                    f"The predictions are for the movie: {movie['title']}\n"
+                                                    "Be very concise and clear in your evaluation."}
+                    ]
+                    commentary = get_llm().stream(evaluation_messages)
+                    st.session_state.setdefault("llm_streams", []).append(commentary)
+
+                    st.markdown("#### Jaccard Similarity based Evaluation")
                 
+                    threshold = 0.5  # Define a similarity threshold
+                    markdown_table = "| Predicted Genre | Match Found? | Highest Jaccard Similarity |\n"
+                    markdown_table += "|----------------|-------------|----------------------------|\n"
+                    matches_count = 0
+
+                    # Evaluate each predicted genre, with its highest similarity to an actual genre (computed in bulk)
+                    similarities, _ = best_similarities(llm_genres, actual_genres)
+                    for pred_str, max_similarity in zip(llm_genres['genre'], similarities):
+                        match_status = "✅ Yes" if max_similarity >= threshold else "❌ No"
+                        markdown_table += f"| {pred_str} | {match_status} | {max_similarity:.2f} |\n"
+                        matches_count += 1 if max_similarity >= threshold else 0
+
+                    success_rate = matches_count / len(llm_genres)
+
+                    # Evaluation results
+                    if success_rate >= 0.5:
+                        st.success(f"✅ At least half of the model's predictions were correct ({matches_count} out of {len(llm_genres)})\n" + markdown_table)
+                    else:
+                        st.error(f"❌ Less then half of the model's predictions were correct ({matches_count} out of {len(llm_genres)})\n" + markdown_table)
                 
-                st.markdown("#### 🤖 LLM-Based Prediction Comparison")
                 
-                evaluation_messages=[
-                    {"role": "system", "content": "You are a movie expert. You are in charge to evaluate the perfomance of an AI model that predicts movie genres."},
-                    {"role": "user", "content": "Compare the model predictions with the actual genres and explain if they match well:\n\n"
-                                                f"Model Prediction: [{', '.join(predicted_genres_list)}]\n"
-                                                f"Actual Genres: [{', '.join(movie['genres'])}]\n"
-                                                f"The predictions are for the movie: {movie['title']}\n"
-                                                "Be very concise and clear in your evaluation."}
-                ]
-                
-                with st.spinner("AI model is thinking..."):
+                    st.markdown("#### 🤖 LLM-Based Prediction Comparison")
+
                     try:
-                        response = ollama.chat(model=MODEL_NAME, messages=evaluation_messages)
-                        st.markdown(response['message']['content'])
+                        st.write_stream(commentary)
+                        if commentary.ttft_s is not None:
+                            st.caption(f"First token after {commentary.ttft_s:.2f} s, complete answer after {commentary.latency_s:.2f} s"
+                                       + (" (cached)" if commentary.cached else ""))
                     except Exception as e:
                         st.error(f"Error communicating with the LLM: {e}")
 
+# Performance panel: time, CPU, rows and memory of the analysis methods, LLM calls and page sections
+with performance_panel:
+    if not PROFILER.enabled:
+        st.caption("Timings are not recorded. Set profiling.enabled in config.json (or MOVIE_PROFILE=1) and restart the app.")
+    else:
+        performance = PROFILER.summary()
+        if performance.empty:
+            st.caption("No timings recorded yet.")
+        else:
+            st.dataframe(performance, hide_index=True)
+            st.download_button("Download logs (JSON lines)", PROFILER.to_json_lines(), file_name="performance.jsonl")
+            st.download_button("Download Prometheus metrics", PROFILER.to_prometheus(), file_name="performance.prom")
@@ -0,0 +1,655 @@
+import os
+import json
+import time
+import zlib
+import queue
+import random
+import hashlib
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from MovieProfiler import PROFILER, profiled
+from MovieSearch import tokenize
+
+
+# Prompt used to ask the LLM for the genres of a movie
+CLASSIFICATION_PROMPT = """
+        You are a movie classification AI. Given a movie summary, return only the genres that match the movie.
+        Output only a comma-separated list of genres. Do not add extra words.
+
+        Movie Summary:
+        {summary}
+        """
+
+
+# Function to load the configuration of the app (config.json)
+def load_config(path="config.json"):
+    with open(path, "r") as file:
+        return json.load(file)
+
+
+# Function to turn the comma-separated answer of the LLM into a list of genres
+def parse_genres(text):
+    return [genre.strip() for genre in text.split(",") if genre.strip()]
+
+
+# Function to count the tokens of texts into a sparse matrix, in CSR form (indptr, indices, counts)
+# Tokens are hashed into n_features columns with crc32, which (unlike hash()) is stable across processes.
+def hashed_counts(texts, n_features):
+    indptr = [0]
+    indices = []
+    counts = []
+    for text in texts:
+        features, feature_counts = np.unique(
+            np.fromiter((zlib.crc32(token.encode('utf-8')) % n_features for token in tokenize(text)),
+                        dtype=np.int64), return_counts=True)
+        indices.append(features)
+        counts.append(feature_counts)
+        indptr.append(indptr[-1] + len(features))
+
+    indices = np.concatenate(indices) if indices else np.array([], dtype=np.int64)
+    counts = np.concatenate(counts) if counts else np.array([], dtype=np.int64)
+    return np.array(indptr, dtype=np.int64), indices, counts
+
+
+# Function to turn the token counts of hashed_counts into L2-normalised TF-IDF weights
+# Term frequencies are sublinear (1 + log(count)).
+def tfidf_weights(indptr, indices, counts, idf):
+    data = (1 + np.log(counts)) * idf[indices]
+    lengths = np.diff(indptr)
+    row_norms = np.ones(len(lengths))
+    if len(data):
+        row_norms[lengths > 0] = np.sqrt(np.add.reduceat(data ** 2, indptr[:-1][lengths > 0]))
+    return (data / np.repeat(row_norms, lengths)).astype(np.float32)
+
+
+# Function to multiply a CSR matrix by a dense matrix, row by row, without SciPy
+def csr_dot(indptr, indices, data, dense):
+    lengths = np.diff(indptr)
+    result = np.zeros((len(lengths), dense.shape[1]), dtype=np.float32)
+    rows = lengths > 0
+    if rows.any():
+        result[rows] = np.add.reduceat(dense[indices] * data[:, None], indptr[:-1][rows], axis=0)
+    return result
+
+
+class TfidfGenreClassifier:
+    """
+    Local genre classifier: TF-IDF features of the plot summary scored against one centroid per genre.
+
+    The model is one-vs-rest: every genre has a weight vector (the centroid of the TF-IDF vectors of its movies,
+    minus the centroid of all movies) and a score threshold tuned on the training data to maximise its F1 score.
+    Scoring a summary is a sparse-dense product, so thousands of summaries are classified per second on one core.
+    It has the same interface as LLMGenreClassifier (classify, classify_with_details, classify_many).
+
+    The model is saved as .npy files plus a JSON file with the genres, and loaded memory-mapped.
+
+    Parameters:
+    -----------
+    weights : np.ndarray
+        (n_features x n_genres) weight matrix.
+    idf : np.ndarray
+        Inverse document frequency of every feature.
+    thresholds : np.ndarray
+        Score threshold of every genre.
+    genres : list
+        Names of the genres, in the order of the columns of weights.
+    max_genres : int, optional (default=5)
+        Maximum number of genres predicted for a movie.
+    confidence_quantiles : np.ndarray, optional
+        Percentiles 0 to 100 of the margin of the best genre over its threshold, on the training summaries. The
+        confidence of a prediction is the fraction of the training summaries with a lower margin.
+    min_confidence : float, optional (default=0.05)
+        Summaries with a lower confidence get no genre, so that a FallbackGenreClassifier asks its fallback (e.g.
+        the LLM). 0.05 hands over the summaries less certain than the 5% least certain training summaries.
+    """
+
+    def __init__(self, weights, idf, thresholds, genres, max_genres: int = 5, confidence_quantiles=None,
+                 min_confidence: float = 0.05):
+        self.weights = weights
+        self.idf = idf
+        self.thresholds = thresholds
+        self.genres = list(genres)
+        self.max_genres = max_genres
+        self.confidence_quantiles = confidence_quantiles
+        self.min_confidence = min_confidence
+        self.n_features = weights.shape[0]
+
+    @classmethod
+    def train(cls, analysis, n_features: int = 2 ** 16, min_movies: int = 50, max_genres: int = 5,
+              exclude_ids=None):
+        """
+        Train the classifier on the plot summaries and decoded genres of a MovieAnalysis instance.
+
+        Parameters:
+        -----------
+        analysis : MovieAnalysis
+            Source of the summaries and genres.
+        n_features : int, optional (default=2 ** 16)
+            Number of hashed features.
+        min_movies : int, optional (default=50)
+            Genres with fewer training movies are not predicted.
+        max_genres : int, optional (default=5)
+            Maximum number of genres predicted for a movie.
+        exclude_ids : list, optional
+            Wikipedia movie IDs left out of the training data (e.g. an evaluation sample).
+        """
+        summaries = analysis.movie_summaries
+        movie_ids = summaries['Wikipedia movie ID'].to_numpy()
+        movie_rows = analysis.movie_id_index.positions(movie_ids)
+        keep = movie_rows >= 0
+        if exclude_ids is not None:
+            keep &= ~np.isin(movie_ids, np.asarray(exclude_ids))
+        texts = summaries['Plot summary'].to_numpy()[keep]
+        movie_rows = movie_rows[keep]
+
+        # Genres with enough movies, and the (movies x genres) label matrix
+        genre_index = analysis.genre_index
+        membership = genre_index.membership[movie_rows]
+        frequent = np.flatnonzero(membership.sum(axis=0) >= min_movies)
+        labels = membership[:, frequent]
+        genres = genre_index.categories[frequent].tolist()
+
+        # Document frequencies, then the TF-IDF matrix
+        indptr, indices, counts = hashed_counts(texts, n_features)
+        document_frequency = np.bincount(indices, minlength=n_features)
+        idf = (np.log((1 + len(texts)) / (1 + document_frequency)) + 1).astype(np.float32)
+        data = tfidf_weights(indptr, indices, counts, idf)
+
+        # Centroid of every genre minus the centroid of all movies
+        document_of = np.repeat(np.arange(len(texts)), np.diff(indptr))
+        weights = np.zeros((n_features, len(genres)), dtype=np.float32)
+        for column in range(len(genres)):
+            in_genre = labels[document_of, column]
+            weights[:, column] = np.bincount(indices[in_genre], weights=data[in_genre], minlength=n_features)
+            weights[:, column] /= max(labels[:, column].sum(), 1)
+        weights -= (np.bincount(indices, weights=data, minlength=n_features) / max(len(texts), 1))[:, None]
+
+        # Threshold of every genre: the training score that maximises its F1
+        scores = csr_dot(indptr, indices, data, weights)
+        thresholds = np.zeros(len(genres), dtype=np.float32)
+        for column in range(len(genres)):
+            order = np.argsort(-scores[:, column])
+            true_positives = np.cumsum(labels[order, column])
+            f1 = 2 * true_positives / (np.arange(1, len(order) + 1) + labels[:, column].sum())
+            thresholds[column] = scores[order[np.argmax(f1)], column]
+
+        # Distribution of the margin of the best genre, to turn the margin of a new summary into a confidence
+        confidence_quantiles = None
+        if len(genres) and (np.diff(indptr) > 0).any():
+            margins = (scores - thresholds).max(axis=1)[np.diff(indptr) > 0]
+            confidence_quantiles = np.quantile(margins, np.linspace(0, 1, 101)).astype(np.float32)
+
+        return cls(weights, idf, thresholds, genres, max_genres, confidence_quantiles)
+
+    def save(self, path):
+        """Save the model in a directory, the arrays as .npy files so they can be memory-mapped."""
+        os.makedirs(path, exist_ok=True)
+        for name in ['weights', 'idf', 'thresholds', 'confidence_quantiles']:
+            if getattr(self, name) is not None:
+                np.save(os.path.join(path, name + '.npy'), getattr(self, name))
+        with open(os.path.join(path, 'genres.json'), 'w') as file:
+            json.dump({'genres': self.genres, 'max_genres': self.max_genres}, file)
+
+    @classmethod
+    def load(cls, path, min_confidence: float = 0.05):
+        """
+        Load a saved model, memory-mapping its arrays. Models saved before the confidence was calibrated have no
+        confidence_quantiles and always predict a genre.
+        """
+        arrays = [np.load(os.path.join(path, name + '.npy'), mmap_mode='r') for name in ['weights', 'idf', 'thresholds']]
+        quantiles_file = os.path.join(path, 'confidence_quantiles.npy')
+        quantiles = np.load(quantiles_file) if os.path.exists(quantiles_file) else None
+        with open(os.path.join(path, 'genres.json'), 'r') as file:
+            meta = json.load(file)
+        return cls(*arrays, meta['genres'], meta['max_genres'], quantiles, min_confidence)
+
+    @staticmethod
+    def is_saved(path):
+        """Whether a model (with its confidence) is saved in the directory."""
+        return all(os.path.exists(os.path.join(path, name)) for name in ['genres.json', 'confidence_quantiles.npy'])
+
+    @classmethod
+    def load_or_train(cls, analysis, path='Downloads/tfidf_model', min_confidence: float = 0.05):
+        """
+        Load the saved model, training and saving it first if there is none (or if it has no confidence yet).
+        With the AnalysisClient of MovieService.py, the service trains it with its tables and gives its path.
+        """
+        if not cls.is_saved(path):
+            from MovieService import AnalysisClient
+            if isinstance(analysis, AnalysisClient):
+                path = analysis.train_genre_model()
+            else:
+                cls.train(analysis).save(path)
+        return cls.load(path, min_confidence)
+
+    def predict_scores(self, summaries):
+        """Return the (summaries x genres) score matrix, and which summaries had no known token at all."""
+        indptr, indices, counts = hashed_counts(summaries, self.n_features)
+        data = tfidf_weights(indptr, indices, counts, self.idf)
+        return csr_dot(indptr, indices, data, self.weights), np.diff(indptr) == 0
+
+    def confidence(self, scores):
+        """Return the confidence (0 to 1) of the predictions of a (summaries x genres) score matrix."""
+        if self.confidence_quantiles is None or scores.shape[1] == 0:
+            return np.ones(len(scores))
+        margins = (scores - self.thresholds).max(axis=1)
+        return np.interp(margins, self.confidence_quantiles, np.linspace(0, 1, len(self.confidence_quantiles)))
+
+    def _genres_from_scores(self, scores):
+        """Genres above their threshold, best first, at most max_genres, and at least the best one."""
+        order = np.argsort(-scores)[:self.max_genres]
+        selected = [column for column in order if scores[column] >= self.thresholds[column]] or order[:1].tolist()
+        return [self.genres[column] for column in selected]
+
+    @profiled()
+    def classify_many(self, summaries, details: bool = False):
+        """
+        Classify several summaries in one batch, see LLMGenreClassifier.classify_many.
+        Summaries without any known token, or without a confident genre, get no genre (so that a
+        FallbackGenreClassifier hands them over).
+        """
+        start = time.perf_counter()
+        scores, empty = self.predict_scores(summaries)
+        unsure = empty | (self.confidence(scores) < self.min_confidence)
+        predictions = [[] if is_unsure else self._genres_from_scores(row) for row, is_unsure in zip(scores, unsure)]
+        if not details:
+            return predictions
+        latency = (time.perf_counter() - start) / max(len(summaries), 1)
+        return [{'genres': genres, 'content': ', '.join(genres), 'latency_s': latency, 'cached': False,
+                 'prompt_tokens': None, 'completion_tokens': None} for genres in predictions]
+
+    def classify_with_details(self, summary):
+        return self.classify_many([summary], details=True)[0]
+
+    def classify(self, summary):
+        """Return the list of genres predicted for a plot summary."""
+        return self.classify_many([summary])[0]
+
+
+class FallbackGenreClassifier:
+    """
+    Classifier that asks a primary classifier first and a fallback one (e.g. the LLM) when the primary
+    fails or predicts no genre. Same interface as LLMGenreClassifier.
+
+    The failures handed over are the ones of PRIMARY_ERRORS, e.g. model files that cannot be read or a server
+    that cannot be reached. They are printed, any other error is a bug and is raised.
+    """
+
+    # OSError includes ConnectionError and TimeoutError
+    PRIMARY_ERRORS = (OSError, ValueError)
+
+    def __init__(self, primary, fallback):
+        self.primary = primary
+        self.fallback = fallback
+
+    def classify_with_details(self, summary):
+        try:
+            result = self.primary.classify_with_details(summary)
+            if result['genres']:
+                return result
+        except self.PRIMARY_ERRORS as e:
+            print(f'The primary classifier failed, asking the fallback: {e!r}')
+        return self.fallback.classify_with_details(summary)
+
+    def classify(self, summary):
+        return self.classify_with_details(summary)['genres']
+
+    def classify_many(self, summaries, details: bool = False):
+        """
+        Classify all the summaries with the primary classifier in one batch, then only the ones it has no genre for
+        with the fallback, also in one batch (so an LLM fallback keeps its concurrent requests).
+        """
+        try:
+            results = self.primary.classify_many(summaries, details=True)
+        except self.PRIMARY_ERRORS as e:
+            print(f'The primary classifier failed, asking the fallback: {e!r}')
+            results = [None] * len(summaries)
+        misses = [position for position, result in enumerate(results) if result is None or not result['genres']]
+        if misses:
+            answers = self.fallback.classify_many([summaries[position] for position in misses], details=True)
+            for position, answer in zip(misses, answers):
+                results[position] = answer
+        return results if details else [result['genres'] for result in results]
+
+
+class LLMGenreClassifier:
+    """
+    Predicts movie genres from plot summaries with an LLM served by Ollama.
+
+    Many summaries can be classified concurrently through a bounded thread pool. Every answer is cached on disk,
+    keyed by the model name and a hash of the messages, so identical prompts never go back to the model.
+    Failed or timed out requests are retried with an exponential backoff. Answers can also be streamed token by
+    token from a background thread (see stream).
+
+    Parameters:
+    -----------
+    model : str
+        Name of the Ollama model (see "ollama" in config.json).
+    host : str, optional
+        URL of the Ollama server. Defaults to $OLLAMA_HOST or the local server, point it to a fake server in tests.
+    timeout : float, optional (default=120)
+        Timeout of a single request, in seconds. For streamed answers, it bounds the wait for every token.
+    stream_timeout : float, optional (default=300)
+        Maximum time to wait for a whole streamed answer, in seconds.
+    retries : int, optional (default=2)
+        Number of times a failed request is retried.
+    max_workers : int, optional (default=4)
+        Maximum number of concurrent requests in classify_many.
+    cache_dir : str or None, optional (default='Downloads/llm_cache')
+        Directory of the response cache. Pass None to disable it.
+    client : ollama.Client, optional
+        Client to use instead of creating one from host and timeout.
+    """
+
+    def __init__(self, model: str, host: str = None, timeout: float = 120, retries: int = 2, max_workers: int = 4,
+                 cache_dir: str = 'Downloads/llm_cache', client=None, stream_timeout: float = 300):
+        self.model = model
+        self.retries = retries
+        self.stream_timeout = stream_timeout
+        self.max_workers = max_workers
+        self.cache_dir = cache_dir
+        if client is None:
+            import ollama  # imported on first use, it takes longer to import than the rest of the module
+            client = ollama.Client(host=host, timeout=timeout)
+        self.client = client
+
+    @classmethod
+    def from_config(cls, config, **kwargs):
+        """Create a classifier from the "ollama" section of config.json (keyword arguments take precedence)."""
+        settings = {key: value for key, value in config["ollama"].items() if value is not None}
+        settings.update(kwargs)
+        return cls(**settings)
+
+    def _cache_file(self, messages):
+        """Return the cache file of a request, named after the hash of the model and the messages."""
+        key = hashlib.sha256(json.dumps([self.model, messages], sort_keys=True).encode('utf-8')).hexdigest()
+        return os.path.join(self.cache_dir, key[:2], key + '.json')
+
+    @profiled()
+    def chat(self, messages):
+        """
+        Send a chat request to the model, going through the response cache.
+
+        Returns:
+        --------
+        dict: {'content': str, 'cached': bool, 'latency_s': float, 'prompt_tokens': int, 'completion_tokens': int}
+            The token counts are None when the server does not report them.
+        """
+        cached = self._read_cache(messages)
+        if cached is not None:
+            return {**cached, 'cached': True}
+
+        start = time.perf_counter()
+        response = self._chat_with_retries(messages)
+        result = {
+            'content': response['message']['content'],
+            'latency_s': time.perf_counter() - start,
+            'prompt_tokens': response.get('prompt_eval_count'),
+            'completion_tokens': response.get('eval_count'),
+        }
+        self._write_cache(messages, result)
+        return {**result, 'cached': False}
+
+    def stream(self, messages, timeout: float = None):
+        """
+        Send a chat request whose answer is streamed token by token, going through the response cache.
+
+        The request runs in a background thread, so the caller can do other work before reading the answer.
+        Iterating over the returned ChatStream yields the pieces of the answer as they arrive (e.g. with
+        st.write_stream), and cancel() stops the request.
+
+        Parameters:
+        -----------
+        messages : list
+            The chat messages, like in chat.
+        timeout : float, optional
+            Maximum time to wait for the whole answer, in seconds. Defaults to stream_timeout.
+
+        Returns:
+        --------
+        ChatStream
+        """
+        return ChatStream(self, messages, self.stream_timeout if timeout is None else timeout)
+
+    def _read_cache(self, messages):
+        """Return the cached answer to a request, or None if it was never asked."""
+        cache_file = self._cache_file(messages) if self.cache_dir else None
+        if cache_file and os.path.exists(cache_file):
+            try:
+                with open(cache_file, 'r') as file:
+                    return json.load(file)
+            except (OSError, ValueError):
+                pass  # a corrupted entry is simply asked again
+        return None
+
+    def _write_cache(self, messages, result):
+        """Store the answer to a request in the cache."""
+        if self.cache_dir:
+            # Written atomically, concurrent workers may be asked the same prompt
+            cache_file = self._cache_file(messages)
+            os.makedirs(os.path.dirname(cache_file), exist_ok=True)
+            temporary_file = f'{cache_file}.{os.getpid()}.{id(result)}.tmp'
+            with open(temporary_file, 'w') as file:
+                json.dump(result, file)
+            os.replace(temporary_file, cache_file)
+
+    def _should_retry(self, error, attempt):
+        """Return whether a failed request is asked again, after sleeping for the exponential backoff."""
+        import httpx
+        import ollama
+
+        # Client errors (unknown model, bad request) will not go away by asking again
+        if not isinstance(error, (ollama.ResponseError, ConnectionError, httpx.TransportError)):
+            return False
+        if isinstance(error, ollama.ResponseError) and 0 <= error.status_code < 500:
+            return False
+        if attempt == self.retries:
+            return False
+        time.sleep(0.5 * 2 ** attempt + random.random() * 0.1)
+        return True
+
+    def _chat_with_retries(self, messages):
+        """Send a chat request, retrying timeouts, connection and server errors with an exponential backoff."""
+        for attempt in range(self.retries + 1):
+            try:
+                return self.client.chat(model=self.model, messages=messages)
+            except Exception as e:
+                if not self._should_retry(e, attempt):
+                    raise
+
+    def classification_messages(self, summary):
+        """Return the chat messages asking for the genres of a plot summary."""
+        return [{"role": "user", "content": CLASSIFICATION_PROMPT.format(summary=summary)}]
+
+    def classify_with_details(self, summary):
+        """Classify one summary and return the result of chat plus the parsed list of 'genres'."""
+        result = self.chat(self.classification_messages(summary))
+        return {**result, 'genres': parse_genres(result['content'])}
+
+    def classify(self, summary):
+        """Return the list of genres the model predicts for a plot summary."""
+        return self.classify_with_details(summary)['genres']
+
+    def classify_many(self, summaries, details: bool = False):
+        """
+        Classify several summaries concurrently, at most max_workers requests at a time.
+
+        Returns:
+        --------
+        list
+            The predicted genres of every summary, in order (or the results of classify_with_details if details).
+        """
+        classify = self.classify_with_details if details else self.classify
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            return list(executor.map(classify, summaries))
+
+
+class ChatStream:
+    """
+    Answer of the LLM to a chat request, streamed by a background thread (see LLMGenreClassifier.stream).
+
+    Iterating over it yields the pieces of the answer as they arrive; it can only be iterated once. The
+    request is cancelled when the iteration stops early, when cancel() is called (e.g. when the user moves on)
+    or when the answer takes longer than the timeout, which raises a TimeoutError. Errors of the request are
+    raised by the iteration. Cached answers are yielded in one piece.
+
+    Attributes:
+    -----------
+    content : str
+        The answer received so far.
+    cached : bool
+        Whether the answer comes from the response cache.
+    ttft_s : float
+        Time to the first token, in seconds (None until it arrives).
+    latency_s : float
+        Time to the whole answer, in seconds (None until it is complete).
+    prompt_tokens, completion_tokens : int
+        Token counts reported by the server, None if it does not report them.
+    """
+
+    _END = object()
+
+    def __init__(self, classifier, messages, timeout: float):
+        self.classifier = classifier
+        self.messages = messages
+        self.timeout = timeout
+        self.content = ''
+        self.cached = False
+        self.ttft_s = None
+        self.latency_s = None
+        self.prompt_tokens = None
+        self.completion_tokens = None
+        self.error = None
+        self._pieces = queue.Queue()
+        self._cancelled = threading.Event()
+        self._start = time.perf_counter()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        """Receive the answer in the background thread and queue its pieces."""
+        try:
+            cached = self.classifier._read_cache(self.messages)
+            if cached is not None:
+                self.cached = True
+                self.prompt_tokens = cached.get('prompt_tokens')
+                self.completion_tokens = cached.get('completion_tokens')
+                self._receive(cached['content'])
+            else:
+                self._stream_with_retries()
+            if self._cancelled.is_set():
+                return
+
+            self.latency_s = time.perf_counter() - self._start
+            if not self.cached:
+                self.classifier._write_cache(self.messages, {
+                    'content': self.content, 'latency_s': self.latency_s, 'ttft_s': self.ttft_s,
+                    'prompt_tokens': self.prompt_tokens, 'completion_tokens': self.completion_tokens})
+            PROFILER.record(f'{type(self.classifier).__name__}.stream', kind='llm', wall_s=self.latency_s,
+                            ttft_s=self.ttft_s, cached=self.cached, completion_tokens=self.completion_tokens)
+        except Exception as e:
+            self.error = e
+        finally:
+            self._pieces.put(self._END)
+
+    def _stream_with_retries(self):
+        """Stream the answer, retrying failures that happen before the first token like chat does."""
+        for attempt in range(self.classifier.retries + 1):
+            try:
+                chunks = self.classifier.client.chat(model=self.classifier.model, messages=self.messages,
+                                                     stream=True)
+                for chunk in chunks:
+                    # Leaving the loop closes the response, which stops the generation on the server
+                    if self._cancelled.is_set():
+                        chunks.close()
+                        return
+                    self._receive(chunk['message']['content'])
+                    if chunk.get('done'):
+                        self.prompt_tokens = chunk.get('prompt_eval_count')
+                        self.completion_tokens = chunk.get('eval_count')
+                return
+            except Exception as e:
+                if self.content or self._cancelled.is_set() or not self.classifier._should_retry(e, attempt):
+                    raise
+
+    def _receive(self, piece):
+        if piece:
+            if self.ttft_s is None:
+                self.ttft_s = time.perf_counter() - self._start
+            self.content += piece
+            self._pieces.put(piece)
+
+    def cancel(self):
+        """Stop the request. The answer received so far is kept in content."""
+        self._cancelled.set()
+
+    @property
+    def done(self):
+        """Whether the request is over (complete, failed or cancelled)."""
+        return not self._thread.is_alive()
+
+    def __iter__(self):
+        deadline = self._start + self.timeout
+        try:
+            while True:
+                try:
+                    piece = self._pieces.get(timeout=max(deadline - time.perf_counter(), 0))
+                except queue.Empty:
+                    raise TimeoutError(f'No complete answer from the model after {self.timeout:g} seconds.')
+                if piece is self._END:
+                    if self.error is not None:
+                        raise self.error
+                    return
+                yield piece
+        finally:
+            if not self.done:
+                self.cancel()
+
+
+# Function to build the classifier selected in config.json
+# "classifier.engine" is either "tfidf" (the local model, trained on first use) or "llm" (Ollama). With
+# "classifier.llm_fallback", the LLM classifies the summaries the local model has no genre for. The local model is
+# trained with analysis (a MovieAnalysis, or the AnalysisClient of the service), or else with a new MovieAnalysis.
+def load_classifier(config, analysis=None, **overrides):
+    settings = config.get("classifier", {})
+    llm = LLMGenreClassifier.from_config(config, **overrides)
+    if settings.get("engine", "llm") != "tfidf":
+        return llm
+
+    if analysis is None:
+        from MovieAnalysis import MovieAnalysis
+        analysis = MovieAnalysis()
+    tfidf = TfidfGenreClassifier.load_or_train(analysis, settings.get("tfidf_path", 'Downloads/tfidf_model'),
+                                               settings.get("min_confidence", 0.05))
+    return FallbackGenreClassifier(tfidf, llm) if settings.get("llm_fallback", True) else tfidf
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Classify the genres of random movies with the classifier '
+                                                 'in config.json.')
+    parser.add_argument('--n', type=int, default=10, help='Number of random movies to classify.')
+    parser.add_argument('--seed', type=int, default=None, help='Seed of the random choice of movies.')
+    parser.add_argument('--workers', type=int, default=None, help='Maximum number of concurrent LLM requests.')
+    parser.add_argument('--engine', choices=['llm', 'tfidf'], default=None,
+                        help='Classifier to use instead of the one in config.json.')
+    parser.add_argument('--train', action='store_true', help='Retrain and save the TF-IDF model first.')
+    args = parser.parse_args()
+
+    from MovieAnalysis import MovieAnalysis
+    analysis = MovieAnalysis()
+    config = load_config()
+    if args.engine:
+        config["classifier"] = {**config.get("classifier", {}), "engine": args.engine}
+    if args.train:
+        TfidfGenreClassifier.train(analysis).save(config.get("classifier", {}).get("tfidf_path",
+                                                                                   'Downloads/tfidf_model'))
+
+    movies = analysis.sample_movies(args.n, seed=args.seed)
+    overrides = {'max_workers': args.workers} if args.workers else {}
+    classifier = load_classifier(config, analysis, **overrides)
+    for movie, predicted in zip(movies, classifier.classify_many([movie['summary'] for movie in movies])):
+        print(f"{movie['title']}\n    actual:    {', '.join(movie['genres'])}\n    predicted: {', '.join(predicted)}")
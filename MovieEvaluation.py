@@ -0,0 +1,175 @@
+import os
+import time
+import argparse
+
+import numpy as np
+import pandas as pd
+
+
+# Function to split genres into the lowercase word sets the evaluation compares
+# Returns an exploded DataFrame with one row per (row of the genres table, word)
+def genre_words(genres: pd.DataFrame):
+    words = genres[['movie']].assign(word=genres['genre'].str.lower().str.split()).explode('word')
+    return words.dropna(subset=['word']).rename_axis('row').reset_index()
+
+
+# Function to compute, in bulk, the best Jaccard similarity of every genre with the genres of the other side
+# 'predicted' and 'actual' hold one row per (movie, genre). Genres are compared as word sets, like
+# set(genre.lower().split()), and only with the genres of the same movie. Instead of a nested loop over pairs,
+# the word intersections of all the pairs are counted with a single join on (movie, word).
+# Returns two arrays: the best similarity of every predicted genre, and of every actual genre.
+def best_similarities(predicted: pd.DataFrame, actual: pd.DataFrame):
+    predicted = predicted.reset_index(drop=True)
+    actual = actual.reset_index(drop=True)
+    predicted_words = genre_words(predicted)
+    actual_words = genre_words(actual)
+
+    # Sizes of the word sets (duplicated words count once, as in a set)
+    predicted_sizes = predicted_words.drop_duplicates(['row', 'word']).groupby('row').size()
+    actual_sizes = actual_words.drop_duplicates(['row', 'word']).groupby('row').size()
+
+    # Pairs of genres of the same movie that share at least one word, with the size of their intersection
+    shared = predicted_words.drop_duplicates(['row', 'word']).merge(
+        actual_words.drop_duplicates(['row', 'word']), on=['movie', 'word'], suffixes=('_predicted', '_actual'))
+    pairs = shared.groupby(['row_predicted', 'row_actual']).size().rename('intersection').reset_index()
+    union = (predicted_sizes.reindex(pairs['row_predicted']).to_numpy()
+             + actual_sizes.reindex(pairs['row_actual']).to_numpy() - pairs['intersection'].to_numpy())
+    pairs['similarity'] = pairs['intersection'].to_numpy() / union
+
+    # Genres that share no word with the other side have a similarity of 0
+    best_predicted = pairs.groupby('row_predicted')['similarity'].max().reindex(range(len(predicted)), fill_value=0)
+    best_actual = pairs.groupby('row_actual')['similarity'].max().reindex(range(len(actual)), fill_value=0)
+    return best_predicted.to_numpy(dtype=float), best_actual.to_numpy(dtype=float)
+
+
+# Function to explode a list of genre lists into one row per (movie, genre)
+def explode_genres(movie_ids, genre_lists):
+    table = pd.DataFrame({'movie': movie_ids, 'genre': list(genre_lists)}).explode('genre')
+    return table.dropna(subset=['genre']).reset_index(drop=True)
+
+
+# Function to score genre predictions against the actual genres, for many movies at once
+# A predicted genre matches when its best Jaccard similarity with an actual genre reaches the threshold
+# (the rule of the AI Classification page). Returns one row per movie with the precision (share of the
+# predictions that match), the recall (share of the actual genres that are matched), their F1 score and
+# the Jaccard similarity of the two genre sets.
+def score_predictions(movie_ids, actual_genres, predicted_genres, threshold: float = 0.5):
+    actual = explode_genres(movie_ids, actual_genres)
+    predicted = explode_genres(movie_ids, predicted_genres)
+    best_predicted, best_actual = best_similarities(predicted, actual)
+
+    predicted['match'] = best_predicted >= threshold
+    actual['match'] = best_actual >= threshold
+    scores = pd.DataFrame({
+        'predicted_count': predicted.groupby('movie').size(),
+        'predicted_matches': predicted.groupby('movie')['match'].sum(),
+        'actual_count': actual.groupby('movie').size(),
+        'actual_matches': actual.groupby('movie')['match'].sum(),
+    }).reindex(pd.unique(np.asarray(movie_ids))).fillna(0).astype(int)
+
+    scores['precision'] = scores['predicted_matches'] / scores['predicted_count'].replace(0, np.nan)
+    # No answer for a movie that has genres is wrong, not undefined (otherwise the means would skip it)
+    scores.loc[(scores['predicted_count'] == 0) & (scores['actual_count'] > 0), 'precision'] = 0.0
+    scores['recall'] = scores['actual_matches'] / scores['actual_count'].replace(0, np.nan)
+    scores['f1'] = 2 * scores['precision'] * scores['recall'] / (scores['precision'] + scores['recall'])
+    scores.loc[scores['precision'] + scores['recall'] == 0, 'f1'] = 0.0
+
+    # Jaccard similarity of the sets of (lowercase) genre names
+    names_predicted = predicted.assign(genre=predicted['genre'].str.lower()).drop_duplicates(['movie', 'genre'])
+    names_actual = actual.assign(genre=actual['genre'].str.lower()).drop_duplicates(['movie', 'genre'])
+    common = names_predicted.merge(names_actual, on=['movie', 'genre']).groupby('movie').size()
+    common = common.reindex(scores.index, fill_value=0)
+    union = (names_predicted.groupby('movie').size().reindex(scores.index, fill_value=0)
+             + names_actual.groupby('movie').size().reindex(scores.index, fill_value=0) - common)
+    scores['jaccard'] = common / union.replace(0, np.nan)
+
+    return scores.rename_axis('movie')
+
+
+# Function to classify movies with a classifier and score the predictions
+# The classifier needs a classify_many(summaries, details=True) method returning, for every summary, a dict with
+# at least 'genres' and 'latency_s' (and optionally 'cached', 'prompt_tokens', 'completion_tokens').
+# Returns (per-movie results, aggregate results as a one-row DataFrame).
+def evaluate(classifier, movies, name: str, threshold: float = 0.5):
+    start = time.perf_counter()
+    results = classifier.classify_many([movie['summary'] for movie in movies], details=True)
+    elapsed = time.perf_counter() - start
+
+    movie_ids = [movie['id'] for movie in movies]
+    per_movie = pd.DataFrame({
+        'id': movie_ids,
+        'title': [movie['title'] for movie in movies],
+        'actual': [movie['genres'] for movie in movies],
+        'predicted': [result['genres'] for result in results],
+        'latency_s': [result['latency_s'] for result in results],
+        'cached': [result.get('cached', False) for result in results],
+        'prompt_tokens': [result.get('prompt_tokens') for result in results],
+        'completion_tokens': [result.get('completion_tokens') for result in results],
+    })
+    scores = score_predictions(movie_ids, per_movie['actual'], per_movie['predicted'], threshold)
+    per_movie = per_movie.join(scores[['precision', 'recall', 'f1', 'jaccard']], on='id')
+    per_movie.insert(0, 'model', name)
+
+    # Latency percentiles only make sense for the requests that actually went to the model
+    latencies = per_movie.loc[~per_movie['cached'], 'latency_s'].to_numpy(dtype=float)
+    tokens = pd.to_numeric(per_movie['prompt_tokens'], errors='coerce').fillna(0).sum() + \
+        pd.to_numeric(per_movie['completion_tokens'], errors='coerce').fillna(0).sum()
+    aggregate = pd.DataFrame([{
+        'model': name,
+        'movies': len(movies),
+        'cached': int(per_movie['cached'].sum()),
+        'precision': per_movie['precision'].mean(),
+        'recall': per_movie['recall'].mean(),
+        'f1': per_movie['f1'].mean(),
+        'jaccard': per_movie['jaccard'].mean(),
+        'elapsed_s': elapsed,
+        'movies_per_s': len(movies) / elapsed if elapsed else np.nan,
+        'tokens_per_s': tokens / elapsed if elapsed else np.nan,
+        'latency_p50_s': np.percentile(latencies, 50) if len(latencies) else np.nan,
+        'latency_p90_s': np.percentile(latencies, 90) if len(latencies) else np.nan,
+        'latency_p99_s': np.percentile(latencies, 99) if len(latencies) else np.nan,
+    }])
+    return per_movie, aggregate
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Classify a sample of movies (or all of them) and score the '
+                                                 'predicted genres, to compare models on speed and quality.')
+    parser.add_argument('--n', type=int, default=100, help='Number of sampled movies, 0 for all of them.')
+    parser.add_argument('--seed', type=int, default=0, help='Seed of the sample.')
+    parser.add_argument('--model', action='append',
+                        help='Ollama model to evaluate, can be repeated. Defaults to the model in config.json.')
+    parser.add_argument('--tfidf', action='store_true',
+                        help='Also evaluate the local TF-IDF classifier, trained on every movie but the sample.')
+    parser.add_argument('--workers', type=int, default=None, help='Maximum number of concurrent requests.')
+    parser.add_argument('--threshold', type=float, default=0.5, help='Similarity needed for a genre to match.')
+    parser.add_argument('--out', default='Downloads/evaluation', help='Directory of the Parquet results.')
+    args = parser.parse_args()
+    if args.tfidf and not args.n:
+        parser.error('--tfidf needs a sample (--n > 0) to leave out of its training data')
+
+    from MovieAnalysis import MovieAnalysis
+    from MovieClassifier import LLMGenreClassifier, TfidfGenreClassifier, load_config
+
+    config = load_config()
+    analysis = MovieAnalysis()
+    movies = analysis.sample_movies(args.n or None, seed=args.seed)
+    print(f'Evaluating {len(movies)} movies')
+
+    classifiers = {}
+    if args.tfidf:
+        classifiers['tfidf'] = TfidfGenreClassifier.train(analysis, exclude_ids=[movie['id'] for movie in movies])
+    for model in args.model or ([] if args.tfidf else [config["ollama"]["model"]]):
+        overrides = {'model': model, **({'max_workers': args.workers} if args.workers else {})}
+        classifiers[model] = LLMGenreClassifier.from_config(config, **overrides)
+
+    os.makedirs(args.out, exist_ok=True)
+    aggregates = []
+    for model, classifier in classifiers.items():
+        per_movie, aggregate = evaluate(classifier, movies, model, args.threshold)
+        file_name = model.replace('/', '_').replace(':', '_')
+        per_movie.to_parquet(os.path.join(args.out, f'{file_name}_movies.parquet'), index=False)
+        aggregate.to_parquet(os.path.join(args.out, f'{file_name}_summary.parquet'), index=False)
+        aggregates.append(aggregate)
+
+    print(pd.concat(aggregates).set_index('model').T.to_string(float_format=lambda value: f'{value:.3f}'))
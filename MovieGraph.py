@@ -0,0 +1,187 @@
+import json
+
+import numpy as np
+import pandas as pd
+
+
+# Function to concatenate the slices values[start:start + length] of every (start, length) pair, without a Python loop
+def gather_slices(values, starts, lengths):
+    total = int(lengths.sum())
+    if total == 0:
+        return values[:0]
+    shifts = np.repeat(starts - np.concatenate([[0], np.cumsum(lengths)[:-1]]), lengths)
+    return values[shifts + np.arange(total)]
+
+
+# Function to group values by an integer key into CSR form
+# Returns the offsets (values of key k are at offsets[k]:offsets[k + 1]) and the values, in their order within a key
+def group_by_key(keys, values, key_count):
+    order = np.argsort(keys, kind='stable')
+    offsets = np.concatenate([[0], np.cumsum(np.bincount(keys, minlength=key_count))]).astype(np.int64)
+    return offsets, values[order]
+
+
+# Function to read the character/actor map ID from the second column of tvtropes.clusters.txt
+# The column holds a JSON object, e.g. {"char": "Dr. Roger Ender", "movie": "...", "id": "/m/0jy9q0", "actor": "..."}
+def trope_map_id(value):
+    try:
+        return json.loads(value).get('id')
+    except (TypeError, ValueError, AttributeError):
+        return None
+
+
+# Function to find the rows of a column with the given values (the first row if a value appears more than once)
+# Returns -1 for the values that are not in the column
+def first_rows(column, values):
+    first = ~column.duplicated().to_numpy()
+    positions = pd.Index(column.to_numpy()[first]).get_indexer(values)
+    return np.where(positions >= 0, np.flatnonzero(first)[positions], -1)
+
+
+class ActorGraph:
+    """
+    Graph of the actors, movies and characters of character_data, with the character types of tvtropes and the
+    name clusters joined to the characters on 'Freebase character/actor map ID'.
+
+    Every row of character_data is a character, played by an actor (by 'Freebase actor ID') in a movie (by
+    'Wikipedia movie ID'). Actors and movies get integer codes, and the character rows of every actor and of
+    every movie are stored in CSR form (offsets into one array of row positions), so the filmography of an
+    actor or the cast of a movie is an array slice. The co-star graph (actors who played in the same movie,
+    weighted by the number of such movies) is built the same way on first use. Queries read these arrays and
+    never merge the tables.
+
+    Parameters:
+    -----------
+    character_data : pd.DataFrame
+        The character table of MovieAnalysis.
+    tvtropes_clusters : pd.DataFrame
+        The character types of tvtropes.clusters.txt, with the JSON of the characters in its second column.
+    name_clusters : pd.DataFrame
+        The character names of name.clusters.txt and their map IDs.
+    """
+
+    def __init__(self, character_data: pd.DataFrame, tvtropes_clusters: pd.DataFrame, name_clusters: pd.DataFrame):
+        actor_codes, self.actor_ids = pd.factorize(character_data['Freebase actor ID'])
+        movie_codes, self.movie_ids = pd.factorize(character_data['Wikipedia movie ID'])
+        self.row_actors = actor_codes.astype(np.int32)
+        self.row_movies = movie_codes.astype(np.int32)
+
+        # Name of every actor, from the first of their rows that has one
+        rows = np.flatnonzero(actor_codes >= 0)
+        self.actor_names = (character_data['Actor name'].iloc[rows].groupby(actor_codes[rows]).first()
+                            .reindex(np.arange(len(self.actor_ids))).to_numpy(dtype=object))
+
+        # Character rows of every actor and of every movie (only the rows with a known actor are edges)
+        self.actor_offsets, self.actor_rows = group_by_key(actor_codes[rows], rows, len(self.actor_ids))
+        self.movie_offsets, self.movie_rows = group_by_key(movie_codes[rows], rows, len(self.movie_ids))
+
+        # Character types, joined on the map ID; a character can have several types
+        map_ids = character_data['Freebase character/actor map ID']
+        trope_rows = first_rows(map_ids, tvtropes_clusters['Freebase character/actor map ID'].map(trope_map_id))
+        found = trope_rows >= 0
+        trope_codes, tropes = pd.factorize(tvtropes_clusters['Character type'].to_numpy()[found])
+        self.tropes = pd.Index(tropes, dtype=object)
+        order = np.argsort(trope_rows[found], kind='stable')
+        self.trope_rows = trope_rows[found][order]
+        self.trope_codes = trope_codes[order].astype(np.int32)
+
+        # Name cluster of every character, -1 for the characters that are in none
+        cluster_rows = first_rows(map_ids, name_clusters['Freebase character/actor map ID'])
+        found = cluster_rows >= 0
+        cluster_codes, clusters = pd.factorize(name_clusters['Character name'].to_numpy()[found])
+        self.name_clusters = pd.Index(clusters, dtype=object)
+        self.row_name_clusters = np.full(len(character_data), -1, dtype=np.int32)
+        self.row_name_clusters[cluster_rows[found]] = cluster_codes
+
+        self._co_stars = None
+
+    def actor_code(self, actor):
+        """
+        Return the code of an actor, given their Freebase actor ID or their name (the actor with the most
+        characters if several have the name). Raises a ValueError if there is no such actor.
+        """
+        code = self.actor_ids.get_indexer([actor])[0]
+        if code < 0:
+            named = np.flatnonzero(self.actor_names == actor)
+            if len(named) == 0:
+                raise ValueError(f"Unknown actor: {actor!r}.")
+            code = named[np.argmax(np.diff(self.actor_offsets)[named])]
+        return int(code)
+
+    def rows_of_actor(self, code):
+        """Return the character rows of an actor, in table order."""
+        return self.actor_rows[self.actor_offsets[code]:self.actor_offsets[code + 1]]
+
+    def tropes_of_rows(self, rows):
+        """Return the character types of every given row, as a list of lists."""
+        starts = np.searchsorted(self.trope_rows, rows, side='left')
+        stops = np.searchsorted(self.trope_rows, rows, side='right')
+        return [self.tropes[self.trope_codes[start:stop]].tolist() for start, stop in zip(starts, stops)]
+
+    def name_clusters_of_rows(self, rows):
+        """Return the name cluster of every given row, None for the rows that are in none."""
+        # Code -1 picks the None appended at the end
+        return np.append(self.name_clusters.to_numpy(), None)[self.row_name_clusters[rows]]
+
+    @property
+    def co_stars(self):
+        """
+        Co-star graph in CSR form: (offsets, actors, weights), the co-stars of actor a being
+        actors[offsets[a]:offsets[a + 1]] and the number of movies they share weights[offsets[a]:offsets[a + 1]].
+        """
+        if self._co_stars is None:
+            actor_count = len(self.actor_ids)
+
+            # Distinct (movie, actor) pairs, an actor playing two characters of a movie is only counted once
+            pairs = np.unique(self.row_movies[self.movie_rows].astype(np.int64) * actor_count
+                              + self.row_actors[self.movie_rows])
+            movies, actors = pairs // actor_count, pairs % actor_count
+            starts = np.searchsorted(movies, movies, side='left')
+            cast_sizes = np.searchsorted(movies, movies, side='right') - starts
+
+            # Every actor of a movie paired with every other actor of the same movie
+            sources = np.repeat(actors, cast_sizes)
+            targets = gather_slices(actors, starts, cast_sizes)
+            different = sources != targets
+            edges, weights = np.unique(sources[different] * actor_count + targets[different], return_counts=True)
+            offsets = np.concatenate([[0], np.cumsum(np.bincount(edges // actor_count, minlength=actor_count))])
+            self._co_stars = (offsets.astype(np.int64), (edges % actor_count).astype(np.int32),
+                              weights.astype(np.int32))
+        return self._co_stars
+
+    def top_co_stars(self, code, n):
+        """Return the codes of the n actors who share the most movies with an actor, and the numbers of movies."""
+        offsets, actors, weights = self.co_stars
+        neighbors = actors[offsets[code]:offsets[code + 1]]
+        shared = weights[offsets[code]:offsets[code + 1]]
+        top = np.argsort(-shared, kind='stable')[:n]
+        return neighbors[top], shared[top]
+
+    def neighborhood(self, code, k):
+        """Return the codes of the actors at most k co-star hops away from an actor, and their distance to them."""
+        offsets, actors, _ = self.co_stars
+        distances = np.full(len(self.actor_ids), -1, dtype=np.int32)
+        distances[code] = 0
+        frontier = np.array([code])
+        for hop in range(1, k + 1):
+            neighbors = np.unique(gather_slices(actors, offsets[frontier], offsets[frontier + 1] - offsets[frontier]))
+            frontier = neighbors[distances[neighbors] < 0]
+            if len(frontier) == 0:
+                break
+            distances[frontier] = hop
+        reached = np.flatnonzero(distances > 0)
+        order = np.argsort(distances[reached], kind='stable')
+        return reached[order], distances[reached][order]
+
+    def trope_counts(self, actor_code=None, movie_codes=None):
+        """
+        Return the number of characters of every character type (a Series, the most common first), of all the
+        characters, of the characters of an actor or of the characters of some movies (codes of movie_ids).
+        """
+        mask = np.ones(len(self.trope_rows), dtype=bool)
+        if actor_code is not None:
+            mask &= self.row_actors[self.trope_rows] == actor_code
+        if movie_codes is not None:
+            mask &= np.isin(self.row_movies[self.trope_rows], movie_codes)
+        counts = pd.Series(np.bincount(self.trope_codes[mask], minlength=len(self.tropes)), index=self.tropes)
+        return counts[counts > 0].sort_values(ascending=False, kind='stable')
@@ -0,0 +1,239 @@
+import os
+import sys
+import json
+import time
+import functools
+import threading
+from collections import deque
+
+import pandas as pd
+
+
+# Function to read the resident set size of the process, in bytes
+# /proc gives the current RSS on Linux, other Unix systems only give the peak RSS and Windows gives None.
+def current_rss():
+    try:
+        with open('/proc/self/statm', 'r') as file:
+            return int(file.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return peak_rss()
+
+
+# Function to read the peak resident set size of the process, in bytes (None on Windows, which has no resource module)
+def peak_rss():
+    try:
+        import resource  # only available on Unix
+    except ImportError:
+        return None
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return max_rss if sys.platform == 'darwin' else max_rss * 1024
+
+
+# Function to count the rows of a result (None for results that are not tables or lists)
+def row_count(value):
+    if isinstance(value, (pd.DataFrame, pd.Series, list, tuple)) or hasattr(value, 'shape'):
+        return len(value)
+    return None
+
+
+class Span:
+    """
+    Measures one instrumented block: wall time, CPU time of the thread, RSS delta, rows in and out.
+    The measurements go into the record dict, which the block can complete (e.g. record['rows_out'] = ...).
+    """
+
+    def __init__(self, profiler, name, kind, rows_in):
+        self.profiler = profiler
+        self.record = {'name': name, 'kind': kind, 'rows_in': rows_in, 'rows_out': None}
+
+    def __enter__(self):
+        stack = self.profiler._stack()
+        self.record['parent'] = stack[-1]['name'] if stack else None
+        stack.append(self.record)
+        self._rss = current_rss()
+        self._cpu = time.thread_time()
+        self._wall = time.perf_counter()
+        return self.record
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        wall = time.perf_counter() - self._wall
+        cpu = time.thread_time() - self._cpu
+        rss = current_rss()
+        self.record.update({
+            'start': time.time() - wall,
+            'wall_s': wall,
+            'cpu_s': cpu,
+            'memory_delta_bytes': rss - self._rss if rss is not None and self._rss is not None else None,
+            'error': exc_type.__name__ if exc_type else None,
+        })
+        self.profiler._stack().pop()
+        self.profiler._add(self.record)
+
+
+class NullSpan:
+    """Stand-in for Span when profiling is disabled: measures nothing."""
+
+    def __enter__(self):
+        return {}
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return None
+
+
+NULL_SPAN = NullSpan()
+
+
+class Profiler:
+    """
+    Opt-in instrumentation of the analysis methods, the LLM calls and the sections of the app.
+
+    Every instrumented call or block becomes a record with its name, kind ('method', 'section', ...), parent
+    (the enclosing instrumented block), wall time, CPU time, rows in and out and RSS delta. The latest records
+    are kept in memory, can be appended as JSON lines to a log file and are summarised in the Prometheus text
+    format. When the profiler is disabled, instrumented code only pays for one attribute check.
+
+    Parameters:
+    -----------
+    enabled : bool, optional (default=False)
+        Whether to record anything.
+    log_path : str, optional
+        If given, every record is also appended to this file as one JSON object per line.
+    max_records : int, optional (default=10,000)
+        Number of records kept in memory.
+    """
+
+    def __init__(self, enabled: bool = False, log_path: str = None, max_records: int = 10_000):
+        self.enabled = enabled
+        self.log_path = log_path
+        self._records = deque(maxlen=max_records)
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def enable(self, log_path: str = None):
+        """Start recording, optionally appending the records to a JSON lines file."""
+        self.log_path = log_path or self.log_path
+        self.enabled = True
+
+    def disable(self):
+        """Stop recording. The records are kept."""
+        self.enabled = False
+
+    def reset(self):
+        """Forget the records."""
+        with self._lock:
+            self._records.clear()
+
+    def _stack(self):
+        """Return the stack of the blocks being measured in this thread."""
+        if not hasattr(self._local, 'stack'):
+            self._local.stack = []
+        return self._local.stack
+
+    def _add(self, record):
+        with self._lock:
+            self._records.append(record)
+            if self.log_path:
+                with open(self.log_path, 'a') as file:
+                    file.write(json.dumps(record, default=str) + '\n')
+
+    def span(self, name: str, kind: str = 'section', rows_in: int = None):
+        """
+        Context manager measuring a block of code, e.g.
+
+            with PROFILER.span('Main Analysis / Actor Count') as record:
+                ...
+                record['rows_out'] = len(result)
+        """
+        if not self.enabled:
+            return NULL_SPAN
+        return Span(self, name, kind, rows_in)
+
+    def record(self, name: str, kind: str, wall_s: float, **fields):
+        """
+        Add a record for work measured elsewhere, e.g. a request streamed by a background thread. The extra
+        fields (e.g. ttft_s, the time to the first token) are kept in the record and the logs.
+        """
+        if self.enabled:
+            self._add({'name': name, 'kind': kind, 'parent': None, 'rows_in': None, 'rows_out': None,
+                       'start': time.time() - wall_s, 'wall_s': wall_s, 'cpu_s': None, 'memory_delta_bytes': None,
+                       'error': None, **fields})
+
+    def records(self):
+        """Return a copy of the records, oldest first."""
+        with self._lock:
+            return list(self._records)
+
+    def summary(self):
+        """
+        Returns a DataFrame with one row per instrumented name: number of calls, total and mean wall time,
+        total CPU time, rows in and out and RSS delta (and the mean time to the first token of the streamed LLM
+        answers), the slowest first.
+        """
+        records = pd.DataFrame(self.records(), columns=['name', 'kind', 'wall_s', 'cpu_s', 'rows_in', 'rows_out',
+                                                        'memory_delta_bytes', 'ttft_s'])
+        summary = records.groupby(['kind', 'name']).agg(
+            calls=('wall_s', 'size'), wall_s=('wall_s', 'sum'), mean_wall_s=('wall_s', 'mean'),
+            mean_ttft_s=('ttft_s', 'mean'), cpu_s=('cpu_s', 'sum'), rows_in=('rows_in', lambda values: values.sum(min_count=1)),
+            rows_out=('rows_out', lambda values: values.sum(min_count=1)),
+            memory_delta_mib=('memory_delta_bytes', lambda values: values.sum() / 2 ** 20))
+        return summary.sort_values('wall_s', ascending=False).reset_index()
+
+    def to_json_lines(self):
+        """Return the records as structured logs, one JSON object per line."""
+        return ''.join(json.dumps(record, default=str) + '\n' for record in self.records())
+
+    def to_prometheus(self, prefix: str = 'movie_app'):
+        """Return the totals of every instrumented name in the Prometheus text exposition format."""
+        metrics = [
+            ('duration_seconds', 'summary', 'Wall time of the instrumented calls.', 'wall_s'),
+            ('cpu_seconds_total', 'counter', 'CPU time of the calling thread.', 'cpu_s'),
+            ('rows_in_total', 'counter', 'Rows of the tables read.', 'rows_in'),
+            ('rows_out_total', 'counter', 'Rows returned.', 'rows_out'),
+            ('memory_delta_bytes', 'gauge', 'Sum of the RSS changes (negative when memory was released).',
+             'memory_delta_bytes'),
+        ]
+        totals = {}
+        for record in self.records():
+            entry = totals.setdefault((record['kind'], record['name']), {'count': 0})
+            entry['count'] += 1
+            for _, _, _, field in metrics:
+                entry[field] = entry.get(field, 0) + (record.get(field) or 0)
+
+        def labels(kind, name):
+            escape = lambda value: str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+            return f'{{kind="{escape(kind)}",name="{escape(name)}"}}'
+
+        lines = []
+        for metric, metric_type, description, field in metrics:
+            lines += [f'# HELP {prefix}_{metric} {description}', f'# TYPE {prefix}_{metric} {metric_type}']
+            for (kind, name), entry in sorted(totals.items()):
+                if metric_type == 'summary':
+                    lines.append(f'{prefix}_{metric}_sum{labels(kind, name)} {entry[field]}')
+                    lines.append(f'{prefix}_{metric}_count{labels(kind, name)} {entry["count"]}')
+                else:
+                    lines.append(f'{prefix}_{metric}{labels(kind, name)} {entry[field]}')
+        return '\n'.join(lines) + '\n'
+
+
+# Profiler shared by the analysis, the classifiers and the app, enabled with MOVIE_PROFILE=1
+PROFILER = Profiler(enabled=os.environ.get('MOVIE_PROFILE') == '1', log_path=os.environ.get('MOVIE_PROFILE_LOG'))
+
+
+# Decorator to instrument a method with the shared profiler
+# The rows in are the rows of the given tables of the instance (attribute names, e.g. 'movie_data').
+def profiled(*tables):
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(self, *args, **kwargs):
+            if not PROFILER.enabled:
+                return func(self, *args, **kwargs)
+
+            with PROFILER.span(f'{type(self).__name__}.{func.__name__}', kind='method') as record:
+                result = func(self, *args, **kwargs)
+                # Counted after the call, which loads the tables if they were not loaded yet
+                record['rows_in'] = sum(len(getattr(self, table)) for table in tables) if tables else None
+                record['rows_out'] = row_count(result)
+            return result
+        return wrapper
+    return decorator
@@ -0,0 +1,178 @@
+import os
+import re
+import json
+import shutil
+
+import numpy as np
+
+
+# Function to split a text into lowercase word tokens
+def tokenize(text):
+    return re.findall(r"[a-z0-9]+(?:'[a-z]+)?", text.lower())
+
+
+class SearchIndex:
+    """
+    Inverted index over the plot summaries, stored on disk and ranked with BM25.
+
+    The index is made of segments, each one built from a batch of documents and never modified afterwards, so
+    it can be built incrementally and new summaries are indexed by adding a segment. A segment is a directory
+    of .npy arrays, memory-mapped when the index is opened:
+    - doc_ids / doc_lengths: Wikipedia movie ID and number of tokens of every document
+    - term_ids / offsets: the sorted IDs of the terms present in the segment and where their postings start
+    - postings_docs / postings_tf: for every term, the documents (positions in the segment) and term frequencies
+    Terms are mapped to IDs by vocabulary.json, shared by all segments. manifest.json lists the segments and
+    the version of the summaries the index was built from.
+
+    Queries only read the postings of their terms, never the raw text.
+
+    Parameters:
+    -----------
+    path : str
+        Directory of the index.
+    k1, b : float, optional
+        BM25 parameters.
+    """
+
+    def __init__(self, path, k1: float = 1.2, b: float = 0.75):
+        self.path = path
+        self.k1 = k1
+        self.b = b
+        self.vocabulary = {}
+        self.manifest = {'segments': [], 'version': None}
+        self.segments = []
+
+        if os.path.exists(os.path.join(path, 'manifest.json')):
+            with open(os.path.join(path, 'manifest.json'), 'r') as file:
+                self.manifest = json.load(file)
+            with open(os.path.join(path, 'vocabulary.json'), 'r') as file:
+                self.vocabulary = {term: term_id for term_id, term in enumerate(json.load(file))}
+            self.segments = [self._open_segment(name) for name in self.manifest['segments']]
+
+    @classmethod
+    def build(cls, path, doc_ids, texts, version=None, batch_size: int = 5000):
+        """Build a new index from scratch, batch_size documents per segment, replacing any index in path."""
+        shutil.rmtree(path, ignore_errors=True)
+        index = cls(path)
+        for start in range(0, len(texts), batch_size):
+            index.add(doc_ids[start:start + batch_size], texts[start:start + batch_size])
+        index.set_version(version)
+        return index
+
+    @property
+    def doc_count(self):
+        return sum(len(segment['doc_ids']) for segment in self.segments)
+
+    def _open_segment(self, name):
+        """Memory-map the arrays of a segment."""
+        names = ['doc_ids', 'doc_lengths', 'term_ids', 'offsets', 'postings_docs', 'postings_tf']
+        return {array: np.load(os.path.join(self.path, name, array + '.npy'), mmap_mode='r') for array in names}
+
+    def _write_manifest(self):
+        """Write the vocabulary and the manifest, atomically, the manifest last."""
+        terms = sorted(self.vocabulary, key=self.vocabulary.get)
+        for file_name, content in [('vocabulary.json', terms), ('manifest.json', self.manifest)]:
+            with open(os.path.join(self.path, file_name + '.tmp'), 'w') as file:
+                json.dump(content, file)
+            os.replace(os.path.join(self.path, file_name + '.tmp'), os.path.join(self.path, file_name))
+
+    def set_version(self, version):
+        """Record the version of the summaries the index is up to date with."""
+        self.manifest['version'] = version
+        os.makedirs(self.path, exist_ok=True)
+        self._write_manifest()
+
+    def add(self, doc_ids, texts):
+        """Index a batch of documents as a new segment."""
+        if len(texts) == 0:
+            return
+
+        # Term ID and document of every token of the batch
+        doc_lengths = np.zeros(len(texts), dtype=np.int32)
+        token_terms = []
+        for position, text in enumerate(texts):
+            tokens = tokenize(text) if isinstance(text, str) else []
+            doc_lengths[position] = len(tokens)
+            token_terms.append([self.vocabulary.setdefault(token, len(self.vocabulary)) for token in tokens])
+        terms = np.fromiter((term for doc_terms in token_terms for term in doc_terms), dtype=np.int64)
+        docs = np.repeat(np.arange(len(texts), dtype=np.int64), doc_lengths)
+
+        # Postings sorted by term then document, with the term frequencies
+        pairs, term_frequencies = np.unique(terms * len(texts) + docs, return_counts=True)
+        pair_terms = pairs // len(texts)
+        term_ids, starts = np.unique(pair_terms, return_index=True)
+
+        name = f'segment-{len(self.manifest["segments"]):05d}'
+        os.makedirs(os.path.join(self.path, name), exist_ok=True)
+        arrays = {
+            'doc_ids': np.asarray(doc_ids, dtype=np.int64),
+            'doc_lengths': doc_lengths,
+            'term_ids': term_ids.astype(np.int32),
+            'offsets': np.append(starts, len(pairs)).astype(np.int64),
+            'postings_docs': (pairs % len(texts)).astype(np.int32),
+            'postings_tf': np.minimum(term_frequencies, np.iinfo(np.uint16).max).astype(np.uint16),
+        }
+        for array_name, array in arrays.items():
+            np.save(os.path.join(self.path, name, array_name + '.npy'), array)
+
+        self.manifest['segments'].append(name)
+        self._write_manifest()
+        self.segments.append(self._open_segment(name))
+
+    def _postings(self, segment, term_id):
+        """Return the (documents, term frequencies) of a term in a segment."""
+        position = np.searchsorted(segment['term_ids'], term_id)
+        if position >= len(segment['term_ids']) or segment['term_ids'][position] != term_id:
+            return np.array([], dtype=np.int32), np.array([], dtype=np.uint16)
+        start, stop = segment['offsets'][position], segment['offsets'][position + 1]
+        return segment['postings_docs'][start:stop], segment['postings_tf'][start:stop]
+
+    def search(self, query, k: int = 10, allowed_ids=None):
+        """
+        Rank the documents matching the query with BM25.
+
+        Parameters:
+        -----------
+        query : str
+            Free text, every word is a search term.
+        k : int, optional (default=10)
+            Number of results.
+        allowed_ids : array-like, optional
+            If given, only these Wikipedia movie IDs can be returned.
+
+        Returns:
+        --------
+        list: [(movie ID, score)], best first.
+        """
+        term_ids = [self.vocabulary[token] for token in dict.fromkeys(tokenize(query)) if token in self.vocabulary]
+        if not term_ids or not self.segments:
+            return []
+
+        # Corpus statistics over all the segments
+        doc_count = self.doc_count
+        average_length = sum(int(segment['doc_lengths'].sum()) for segment in self.segments) / max(doc_count, 1)
+        postings = [[self._postings(segment, term_id) for term_id in term_ids] for segment in self.segments]
+        document_frequencies = np.sum([[len(docs) for docs, _ in segment] for segment in postings], axis=0)
+        idf = np.log(1 + (doc_count - document_frequencies + 0.5) / (document_frequencies + 0.5))
+
+        results_ids = []
+        results_scores = []
+        for segment, segment_postings in zip(self.segments, postings):
+            scores = np.zeros(len(segment['doc_ids']))
+            length_norm = self.k1 * (1 - self.b + self.b * segment['doc_lengths'] / average_length)
+            for term_idf, (docs, tf) in zip(idf, segment_postings):
+                if len(docs):
+                    tf = tf.astype(float)
+                    scores[docs] += term_idf * tf * (self.k1 + 1) / (tf + length_norm[docs])
+
+            matches = scores > 0
+            if allowed_ids is not None:
+                matches &= np.isin(segment['doc_ids'], allowed_ids)
+            results_ids.append(np.asarray(segment['doc_ids'])[matches])
+            results_scores.append(scores[matches])
+
+        ids = np.concatenate(results_ids)
+        scores = np.concatenate(results_scores)
+        best = np.argpartition(-scores, min(k, len(scores)) - 1)[:k] if len(scores) > k else np.arange(len(scores))
+        best = best[np.argsort(-scores[best], kind='stable')]
+        return [(ids[position].item(), scores[position].item()) for position in best]
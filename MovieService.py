@@ -0,0 +1,309 @@
+"""
+Analysis service: one long-lived MovieAnalysis, loaded once and shared by all its clients, behind a local JSON API.
+
+Constructing MovieAnalysis and loading its tables is the slow part of starting the app or a batch script. The
+service does it once and keeps the tables, indexes and result cache warm. The app (with the "url" of the "service"
+section of config.json, or MOVIE_SERVICE_URL) and scripts then use an AnalysisClient, which has the same query
+methods and does not import MovieAnalysis, pyarrow or the dataset:
+
+    python MovieService.py --port 8765
+
+    from MovieService import AnalysisClient
+    analysis = AnalysisClient('http://127.0.0.1:8765')
+    analysis.movie_type(10)
+
+The API:
+- POST /call with {"name": method, "args": [...], "kwargs": {...}} answers {"result": value}. DataFrames and Series
+  are sent with their index, columns and dtypes, and come back as the same objects, like tuples. Invalid
+  arguments (ValueError, TypeError or KeyError) are answered with status 400 and raised again by the client.
+- POST /call with {"name": "train_genre_model"} trains and saves the TF-IDF genre model of MovieClassifier with the
+  tables of the service (unless it is saved already) and answers its path, so that clients load it without the
+  tables. load_classifier does this when it is given an AnalysisClient.
+- GET /health answers {"status": "ok", "uptime_s", "requests", "table_versions", "cache"}.
+
+The server only listens on 127.0.0.1 and only answers the read-only queries of METHODS and ATTRIBUTES and the
+SERVICE_METHODS.
+"""
+import json
+import time
+import argparse
+import functools
+import itertools
+import threading
+import http.client
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+import pandas as pd
+
+from MovieProfiler import PROFILER, row_count
+
+# Query methods of MovieAnalysis that clients can call
+METHODS = ('movie_type', 'actor_count', 'actor_distributions', 'height_histogram', 'releases', 'release_stats',
+           'top_genres_by_decade', 'ages', 'aggregates', 'filter_options', 'cache_info', 'get_movie', 'get_movies',
+           'search', 'get_random_movie', 'sample_movies', 'filmography', 'top_co_stars', 'actor_neighborhood',
+           'trope_distribution')
+
+# Attributes of MovieAnalysis that clients can read
+ATTRIBUTES = ('actor_genders', 'table_versions')
+
+# Methods of the service itself that clients can call
+SERVICE_METHODS = ('train_genre_model',)
+
+# Errors sent back to the client as what they are, every other error is a RuntimeError for the client
+ERRORS = {'ValueError': ValueError, 'TypeError': TypeError, 'KeyError': KeyError}
+
+
+# Function to turn a result of MovieAnalysis into JSON values (decode_value turns them back)
+def encode_value(value):
+    if isinstance(value, pd.DataFrame):
+        return {'__frame__': {'columns': encode_index(value.columns),
+                              'dtypes': [str(dtype) for dtype in value.dtypes],
+                              'index': encode_index(value.index),
+                              'data': value.astype(object).where(value.notna(), None).to_numpy().tolist()}}
+    if isinstance(value, pd.Series):
+        return {'__series__': {'name': value.name, 'dtype': str(value.dtype), 'index': encode_index(value.index),
+                               'data': value.astype(object).where(value.notna(), None).tolist()}}
+    if isinstance(value, dict):
+        return {str(key): encode_value(item) for key, item in value.items()}
+    if isinstance(value, tuple):
+        return {'__tuple__': [encode_value(item) for item in value]}
+    if isinstance(value, (list, np.ndarray)):
+        return [encode_value(item) for item in value]
+    return value
+
+
+# Function to encode the index (or the columns) of a DataFrame or Series (None for the default RangeIndex)
+def encode_index(index):
+    if isinstance(index, pd.RangeIndex) and index.start == 0 and index.step == 1 and index.name is None:
+        return None
+    return {'name': index.name, 'dtype': str(index.dtype), 'data': index.astype(object).tolist()}
+
+
+# Function to turn the values of encode_value back into DataFrames, Series and dicts
+def decode_value(value):
+    if isinstance(value, dict):
+        if '__frame__' in value:
+            frame = value['__frame__']
+            data = pd.DataFrame(frame['data'], columns=decode_index(frame['columns'], len(frame['dtypes'])),
+                                index=decode_index(frame['index'], len(frame['data'])))
+            for position, dtype in enumerate(frame['dtypes']):
+                data.isetitem(position, restore_dtype(data.iloc[:, position], dtype))
+            return data
+        if '__series__' in value:
+            series = value['__series__']
+            data = pd.Series(series['data'], index=decode_index(series['index'], len(series['data'])),
+                             name=series['name'], dtype=object)
+            return restore_dtype(data, series['dtype'])
+        if '__tuple__' in value:
+            return tuple(decode_value(item) for item in value['__tuple__'])
+        return {key: decode_value(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [decode_value(item) for item in value]
+    return value
+
+
+# Function to decode the index (or the columns) of a DataFrame or Series
+def decode_index(index, length):
+    if index is None:
+        return pd.RangeIndex(length)
+    return pd.Index(restore_dtype(pd.Series(index['data'], dtype=object), index['dtype']), name=index['name'])
+
+
+# Function to give a decoded column its dtype back (left as objects if the values do not fit it)
+def restore_dtype(column, dtype):
+    if dtype == 'object':
+        return column
+    try:
+        return column.astype(dtype)
+    except (TypeError, ValueError):
+        return column
+
+
+# Function to convert the numpy and pandas scalars json does not know
+def json_default(value):
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, pd.Timestamp):
+        return value.isoformat()
+    if value is pd.NA or value is pd.NaT:
+        return None
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+class AnalysisHandler(BaseHTTPRequestHandler):
+    analysis = None
+    tfidf_path = 'Downloads/tfidf_model'
+    started = 0.0
+    counter = itertools.count(1)
+    model_lock = threading.Lock()
+    protocol_version = 'HTTP/1.1'  # keep-alive, a client sends all its calls over one connection
+    disable_nagle_algorithm = True  # the headers and the body are written separately, do not hold the body back
+
+    def do_GET(self):
+        if self.path != '/health':
+            self._send_json({'error': f'Unknown path: {self.path}'}, status=404)
+            return
+        # The health checks are counted as requests too
+        self._send_json({'status': 'ok', 'uptime_s': time.time() - self.started, 'requests': next(self.counter),
+                         'table_versions': self.analysis.table_versions, 'cache': self.analysis.cache_info()})
+
+    def do_POST(self):
+        try:
+            request = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+            name, args, kwargs = request['name'], request.get('args', []), request.get('kwargs', {})
+        except (ValueError, KeyError, TypeError):
+            self._send_json({'error': 'Expected {"name": ..., "args": [...], "kwargs": {...}}.',
+                             'type': 'ValueError'}, status=400)
+            return
+        if self.path != '/call' or name not in METHODS + ATTRIBUTES + SERVICE_METHODS:
+            self._send_json({'error': f'Unknown query: {name!r}.', 'type': 'ValueError'}, status=404)
+            return
+
+        next(self.counter)
+        try:
+            if name in ATTRIBUTES:
+                result = getattr(self.analysis, name)
+            elif name in SERVICE_METHODS:
+                result = getattr(self, name)(*args, **kwargs)
+            else:
+                result = getattr(self.analysis, name)(*args, **kwargs)
+        except tuple(ERRORS.values()) as error:
+            message = error.args[0] if error.args else str(error)
+            self._send_json({'error': str(message), 'type': type(error).__name__}, status=400)
+            return
+        except Exception as error:
+            self._send_json({'error': f'{type(error).__name__}: {error}', 'type': 'RuntimeError'}, status=500)
+            return
+        self._send_json({'result': encode_value(result)})
+
+    def train_genre_model(self):
+        """Train and save the TF-IDF genre model with the served tables, unless it is saved already, and return its path."""
+        from MovieClassifier import TfidfGenreClassifier
+        with self.model_lock:  # the sessions of an app starting together ask for it at the same time
+            if not TfidfGenreClassifier.is_saved(self.tfidf_path):
+                TfidfGenreClassifier.train(self.analysis).save(self.tfidf_path)
+        return self.tfidf_path
+
+    def _send_json(self, body, status=200):
+        data = json.dumps(body, default=json_default).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass  # one line per query would drown the output of the service
+
+
+def start_service(analysis=None, port=0, tfidf_path='Downloads/tfidf_model', **analysis_options):
+    """
+    Start the service in a background thread and return (server, url). Stop it with server.shutdown().
+
+    Parameters:
+    -----------
+    analysis : MovieAnalysis, optional
+        The analysis to serve. By default one is created with analysis_options, loading its tables in the background.
+    port : int, optional (default=0)
+        Port on 127.0.0.1, 0 picks a free one.
+    tfidf_path : str, optional (default='Downloads/tfidf_model')
+        Directory of the TF-IDF genre model trained by train_genre_model.
+    """
+    if analysis is None:
+        from MovieAnalysis import MovieAnalysis
+        analysis = MovieAnalysis(**{'prefetch': True, **analysis_options})
+    handler = type('Handler', (AnalysisHandler,), {'analysis': analysis, 'tfidf_path': tfidf_path,
+                                                   'started': time.time(), 'counter': itertools.count(1),
+                                                   'model_lock': threading.Lock()})
+    server = ThreadingHTTPServer(('127.0.0.1', port), handler)
+    threading.Thread(target=server.serve_forever, name='MovieService', daemon=True).start()
+    return server, f'http://127.0.0.1:{server.server_address[1]}'
+
+
+class AnalysisClient:
+    """
+    Client of the analysis service, with the query methods and attributes of MovieAnalysis listed in METHODS and
+    ATTRIBUTES, and the SERVICE_METHODS. Every call is a request to the service, which answers from its warm tables
+    and result cache.
+    Every thread has its own connection, so the client can be shared like a MovieAnalysis.
+
+    Parameters:
+    -----------
+    url : str
+        URL of the service, e.g. 'http://127.0.0.1:8765'.
+    timeout : float, optional (default=300)
+        Timeout of a call, in seconds. The first calls can wait for the service to load its tables.
+    """
+
+    def __init__(self, url: str, timeout: float = 300):
+        parsed = urllib.parse.urlsplit(url)
+        if parsed.scheme != 'http' or not parsed.hostname:
+            raise ValueError(f"The service URL must be like 'http://127.0.0.1:8765', not {url!r}.")
+        self.url = url
+        self.host, self.port = parsed.hostname, parsed.port or 80
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def __getattr__(self, name):
+        if name in METHODS + SERVICE_METHODS:
+            return functools.partial(self.call, name)
+        if name in ATTRIBUTES:
+            return self.call(name)
+        raise AttributeError(f"'{type(self).__name__}' object has no attribute '{name}'")
+
+    def _request(self, method, path, body=None):
+        """Send a request over the connection of the thread and return (status, decoded JSON answer)."""
+        headers = {'Content-Type': 'application/json'} if body is not None else {}
+        # A kept-alive connection may have been closed by the service in between, it is opened again once
+        for attempt in range(2):
+            connection = getattr(self._local, 'connection', None)
+            if connection is None:
+                connection = self._local.connection = http.client.HTTPConnection(self.host, self.port,
+                                                                                  timeout=self.timeout)
+            try:
+                connection.request(method, path, body=body, headers=headers)
+                response = connection.getresponse()
+                return response.status, json.loads(response.read())
+            except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+                connection.close()
+                self._local.connection = None
+                if attempt == 1:
+                    raise
+
+    def call(self, name, *args, **kwargs):
+        """Run a query method (or read an attribute) of the served MovieAnalysis and return its result."""
+        with PROFILER.span(f'AnalysisClient.{name}', kind='service') as record:
+            body = json.dumps({'name': name, 'args': args, 'kwargs': kwargs}, default=json_default)
+            status, answer = self._request('POST', '/call', body.encode('utf-8'))
+            if status != 200:
+                raise ERRORS.get(answer.get('type'), RuntimeError)(answer.get('error'))
+            result = decode_value(answer['result'])
+            record['rows_out'] = row_count(result)
+        return result
+
+    def health(self):
+        """Return the status of the service: uptime, number of requests, table versions and result cache."""
+        status, answer = self._request('GET', '/health')
+        if status != 200:
+            raise RuntimeError(answer.get('error'))
+        return answer
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Serve one warm MovieAnalysis to the app and scripts.')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--config', default='config.json', help='Configuration with the "dataset" section to use.')
+    args = parser.parse_args()
+
+    with open(args.config, 'r') as file:
+        config = json.load(file)
+    server, url = start_service(port=args.port,
+                                tfidf_path=config.get('classifier', {}).get('tfidf_path', 'Downloads/tfidf_model'),
+                                **config.get('dataset', {}))
+    print(f'Movie analysis service listening on {url}')
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -0,0 +1,118 @@
+"""
+Local stand-in for the Ollama server, to run the classification code without a model.
+
+It answers POST /api/chat like Ollama does, with a deterministic comma-separated list of genres picked from the
+hash of the prompt, after an optional delay. Every n-th request can be made to fail with a 500 error to exercise
+the retries. Streamed requests get the answer word by word as JSON lines, like from Ollama, with an optional delay
+between the words to measure the time to the first token.
+
+Run it on its own and point the "host" of the "ollama" section of config.json to it:
+
+    python Testing/fake_ollama.py --port 11435 --delay 0.2 --token-delay 0.05
+
+or start it from Python with start_fake_ollama(), which returns the server and its URL.
+"""
+import argparse
+import hashlib
+import itertools
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+GENRES = ['Drama', 'Comedy', 'Romance Film', 'Thriller', 'Action', 'Crime Fiction', 'Horror', 'Indie',
+          'Science Fiction', 'Adventure', 'Family Film', 'Documentary']
+
+
+class FakeOllamaHandler(BaseHTTPRequestHandler):
+    delay = 0.0
+    token_delay = 0.0
+    fail_every = 0
+    counter = itertools.count(1)
+
+    def do_POST(self):
+        if self.path != '/api/chat':
+            self.send_error(404)
+            return
+        request = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))))
+
+        if self.fail_every and next(self.counter) % self.fail_every == 0:
+            self._send_json({'error': 'simulated failure'}, status=500)
+            return
+
+        time.sleep(self.delay)
+        prompt = json.dumps(request.get('messages', []), sort_keys=True)
+        digest = hashlib.sha256(prompt.encode('utf-8')).digest()
+        genres = [GENRES[byte % len(GENRES)] for byte in digest[:1 + digest[-1] % 3]]
+        content = ', '.join(dict.fromkeys(genres))
+
+        final = {
+            'model': request.get('model'),
+            'created_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+            'message': {'role': 'assistant', 'content': content},
+            'done': True,
+            'done_reason': 'stop',
+            'prompt_eval_count': len(prompt.split()),
+            'eval_count': len(content.split()),
+        }
+        # Ollama streams unless the request says otherwise
+        if request.get('stream', True):
+            self._send_stream(final)
+        else:
+            time.sleep(self.token_delay * len(content.split(' ')))  # the model still generates every word
+            self._send_json(final)
+
+    def _send_stream(self, final):
+        """Send the answer one word per JSON line, the last line with an empty message and the token counts."""
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/x-ndjson')
+        self.end_headers()  # no Content-Length, the end of the answer is the end of the connection
+        words = final['message']['content'].split(' ')
+        try:
+            for position, word in enumerate(words):
+                time.sleep(self.token_delay)
+                chunk = {'model': final['model'], 'created_at': final['created_at'], 'done': False,
+                         'message': {'role': 'assistant', 'content': word if position == 0 else ' ' + word}}
+                self.wfile.write(json.dumps(chunk).encode('utf-8') + b'\n')
+                self.wfile.flush()
+            self.wfile.write(json.dumps({**final, 'message': {'role': 'assistant', 'content': ''}}).encode('utf-8')
+                             + b'\n')
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # the client cancelled the request
+
+    def _send_json(self, body, status=200):
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass  # keep the output of the benchmarks clean
+
+
+def start_fake_ollama(port=0, delay=0.0, fail_every=0, token_delay=0.0):
+    """Start the fake server in a background thread and return (server, url). Stop it with server.shutdown()."""
+    handler = type('Handler', (FakeOllamaHandler,), {'delay': delay, 'fail_every': fail_every,
+                                                     'token_delay': token_delay, 'counter': itertools.count(1)})
+    server = ThreadingHTTPServer(('127.0.0.1', port), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f'http://127.0.0.1:{server.server_address[1]}'
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Local stand-in for the Ollama server.')
+    parser.add_argument('--port', type=int, default=11435)
+    parser.add_argument('--delay', type=float, default=0.0, help='Seconds to wait before answering.')
+    parser.add_argument('--fail-every', type=int, default=0, help='Answer every n-th request with a 500 error.')
+    parser.add_argument('--token-delay', type=float, default=0.0,
+                        help='Seconds to wait before every word of a streamed answer.')
+    args = parser.parse_args()
+
+    server, url = start_fake_ollama(args.port, args.delay, args.fail_every, args.token_delay)
+    print(f'Fake Ollama listening on {url}')
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -0,0 +1,268 @@
+"""
+Generator of synthetic CMU Movie Summary corpora, to test and benchmark the analysis at any scale.
+
+The files have the exact layout of the real ones (same names, columns and value formats) and reproduce their
+quirks: Freebase dictionaries stored as JSON strings (with escaped non-ASCII names), release and birth dates
+given as a year, a year and month or a full date, heights in centimeters (180 and 510) among heights in
+meters, the tvtropes characters stored as JSON dictionaries, empty fields and plot summaries of movies that
+have no metadata. Row counts and the share of missing values follow the real corpus, times the scale.
+
+Generate a corpus ten times the size of the real one, where MovieAnalysis expects it when run from that root:
+
+    python Testing/synthetic_corpus.py --scale 10 --out Downloads/synthetic-x10/Downloads/MovieSummaries
+
+or from Python with generate_corpus(path, scale, seed).
+"""
+import argparse
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+# Rows of the real corpus (scale 1)
+MOVIES = 81741
+CHARACTERS_PER_MOVIE = 5.51  # 450,669 characters
+ACTORS_PER_MOVIE = 1.65  # 134,907 distinct actors
+SUMMARY_SHARE = 0.517  # 42,306 plot summaries
+ORPHAN_SUMMARY_SHARE = 0.0023  # summaries of movies that are not in the metadata
+TVTROPES = 501
+NAME_CLUSTERS = 2666
+
+# Labels of the Freebase dictionaries, most frequent first
+GENRES = ['Drama', 'Comedy', 'Romance Film', 'Black-and-white', 'Action', 'Thriller', 'Short Film',
+          'World cinema', 'Crime Fiction', 'Indie', 'Documentary', 'Horror', 'Silent film', 'Adventure',
+          'Family Film', 'Action/Adventure', 'Comedy film', 'Musical', 'Animation', 'Romantic drama', 'Mystery',
+          'Science Fiction', 'Fantasy', 'Romantic comedy', 'War film', 'Japanese Movies', 'Western',
+          'Crime Thriller', 'Period piece', 'Film adaptation', 'Film à clef', 'Bollywood', 'Psychological thriller',
+          'Teen', 'Biography', 'Sports', 'Comedy-drama', 'Music', 'Political drama', 'Sci-Fi Horror']
+GENRES += [f'Genre {number}' for number in range(len(GENRES), 363)]
+LANGUAGES = ['English Language', 'Hindi Language', 'Spanish Language', 'French Language', 'Silent film',
+             'Italian Language', 'Japanese Language', 'German Language', 'Tamil Language', 'Malayalam Language',
+             'Mandarin Chinese', 'Telugu language', 'Russian Language', 'Cantonese', 'Korean Language',
+             'Português Language', 'Standard Mandarin', 'Swedish Language', 'Bengali Language', 'Turkish Language']
+LANGUAGES += [f'Language {number}' for number in range(len(LANGUAGES), 210)]
+COUNTRIES = ['United States of America', 'India', 'United Kingdom', 'France', 'Italy', 'Japan', 'Canada',
+             'Argentina', 'Germany', 'Hong Kong', 'South Korea', 'Spain', 'Australia', 'Mexico', 'Sweden',
+             'Netherlands', 'Philippines', 'China', 'Denmark', 'Brazil', 'Côte d’Ivoire']
+COUNTRIES += [f'Country {number}' for number in range(len(COUNTRIES), 147)]
+TROPES = ['absent_minded_professor', 'adventurer_archaeologist', 'arrogant_kungfu_guy', 'big_man_on_campus',
+          'bounty_hunter', 'brainless_beauty', 'broken_bird', 'bromantic_foil', 'chanteuse', 'charmer',
+          'chief_knight', 'classy_cat_burglar', 'coach', 'corrupt_corporate_executive', 'crazy_jealous_guy',
+          'dean_bitterman', 'dirty_cop', 'dumb_muscle', 'eccentric_mentor', 'evil_prince', 'final_girl',
+          'gentleman_thief', 'grumpy_old_man', 'hardboiled_detective', 'heartbroken_badass', 'hitman_with_a_heart',
+          'jerk_jock', 'junkie_prophet', 'klutz', 'loveable_rogue', 'mentor', 'morally_bankrupt_banker',
+          'ophelia', 'pupil_turned_to_evil', 'prima_donna', 'revenge', 'romantic_runnerup', 'stupid_crooks',
+          'surfer_dude', 'tranquil_fury', 'trickster', 'valley_girl', 'warrior_poet', 'young_gun', 'father_to_his_men']
+WORDS = ('the a and of to in his her he she is with by that for as on their who when after but him from they '
+         'be at an one has are film story man woman life love young father mother family friends house town '
+         'city war police money night death murder killer secret school wife husband daughter son brother '
+         'sister girl boy king army ship world escape plan help finds tries becomes meets returns later home '
+         'old new time back away years day team group gang boss village island prison crew child lives '
+         'marriage wedding revenge dream power village soldier hospital doctor detective agent case truth').split()
+
+
+# Function to encode integers as Freebase-like IDs, e.g. /m/0x3k2
+def freebase_ids(numbers, prefix='/m/0'):
+    digits = np.array(list('0123456789bcdfghjklmnpqrstvwxyz_'))
+    numbers = np.asarray(numbers, dtype=np.int64)
+    ids = pd.Series(prefix, index=range(len(numbers)), dtype=object)
+    width = max(int(np.ceil(np.log(max(numbers.max(initial=1), 1) + 1) / np.log(len(digits)))), 1)
+    for position in reversed(range(width)):
+        ids += digits[(numbers // len(digits) ** position) % len(digits)]
+    return ids.to_numpy()
+
+
+# Function to draw labels with a Zipf-like frequency (the first ones are the most common)
+def zipf_choice(rng, count, size, exponent=1.1):
+    weights = 1 / np.arange(1, count + 1) ** exponent
+    return rng.choice(count, size=size, p=weights / weights.sum())
+
+
+# Function to build Freebase dictionary strings, e.g. {"/m/07s9rl0": "Drama", "/m/01z4y": "Comedy"}
+# Every row gets between 0 and max_labels distinct labels, as a JSON string with escaped non-ASCII characters.
+def freebase_dicts(rng, labels, ids, rows, mean_labels, max_labels):
+    entries = np.array([json.dumps({label_id: label})[1:-1] for label_id, label in zip(ids, labels)], dtype=object)
+    counts = np.minimum(rng.poisson(mean_labels, rows), max_labels)
+    picks = zipf_choice(rng, len(labels), counts.sum())
+    starts = np.concatenate([[0], np.cumsum(counts)])
+    return np.array(['{' + ', '.join(entries[np.unique(picks[start:stop])]) + '}'
+                     for start, stop in zip(starts[:-1], starts[1:])], dtype=object)
+
+
+# Function to draw dates with the mixed granularities of the corpus (year, year-month or full date)
+# shares are the proportions of (year only, year-month, full date), the rest is left empty.
+def mixed_dates(rng, years, shares):
+    rows = len(years)
+    months = rng.integers(1, 13, rows)
+    days = rng.integers(1, 29, rows)
+    kind = rng.random(rows)
+    year_text = pd.Series(years).astype(str)
+    month_text = year_text + '-' + pd.Series(months).map('{:02d}'.format)
+    full_text = month_text + '-' + pd.Series(days).map('{:02d}'.format)
+    cut_year, cut_month, cut_full = np.cumsum(shares)
+    return np.select([kind < cut_year, kind < cut_month, kind < cut_full],
+                     [year_text, month_text, full_text], default='').astype(object)
+
+
+# Function to blank out a share of the values of a column
+def with_missing(rng, values, share):
+    values = np.asarray(values, dtype=object)
+    values[rng.random(len(values)) < share] = ''
+    return values
+
+
+# Function to write rows to a TSV file the way the corpus does (no header, no quoting)
+def write_tsv(path, columns, mode):
+    pd.DataFrame(columns).to_csv(path, sep='\t', header=False, index=False, mode=mode, quoting=3,
+                                 escapechar=None, lineterminator='\n')
+
+
+def generate_chunk(rng, first_movie, movies, actors):
+    """
+    Generate the metadata, characters and summaries of the movies first_movie to first_movie + movies, cast from
+    a pool of actors (a few of them play in many movies, most in a handful).
+    """
+    numbers = np.arange(first_movie, first_movie + movies)
+    wikipedia_ids = numbers * 3 + rng.integers(0, 3, movies) + 330
+    freebase_movie_ids = freebase_ids(numbers * 7 + 11, '/m/0')
+    release_years = np.clip(rng.normal(1985, 24, movies).astype(int), 1888, 2016)
+    release_dates = mixed_dates(rng, release_years, (0.45, 0.03, 0.44))
+
+    movie_rows = {
+        'Wikipedia movie ID': wikipedia_ids,
+        'Freebase movie ID': freebase_movie_ids,
+        'Movie name': np.char.add('Movie ', numbers.astype(str)),
+        'Movie release date': release_dates,
+        'Movie box office revenue': with_missing(rng, rng.lognormal(16, 2, movies).astype(np.int64), 0.9),
+        'Movie runtime': with_missing(rng, np.round(rng.gamma(9, 10, movies), 1), 0.25),
+        'Movie languages': freebase_dicts(rng, LANGUAGES, freebase_ids(np.arange(len(LANGUAGES)) + 500, '/m/02'),
+                                          movies, 1.1, 6),
+        'Movie countries': freebase_dicts(rng, COUNTRIES, freebase_ids(np.arange(len(COUNTRIES)) + 900, '/m/03'),
+                                          movies, 1.0, 5),
+        'Movie genres': freebase_dicts(rng, GENRES, freebase_ids(np.arange(len(GENRES)) + 100, '/m/01'),
+                                       movies, 3.0, 12),
+    }
+
+    # Characters, a variable number per movie (about a third of the movies have none)
+    per_movie = rng.poisson(CHARACTERS_PER_MOVIE / 0.79, movies) * (rng.random(movies) < 0.79)
+    movie_rows_of_characters = np.repeat(np.arange(movies), per_movie)
+    characters = len(movie_rows_of_characters)
+    character_numbers = first_movie * 20 + np.arange(characters)
+    actor_numbers = (actors * rng.random(characters) ** 2.5).astype(np.int64)
+    birth_years = np.clip(release_years[movie_rows_of_characters] - rng.normal(38, 13, characters).astype(int),
+                          1850, 2012)
+    heights = np.round(rng.normal(1.75, 0.1, characters), 3).astype(object)
+    heights[rng.random(characters) < 0.0001] = 180  # heights in centimeters, among the ones in meters
+    heights[rng.random(characters) < 0.0001] = 510
+    genders = rng.choice(np.array(['M', 'F'], dtype=object), characters, p=[0.66, 0.34])
+
+    character_rows = {
+        'Wikipedia movie ID': wikipedia_ids[movie_rows_of_characters],
+        'Freebase movie ID': freebase_movie_ids[movie_rows_of_characters],
+        'Movie release date': release_dates[movie_rows_of_characters],
+        'Character name': with_missing(rng, np.char.add('Character ', character_numbers.astype(str)), 0.57),
+        'Actor date of birth': mixed_dates(rng, birth_years, (0.08, 0.01, 0.67)),
+        'Actor gender': with_missing(rng, genders, 0.1),
+        'Actor height': with_missing(rng, heights, 0.65),
+        'Actor ethnicity': with_missing(rng, freebase_ids(zipf_choice(rng, 480, characters) + 2000, '/m/0x'), 0.76),
+        'Actor name': np.char.add('Actor ', actor_numbers.astype(str)),
+        'Actor age at movie release': with_missing(rng, release_years[movie_rows_of_characters] - birth_years, 0.35),
+        'Freebase character/actor map ID': freebase_ids(character_numbers * 5 + 3, '/m/0j'),
+        'Freebase character ID': with_missing(rng, freebase_ids(character_numbers * 5 + 1, '/m/0c'), 0.57),
+        'Freebase actor ID': with_missing(rng, freebase_ids(actor_numbers * 3 + 2, '/m/0a'), 0.002),
+    }
+
+    # Plot summaries of about half the movies, plus a few of movies that have no metadata
+    described = np.flatnonzero(rng.random(movies) < SUMMARY_SHARE)
+    orphans = rng.choice(numbers, int(rng.binomial(movies, ORPHAN_SUMMARY_SHARE)), replace=False) * 3 + 10 ** 9
+    summary_ids = np.concatenate([wikipedia_ids[described], orphans])
+    lengths = np.maximum(rng.gamma(2.2, 130, len(summary_ids)).astype(int), 8)
+    words = np.array(WORDS, dtype=object)[zipf_choice(rng, len(WORDS), lengths.sum(), 0.9)]
+    bounds = np.concatenate([[0], np.cumsum(lengths)])
+    summaries = [' '.join(words[start:stop]).capitalize() + '.' for start, stop in zip(bounds[:-1], bounds[1:])]
+
+    return movie_rows, character_rows, {'Wikipedia movie ID': summary_ids, 'Plot summary': summaries}
+
+
+def generate_corpus(path='Downloads/MovieSummaries', scale: float = 1.0, seed: int = 0,
+                    chunk_movies: int = 100_000):
+    """
+    Write a synthetic corpus of scale times the size of the real one into path, ending with the '.complete' marker
+    MovieAnalysis checks for.
+
+    Parameters:
+    -----------
+    path : str, optional (default='Downloads/MovieSummaries')
+        Directory of the corpus files.
+    scale : float, optional (default=1.0)
+        Size relative to the real corpus (81,741 movies, about 450,000 characters).
+    seed : int, optional (default=0)
+        Seed of the random generator, the same seed and scale always give the same files.
+    chunk_movies : int, optional (default=100,000)
+        Movies generated and written at once, which bounds the memory used at large scales.
+
+    Returns:
+    --------
+    dict: number of rows written to every file.
+    """
+    if scale <= 0:
+        raise ValueError("scale must be positive.")
+    os.makedirs(path, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    total_movies = max(int(MOVIES * scale), 1)
+    actors = max(int(total_movies * ACTORS_PER_MOVIE), 1)
+    rows = {'movie.metadata.tsv': 0, 'character.metadata.tsv': 0, 'plot_summaries.txt': 0}
+    map_ids = []
+
+    for first_movie in range(0, total_movies, chunk_movies):
+        mode = 'w' if first_movie == 0 else 'a'
+        movie_rows, character_rows, summary_rows = generate_chunk(
+            rng, first_movie, min(chunk_movies, total_movies - first_movie), actors)
+        for file_name, columns in [('movie.metadata.tsv', movie_rows), ('character.metadata.tsv', character_rows),
+                                   ('plot_summaries.txt', summary_rows)]:
+            write_tsv(os.path.join(path, file_name), columns, mode)
+            rows[file_name] += len(next(iter(columns.values())))
+
+        # Characters the cluster files can refer to
+        picks = rng.random(len(character_rows['Character name'])) < 0.02
+        map_ids.append(pd.DataFrame({key: character_rows[key][picks] for key in
+                                     ['Freebase character/actor map ID', 'Character name', 'Actor name',
+                                      'Movie release date']}))
+
+    # tvtropes clusters: the character is a JSON dictionary whose 'id' is the character/actor map ID
+    characters = pd.concat(map_ids, ignore_index=True)
+    tropes = characters.sample(min(max(int(TVTROPES * scale), 1), len(characters)), random_state=seed)
+    write_tsv(os.path.join(path, 'tvtropes.clusters.txt'), {
+        'Character type': np.array(TROPES, dtype=object)[rng.integers(0, len(TROPES), len(tropes))],
+        'Character': [json.dumps({'char': name or 'Unnamed', 'movie': 'Movie', 'id': map_id, 'actor': actor})
+                      for map_id, name, actor in zip(tropes['Freebase character/actor map ID'],
+                                                     tropes['Character name'], tropes['Actor name'])],
+    }, 'w')
+    rows['tvtropes.clusters.txt'] = len(tropes)
+
+    # Name clusters: a character name and the map ID of a character of that name
+    named = characters[characters['Character name'] != '']
+    names = named.sample(min(max(int(NAME_CLUSTERS * scale), 1), len(named)), random_state=seed)
+    write_tsv(os.path.join(path, 'name.clusters.txt'), {
+        'Character name': names['Character name'].to_numpy(),
+        'Freebase character/actor map ID': names['Freebase character/actor map ID'].to_numpy(),
+    }, 'w')
+    rows['name.clusters.txt'] = len(names)
+
+    # Written last, MovieAnalysis only uses a corpus directory with this marker
+    with open(os.path.join(path, '.complete'), 'w') as file:
+        file.write(f'synthetic x{scale:g} seed {seed}\n')
+    return rows
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--scale', type=float, default=1.0, help='Size relative to the real corpus.')
+    parser.add_argument('--seed', type=int, default=0, help='Seed of the random generator.')
+    parser.add_argument('--out', default='Downloads/synthetic/Downloads/MovieSummaries',
+                        help='Directory of the corpus files.')
+    args = parser.parse_args()
+
+    for file_name, count in generate_corpus(args.out, args.scale, args.seed).items():
+        print(f'{file_name}: {count} rows')